@@ -0,0 +1,270 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from df_comparison import process_json_results
+
+ONTOLOGIES = ['CLO', 'CL', 'UBERON', 'BTO']
+EXPERT_PATTERN = 'human_expert_annotations/expert_annotation_*.csv'
+MODEL_PATTERN = '../results/results_*.json'
+REFERENCE_PATH = '../finetuning_process/mappings_test.csv'
+MISSING = -1  # label not annotated by an annotator
+
+
+def load_expert(path: str) -> pd.DataFrame:
+    """
+    Load an expert annotation file (Label;Type;CLO_M;CL_M;UBERON_M;BTO_M).
+
+    Returns:
+        pd.DataFrame: One column per ontology, indexed by label.
+    """
+    df = pd.read_csv(path, sep=";", header=0, dtype=str)
+    df = df.rename(columns={f'{ontology}_M': ontology for ontology in ONTOLOGIES})
+    return df.drop_duplicates('Label').set_index('Label')[ONTOLOGIES]
+
+
+def load_model(path: str) -> pd.DataFrame:
+    """
+    Load the results JSON of a model (see df_comparison.process_json_results).
+
+    Returns:
+        pd.DataFrame: One column per ontology, indexed by label.
+    """
+    df = process_json_results(path)
+    df = df.rename(columns={f'{ontology}_M': ontology for ontology in ONTOLOGIES})
+    return df.drop_duplicates('Label').set_index('Label')[ONTOLOGIES]
+
+
+def load_reference(path: str) -> pd.DataFrame:
+    """
+    Load the reference mappings (Label, CLO, CL, UBERON, BTO, Type).
+
+    Returns:
+        pd.DataFrame: One column per ontology, indexed by label.
+    """
+    df = pd.read_csv(path, header=0, dtype=str)
+    df.columns = ['Label'] + ONTOLOGIES + ['Type']
+    return df.drop_duplicates('Label').set_index('Label')[ONTOLOGIES]
+
+
+def load_annotators(
+    sources: Dict[str, Tuple[str, str]],
+    max_workers: Optional[int] = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Load the files of all the annotators concurrently.
+
+    Args:
+        sources (Dict[str, Tuple[str, str]]): Annotator name -> (kind, path), where
+            kind is 'expert', 'model' or 'reference'.
+        max_workers (Optional[int]): Number of threads.
+
+    Returns:
+        Dict[str, pd.DataFrame]: Annotations of each annotator, in the same order.
+    """
+    loaders = {'expert': load_expert, 'model': load_model, 'reference': load_reference}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(loaders[kind], path) for name, (kind, path) in sources.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def align(
+    annotations: Dict[str, pd.DataFrame],
+    labels: Optional[List[str]] = None
+) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, int]]:
+    """
+    Align all the annotators on the label once and encode their values as integer
+    codes shared by all of them.
+
+    Args:
+        annotations (Dict[str, pd.DataFrame]): Annotations of each annotator.
+        labels (Optional[List[str]]): Labels to compare; by default, those annotated
+            by at least two annotators.
+
+    Returns:
+        Tuple: The labels, an (annotators x labels) code matrix per ontology
+        (MISSING where an annotator did not annotate the label) and the code of
+        '-' in each ontology (-2 if nobody used it).
+    """
+    if labels is None:
+        counts = pd.concat([pd.Series(1, index=df.index.unique()) for df in annotations.values()])
+        counts = counts.groupby(level=0, sort=False).sum()
+        labels = counts.index[counts >= 2].tolist()
+    label_index = pd.Index(labels)
+    codes, dash_codes = {}, {}
+    for ontology in ONTOLOGIES:
+        columns = [df[ontology].reindex(label_index) for df in annotations.values()]
+        present = np.array([column.notna().to_numpy() for column in columns])
+        values = np.concatenate([column.fillna('unknown').to_numpy() for column in columns])
+        factorized, uniques = pd.factorize(values)
+        matrix = factorized.reshape(len(columns), len(label_index)).astype(np.int32)
+        matrix[~present] = MISSING
+        codes[ontology] = matrix
+        dash = np.flatnonzero(uniques == '-')
+        dash_codes[ontology] = int(dash[0]) if len(dash) else -2
+    return labels, codes, dash_codes
+
+
+def pairwise_kappa(codes: np.ndarray) -> np.ndarray:
+    """
+    Cohen's kappa of every pair of annotators, on the labels both annotated.
+
+    Args:
+        codes (np.ndarray): (annotators x labels) code matrix of an ontology.
+
+    Returns:
+        np.ndarray: Symmetric (annotators x annotators) matrix, NaN where undefined.
+    """
+    n_annotators = len(codes)
+    n_categories = int(codes.max()) + 1 if codes.size else 0
+    kappa = np.full((n_annotators, n_annotators), np.nan)
+    for a in range(n_annotators):
+        for b in range(a, n_annotators):
+            both = (codes[a] != MISSING) & (codes[b] != MISSING)
+            n = both.sum()
+            if n == 0:
+                continue
+            observed = np.mean(codes[a][both] == codes[b][both])
+            expected = np.dot(np.bincount(codes[a][both], minlength=n_categories),
+                              np.bincount(codes[b][both], minlength=n_categories)) / n ** 2
+            if expected < 1:
+                kappa[a, b] = kappa[b, a] = (observed - expected) / (1 - expected)
+    return kappa
+
+
+def fleiss_kappa(codes: np.ndarray) -> Optional[float]:
+    """
+    Fleiss' kappa of all the annotators, on the labels every annotator annotated.
+
+    Args:
+        codes (np.ndarray): (annotators x labels) code matrix of an ontology.
+
+    Returns:
+        Optional[float]: Fleiss' kappa, None if undefined.
+    """
+    complete = codes[:, (codes != MISSING).all(axis=0)]
+    n_raters, n_items = complete.shape
+    if n_raters < 2 or n_items == 0:
+        return None
+    items = np.broadcast_to(np.arange(n_items), complete.shape).ravel()
+    pairs, counts = np.unique(np.stack([items, complete.ravel()]), axis=1, return_counts=True)
+    agreement = np.bincount(pairs[0], weights=counts * (counts - 1), minlength=n_items) / (n_raters * (n_raters - 1))
+    proportions = np.bincount(complete.ravel()) / complete.size
+    expected = np.sum(proportions ** 2)
+    if expected >= 1:
+        return None
+    return float((agreement.mean() - expected) / (1 - expected))
+
+
+def precision_matrix(codes: np.ndarray, dash_code: int) -> np.ndarray:
+    """
+    Precision of every pair of annotators (see models_comparison.get_accuracy):
+    the share of matching values on the labels both annotated, leaving out those
+    where both put '-'.
+
+    Args:
+        codes (np.ndarray): (annotators x labels) code matrix of an ontology.
+        dash_code (int): Code of '-'.
+
+    Returns:
+        np.ndarray: (annotators x annotators) matrix, NaN where undefined.
+    """
+    present = codes != MISSING
+    both = present[:, None, :] & present[None, :, :]
+    counted = both & ~((codes == dash_code)[:, None, :] & (codes == dash_code)[None, :, :])
+    matches = (codes[:, None, :] == codes[None, :, :]) & counted
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return matches.sum(axis=2) / counted.sum(axis=2)
+
+
+def _ontology_metrics(codes: np.ndarray, dash_code: int) -> Tuple[np.ndarray, Optional[float], np.ndarray]:
+    """
+    Compute all the metrics of an ontology, in a worker process.
+    """
+    return pairwise_kappa(codes), fleiss_kappa(codes), precision_matrix(codes, dash_code)
+
+
+def agreement_matrices(
+    annotations: Dict[str, pd.DataFrame],
+    labels: Optional[List[str]] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, Dict[str, object]]:
+    """
+    Compute pairwise Cohen's kappa, Fleiss' kappa and precision matrices of all
+    the annotators, one ontology per worker process.
+
+    Args:
+        annotations (Dict[str, pd.DataFrame]): Annotations of each annotator.
+        labels (Optional[List[str]]): Labels to compare (see align).
+        max_workers (Optional[int]): Number of processes.
+
+    Returns:
+        Dict[str, Dict[str, object]]: For each ontology, 'cohen_kappa' and
+        'precision' DataFrames (annotators x annotators) and 'fleiss_kappa'.
+    """
+    names = list(annotations)
+    labels, codes, dash_codes = align(annotations, labels)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        metrics = executor.map(_ontology_metrics, [codes[ontology] for ontology in ONTOLOGIES],
+                               [dash_codes[ontology] for ontology in ONTOLOGIES])
+        return {
+            ontology: {
+                'cohen_kappa': pd.DataFrame(kappa, index=names, columns=names),
+                'fleiss_kappa': fleiss,
+                'precision': pd.DataFrame(precision, index=names, columns=names),
+            }
+            for ontology, (kappa, fleiss, precision) in zip(ONTOLOGIES, metrics)
+        }
+
+
+def discover(patterns: List[str], kind: str) -> Dict[str, Tuple[str, str]]:
+    """
+    Find the files of the annotators of one kind, named after their file.
+
+    Args:
+        patterns (List[str]): Glob patterns of the files.
+        kind (str): 'expert' or 'model'.
+
+    Returns:
+        Dict[str, Tuple[str, str]]: Annotator name -> (kind, path).
+    """
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    return {os.path.splitext(os.path.basename(path))[0]: (kind, path) for path in paths}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agreement between the experts, the models and the reference mappings.")
+    parser.add_argument('--experts', nargs='+', default=[EXPERT_PATTERN],
+                        help="glob patterns of the expert annotation files (default: %(default)s)")
+    parser.add_argument('--models', nargs='*', default=[MODEL_PATTERN],
+                        help="glob patterns of the results files of the models (default: %(default)s)")
+    args = parser.parse_args()
+
+    # Every expert file, the models and the reference mappings
+    sources = discover(args.experts, 'expert')
+    sources.update(discover(args.models, 'model'))
+    sources['Reference'] = ('reference', REFERENCE_PATH)
+
+    annotations = load_annotators(sources)
+    # Only the labels annotated by the experts are compared
+    expert_labels = pd.concat([annotations[name].index.to_series() for name, (kind, _) in sources.items()
+                               if kind == 'expert']).unique().tolist()
+    results = agreement_matrices(annotations, labels=expert_labels)
+
+    for ontology, metrics in results.items():
+        print(f"\nOntology: {ontology}  (Fleiss' kappa: {metrics['fleiss_kappa']})")
+        print("Cohen's kappa:")
+        print(metrics['cohen_kappa'].round(3))
+        print("Precision:")
+        print(metrics['precision'].round(3))
+        metrics['cohen_kappa'].to_csv(f'results/cohen_kappa_{ontology}.csv')
+        metrics['precision'].to_csv(f'results/precision_{ontology}.csv')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
-import requests #send HTTP requests
 import json #use json data
-from dotenv import dotenv_values
+import os #interact with the operating system
+import sys
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')) #shared modules
+import bioportal #pooled BioPortal client
+import label_cache #persistent class name cache
+
+bioportal.configure(dotenv_path="../.env")
+
 def load_data(data_path):
     """
     Load the CSV file into a DataFrame.
@@ -11,14 +17,6 @@ def load_data(data_path):
     """
     return pd.read_csv(data_path, sep=",", header=0)
 
-def load_environment():
-    """
-    Load environment variables.
-    :return: The OPENAI API key.
-    """
-    config = dotenv_values(dotenv_path="../.env")
-    return config.get('BIOPORTAL_API_KEY')
-
 def group_and_return_dfs(df):
     """
     Group the dataframe by the 'Type' column and create a dictionary with a dataframe for each group.
@@ -36,7 +34,7 @@ def group_and_return_dfs(df):
 
 def get_class_name(ontology_acronym,class_id):
     """
-     Retrieve the class name from BioPortal API for a given class identifier.
+     Retrieve the class name for a given class identifier, from the persistent cache or the BioPortal API.
 
      Parameters:
          ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
@@ -45,25 +43,12 @@ def get_class_name(ontology_acronym,class_id):
      Returns:
          str: The name of the class if found, or None if the request fails.
      """
-    url = f'http://data.bioontology.org/ontologies/{ontology_acronym}/classes/{class_id}'
-    api_key = load_environment()
-    headers = {
-        'Authorization': f'apikey token={api_key}',
-        'Accept': 'application/json'
-    }
-
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        class_name = data.get('prefLabel')  # or another key based on the structure
-        print("Class Name:", class_name)
-        return class_name
-    else:
-        print("Failed to retrieve data:", response.status_code, class_id)
+    return label_cache.get_class_names([(ontology_acronym, class_id)])[0]
 
 def get_classes(df):
     """
     Retrieve class names for each identifier in the dataframe, based on ontology acronyms.
+    Each unique identifier is resolved once (persistent cache or BioPortal) and then mapped to every cell.
 
     Parameters:
         df (dict): Dictionary where keys are labels, and values are lists of identifiers.
@@ -71,24 +56,14 @@ def get_classes(df):
     Returns:
         dict: Dictionary where keys are labels, and values are lists of class names.
     """
+    labels = list(df.keys())
+    lengths = [len(identifiers) for identifiers in df.values()]
+    class_names = label_cache.resolve_identifiers(element for identifiers in df.values() for element in identifiers).tolist()
     dicc_clases={}
-    for label,identifiers in df.items():      
-        for element in identifiers:
-            element_formatted=element.replace("_",":") #change underscore for a colon
-            if element_formatted.startswith("CL:"):
-                class_name=get_class_name("CL",element_formatted)
-            elif element_formatted.startswith("CLO:"):
-                class_name=get_class_name("CLO",element_formatted)
-            elif element_formatted.startswith("UBERON:"):
-                class_name=get_class_name("UBERON",element_formatted)
-            elif element_formatted.startswith("BTO:"):
-                class_name=get_class_name("BTO",element_formatted)
-            else:
-                class_name="-"
-            if label in dicc_clases:
-                dicc_clases[label].append(class_name)
-            else:
-                dicc_clases[label]=[class_name]
+    start = 0
+    for label, length in zip(labels, lengths):
+        dicc_clases[label] = class_names[start:start + length]
+        start += length
     return dicc_clases
 
 def df_to_dicc(df):
@@ -101,27 +76,26 @@ def df_to_dicc(df):
     Returns:
         dict: Dictionary with labels as keys and lists of identifiers as values.
     """
-    dicc={}
-    for index,row in df.iterrows():
-        label = row['Label']
-        identifiers = row[2:].tolist()
-        dicc[label]=identifiers
-    return dicc
-
-def get_class_names(df,type):
+    return dict(zip(df['Label'], df.iloc[:, 2:].values.tolist()))
+
+def get_class_names(df,type,dicc_clases=None):
     """
     Get class names from identifiers in the dataframe and save them in JSON format.
 
     Parameters:
         df (pd.DataFrame): The input dataframe.
         type (str): A string used for the JSON file name to specify the type of data.
+        dicc_clases (dict): Class names already resolved, with (type, label) keys (see main). If None, they are resolved here.
 
     Returns:
         None: Writes output to a JSON file.
     """
     dicc_df = df_to_dicc(df)
     print(dicc_df)
-    dicc_clases = get_classes(dicc_df)
+    if dicc_clases is None:
+        dicc_clases = get_classes(dicc_df)
+    else:
+        dicc_clases = {label: dicc_clases[(type, label)] for label in dicc_df}
     file_name = f'classnames_{type}.json'
     with open(file_name, 'w') as json_file:
         json.dump(dicc_clases, json_file, indent=4)
@@ -134,9 +108,12 @@ df_CT = dfs['CT']  # DataFrame where Type is 'CT'
 df_A = dfs['A']    # DataFrame where Type is 'A'
 
 def main():
-     get_class_names(df_A,'A')
-     get_class_names(df_CL,'CL')
-     get_class_names(df_CT,'CT')
+     dfs_by_type = {'A': df_A, 'CL': df_CL, 'CT': df_CT}
+     dicc_clases = get_classes({(type, label): identifiers for type, df in dfs_by_type.items()
+                                for label, identifiers in df_to_dicc(df).items()}) #every identifier is resolved once for all types
+     for type, df in dfs_by_type.items():
+         get_class_names(df,type,dicc_clases)
+     label_cache.report()
 
 if __name__ == "__main__":
     main()
@@ -84,17 +84,35 @@ def get_df_comparison_from_csv(path_csv, mappings_test):
     return df_comparison
 
 
-mappings_test = read_csv('../finetuning_process/mappings_test.csv',header=0)
+REFERENCE_PATH = '../finetuning_process/mappings_test.csv'
+EXPERT_PATH = 'human_expert_annotations/expert_annotation_1.csv'
+MODEL_PATH = '../results/results_ft_4o_mini.json'
+_frames = {}
 
-df_comparison_expert_1= get_df_comparison_from_csv('human_expert_annotations/expert_annotation_1.csv', mappings_test)
+def __getattr__(name):
+    """
+    Build the module-level frames (mappings_test, df_comparison_expert_1, df_comparison_ft_gpt4o_mini and
+    filtered_samples, the 50 samples used for the comparison) on first access instead of at import, so
+    importing a function of this module does not read the annotation files.
 
-#Get the 50 samples used for the comparison
-df_comparison_ft_gpt4o_mini= get_df_comparison('../results/results_ft_4o_mini.json', mappings_test)
-filtered_samples = df_comparison_ft_gpt4o_mini[df_comparison_ft_gpt4o_mini['Label'].isin(df_comparison_expert_1['Label'])]
+    Parameters:
+        name (str): Name of the attribute.
+    """
+    if name not in _frames:
+        if name == 'mappings_test':
+            _frames[name] = read_csv(REFERENCE_PATH,header=0)
+        elif name == 'df_comparison_expert_1':
+            _frames[name] = get_df_comparison_from_csv(EXPERT_PATH, __getattr__('mappings_test'))
+        elif name == 'df_comparison_ft_gpt4o_mini':
+            _frames[name] = get_df_comparison(MODEL_PATH, __getattr__('mappings_test'))
+        elif name == 'filtered_samples':
+            df_comparison_ft_gpt4o_mini = __getattr__('df_comparison_ft_gpt4o_mini')
+            expert_labels = __getattr__('df_comparison_expert_1')['Label']
+            _frames[name] = df_comparison_ft_gpt4o_mini[df_comparison_ft_gpt4o_mini['Label'].isin(expert_labels)]
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _frames[name]
 
 
 #filtered_samples.to_csv('./results/df_ft_4o_mini_annotation_filtered.csv',index=False)
 #df_comparison_ft_gpt4o_mini.to_csv('./results/df_ft_4o_mini_annotation.csv',index=False)
-
-
-
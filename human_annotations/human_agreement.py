@@ -1,10 +1,91 @@
+import os
+import sys
+import time
+import numpy as np
 import pandas as pd
 from sklearn.metrics import cohen_kappa_score
-from sentence_transformers import SentenceTransformer, util
 from typing import Tuple, List, Dict, Optional
 
-# Load the sentence transformer model once
-MODEL = SentenceTransformer('all-MiniLM-L6-v2')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))  # shared modules
+import embedding_store  # persistent embeddings
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+BATCH_SIZE = 256
+BACKENDS = ('torch', 'int8', 'onnx')  # fp32 PyTorch, dynamic int8 quantization, exported ONNX graph
+# CPU inference path and thread count, e.g. EMBEDDING_BACKEND=int8 EMBEDDING_THREADS=4
+BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+THREADS = int(os.environ['EMBEDDING_THREADS']) if os.environ.get('EMBEDDING_THREADS') else None
+
+# Thresholds of the soft agreement curves
+THRESHOLDS = np.round(np.arange(0.5, 1.0001, 0.01), 2)
+EMPTY_VALUES = ['-', 'nan', '']  # no class name
+
+# The sentence transformer models are loaded on first use, once per backend
+_models = {}
+
+
+def load_model(backend: str = BACKEND, threads: Optional[int] = THREADS):
+    """
+    Load the sentence transformer model for CPU inference.
+
+    Args:
+        backend (str): 'torch' (fp32), 'int8' (dynamic int8 quantization of the
+            linear layers) or 'onnx' (exported ONNX graph run by ONNX Runtime).
+        threads (Optional[int]): Number of inference threads, the library default if None.
+
+    Returns:
+        The model, with the SentenceTransformer encode interface.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        torch.set_num_threads(threads)
+    if backend == 'onnx':
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        return SentenceTransformer(MODEL_NAME, device='cpu', backend='onnx',
+                                   model_kwargs={'session_options': options})
+    model = SentenceTransformer(MODEL_NAME, device='cpu')
+    if backend == 'int8':
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def get_model(backend: str = BACKEND):
+    """
+    Get the sentence transformer model of a backend, loading it on first use.
+    """
+    if backend not in _models:
+        _models[backend] = load_model(backend)
+    return _models[backend]
+
+
+def encode(texts: List[str], backend: str = BACKEND) -> np.ndarray:
+    """
+    Encode texts in large batches as unit-length sentence embeddings, without the store.
+    """
+    return get_model(backend).encode(list(texts), batch_size=BATCH_SIZE, convert_to_numpy=True,
+                                     normalize_embeddings=True)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    Get the unit-length sentence embeddings of texts from the embedding store,
+    encoding in large batches only the texts that are not stored yet.
+
+    Args:
+        texts (List[str]): Texts to encode, ideally without repetitions.
+
+    Returns:
+        np.ndarray: One normalized embedding per text, in the same order.
+    """
+    # Quantized backends store their embeddings apart from the fp32 ones
+    store_name = MODEL_NAME if BACKEND == 'torch' else f'{MODEL_NAME}-{BACKEND}'
+    return embedding_store.get_embeddings(store_name, texts, encode)
 
 
 def compute_similarity(text1: str, text2: str) -> float:
@@ -18,28 +99,60 @@ def compute_similarity(text1: str, text2: str) -> float:
     Returns:
         float: Cosine similarity score.
     """
-    embedding1 = MODEL.encode(text1, convert_to_tensor=True)
-    embedding2 = MODEL.encode(text2, convert_to_tensor=True)
-    return util.cos_sim(embedding1, embedding2).item()
+    embedding1, embedding2 = embed_texts([text1, text2])
+    return float(np.dot(embedding1, embedding2))
+
+
+def compute_similarities(
+    df: pd.DataFrame,
+    column_pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], np.ndarray]:
+    """
+    Compute the row-wise cosine similarity of several column pairs. The unique strings
+    of all the compared columns are encoded once, and the similarities of each pair
+    are a single product of the embedding rows.
+
+    Args:
+        df (pd.DataFrame): DataFrame with the compared columns.
+        column_pairs (List[Tuple[str, str]]): Column pairs to compare.
+
+    Returns:
+        Dict[Tuple[str, str], np.ndarray]: Similarity of every row for each pair.
+    """
+    columns = list(dict.fromkeys(column for pair in column_pairs for column in pair))
+    texts = df[columns].astype(str)
+    codes, uniques = pd.factorize(texts.to_numpy().ravel())
+    codes = codes.reshape(texts.shape)
+    embeddings = embed_texts(uniques.tolist())
+    position = {column: i for i, column in enumerate(columns)}
+    return {
+        (column1, column2): np.einsum(
+            'ij,ij->i',
+            embeddings[codes[:, position[column1]]],
+            embeddings[codes[:, position[column2]]]
+        )
+        for column1, column2 in column_pairs
+    }
 
 
 def compute_agreement(
     df: pd.DataFrame,
     column1: str,
     column2: str,
-    threshold: float = 0.9
+    threshold: float = 0.9,
+    similarities: Optional[np.ndarray] = None
 ) -> Dict[str, Optional[float]]:
     """
     Compute exact match (Cohen's Kappa) and soft agreement (semantic similarity)
-    between two columns in a DataFrame.
+    between two columns in a DataFrame. The similarities can be precomputed with
+    compute_similarities; otherwise they are computed for this pair.
     """
-    soft_matches = [
-        compute_similarity(a, b) >= threshold
-        for a, b in zip(df[column1], df[column2])
-    ]
+    if similarities is None:
+        similarities = compute_similarities(df, [(column1, column2)])[(column1, column2)]
+    soft_matches = similarities >= threshold
 
     soft_agreement = (
-        sum(soft_matches) / len(soft_matches) if soft_matches else None
+        float(soft_matches.mean()) if len(soft_matches) else None
     )
     kappa = (
         cohen_kappa_score(df[column1], df[column2])
@@ -53,6 +166,135 @@ def compute_agreement(
     }
 
 
+def threshold_sweep(
+    reference: pd.Series,
+    model: pd.Series,
+    similarities: np.ndarray,
+    thresholds: np.ndarray = THRESHOLDS
+) -> pd.DataFrame:
+    """
+    Compute the soft agreement curve of a column pair for a whole grid of
+    thresholds in one vectorized pass. At each threshold, a model value whose
+    similarity reaches it counts as the reference value, and Cohen's kappa is
+    computed on those binarized decisions. The rows are sorted by similarity
+    once; the observed agreement and the change of the expected agreement are
+    cumulative sums over that order, read at every threshold.
+
+    Args:
+        reference (pd.Series): Reference values.
+        model (pd.Series): Model values, aligned with the reference.
+        similarities (np.ndarray): Similarity of every row (see compute_similarities).
+        thresholds (np.ndarray): Thresholds of the curve.
+
+    Returns:
+        pd.DataFrame: 'threshold', 'soft_agreement' (share of rows whose similarity
+        reaches it), 'observed_agreement', 'expected_agreement' and 'kappa'.
+    """
+    n = len(similarities)
+    thresholds = np.asarray(thresholds, dtype=float)
+    codes, _ = pd.factorize(np.concatenate([
+        reference.astype(str).to_numpy(), model.astype(str).to_numpy()
+    ]))
+    reference_codes, model_codes = codes[:n], codes[n:]
+    reference_counts = np.bincount(reference_codes, minlength=codes.max() + 1 if n else 0)
+    model_counts = np.bincount(model_codes, minlength=len(reference_counts))
+    exact = reference_codes == model_codes
+
+    # Only mismatched rows can change; each one moves a count of the model
+    # marginal from its own value to the reference value
+    order = np.argsort(-similarities[~exact], kind='stable')
+    sorted_similarities = similarities[~exact][order]
+    shifts = (reference_counts[reference_codes[~exact]]
+              - reference_counts[model_codes[~exact]])[order]
+    cumulative_shifts = np.concatenate([[0], np.cumsum(shifts)])
+    switched = np.searchsorted(-sorted_similarities, -thresholds, side='right')
+
+    observed = (exact.sum() + switched) / n
+    expected = (np.dot(reference_counts, model_counts) + cumulative_shifts[switched]) / n ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappa = np.where(expected < 1, (observed - expected) / (1 - expected), np.nan)
+    soft = n - np.searchsorted(np.sort(similarities), thresholds, side='left')
+    return pd.DataFrame({
+        'threshold': thresholds,
+        'soft_agreement': soft / n,
+        'observed_agreement': observed,
+        'expected_agreement': expected,
+        'kappa': kappa,
+    })
+
+
+def calibrate_threshold(
+    reference: pd.Series,
+    model: pd.Series,
+    quantile: float = 0.99,
+    n_pairs: int = 10000,
+    seed: int = 0
+) -> Optional[float]:
+    """
+    Recommend a soft agreement threshold from the exact-match subset: the class
+    names both sides agree on are paired with each other at random, and the
+    threshold is the given quantile of the similarities of those unrelated
+    pairs, so at most 1 - quantile of them would count as agreeing.
+
+    Args:
+        reference (pd.Series): Reference values.
+        model (pd.Series): Model values, aligned with the reference.
+        quantile (float): Quantile of the similarities of unrelated pairs.
+        n_pairs (int): Number of random pairs.
+        seed (int): Seed of the random pairing.
+
+    Returns:
+        Optional[float]: The threshold, or None if fewer than two exact matches.
+    """
+    reference = reference.astype(str)
+    matched = reference[(reference == model.astype(str)) & ~reference.isin(EMPTY_VALUES)]
+    texts = pd.unique(matched.to_numpy()).tolist()
+    if len(texts) < 2:
+        return None
+    rng = np.random.default_rng(seed)
+    first = rng.integers(len(texts), size=n_pairs)
+    second = (first + rng.integers(1, len(texts), size=n_pairs)) % len(texts)  # never the same text
+    embeddings = embed_texts(texts)
+    null = np.einsum('ij,ij->i', embeddings[first], embeddings[second])
+    return float(np.quantile(null, quantile))
+
+
+def benchmark_backends(
+    texts: List[str],
+    backends: Tuple[str, ...] = BACKENDS
+) -> Dict[str, Dict[str, float]]:
+    """
+    Compare the CPU backends on some texts: load time, encode throughput and the
+    maximum cosine drift (1 - cosine between the embeddings of the same text)
+    from the fp32 baseline.
+
+    Args:
+        texts (List[str]): Texts to encode, e.g. the unique class names.
+        backends (Tuple[str, ...]): Backends to compare; 'torch' is always the baseline.
+
+    Returns:
+        Dict[str, Dict[str, float]]: 'load_seconds', 'texts_per_second' and
+        'max_cosine_drift' of each backend.
+    """
+    results = {}
+    baseline = None
+    for backend in ('torch',) + tuple(b for b in backends if b != 'torch'):
+        start = time.perf_counter()
+        get_model(backend)
+        loaded = time.perf_counter()
+        embeddings = encode(texts, backend)
+        encoded = time.perf_counter()
+        if baseline is None:
+            baseline = embeddings
+        results[backend] = {
+            'load_seconds': round(loaded - start, 3),
+            'texts_per_second': round(len(texts) / (encoded - loaded), 1),
+            'max_cosine_drift': float(np.max(1 - np.einsum('ij,ij->i', baseline, embeddings))),
+        }
+        print(f"{backend}: {results[backend]}")
+    return results
+
+
 
 def main():
     # Define path to CSV file
@@ -69,9 +311,16 @@ def main():
         ('BTO_C', 'BTO_M'),
     ]
 
-    # Perform agreement analysis
+    if '--benchmark' in sys.argv:
+        columns = [column for pair in ontology_pairs for column in pair]
+        benchmark_backends(pd.unique(df[columns].astype(str).to_numpy().ravel()).tolist())
+        return
+
+    # Perform agreement analysis, encoding the class names of every pair at once
+    similarities = compute_similarities(df, ontology_pairs)
     results = [
-        compute_agreement(df, col1, col2) for col1, col2 in ontology_pairs
+        compute_agreement(df, col1, col2, similarities=similarities[(col1, col2)])
+        for col1, col2 in ontology_pairs
     ]
 
     # Display results
@@ -81,6 +330,18 @@ def main():
         print(f"  Soft agreement (sim ≥ 0.9): {result['soft_agreement']}")
         print(f"  Cohen's Kappa (exact match): {result['kappa_exact']}")
 
+        # Agreement vs threshold curve, reusing the similarities
+        curve = threshold_sweep(df[col1], df[col2], similarities[(col1, col2)])
+        curve.to_csv(f"results/agreement_threshold_{col1}_{col2}.csv", index=False)
+        recommended = calibrate_threshold(df[col1], df[col2])
+        if recommended is not None:
+            row = curve.iloc[np.searchsorted(curve['threshold'], recommended)
+                             if recommended <= curve['threshold'].iloc[-1] else -1]
+            print(f"  Recommended threshold: {recommended:.3f} "
+                  f"(soft agreement {row['soft_agreement']:.3f}, kappa {row['kappa']:.3f} at {row['threshold']:.2f})")
+
+    embedding_store.report()
+
 
 if __name__ == "__main__":
     main()
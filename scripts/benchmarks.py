@@ -0,0 +1,338 @@
+import os #interact with the operating system
+import sys
+import json #use json data
+import time
+import platform #machine of the baseline
+import argparse #command line
+import importlib #scripts opening files relative to their working directory
+import importlib.util #optional dependencies
+import random #synthetic strings
+import tempfile #scaled copies of the input files
+import timeit #timing
+from contextlib import redirect_stdout
+import pandas as pd #dataframe manipulation
+
+from pattern_analysis import search_common_substrings_batch, extract_candidates, PATTERN_COLUMNS
+from classnames_io import load_classnames
+from df_comparison import process_json_results, get_df_comparison
+from ontology_files import CACHE_DIR
+import synthetic_corpus #offline corpora at any scale
+
+BENCHMARK_DIR = os.path.join(CACHE_DIR, 'benchmarks')
+SCALES = (1, 10, 100, 1000)
+TOLERANCE = 0.25 #slowdown over the baseline flagged as a regression
+MIN_SLOWDOWN = 0.01 #seconds, smaller differences are timer noise
+MAX_SECONDS = 60 #larger scales of a benchmark are skipped once they would take longer than this
+
+WORDS = ['cell', 'epithelial', 'of', 'the', 'colon', 'stem', 'muscle', 'lymphoblast', 'derived', 'tissue',
+         'primary', 'adult', 'line', 'lower', 'lobe', 'right', 'lung', 'neural', 'progenitor', 'fibroblast']
+
+def search_common_substrings_reference(string1, string2):
+    """
+    Brute force longest common substring (the previous implementation of search_common_substrings),
+    kept as the reference of the timings (tests/test_pattern_analysis.py checks both give the same result).
+
+    Parameters:
+        string1 (str): First string to compare.
+        string2 (str): Second string to compare.
+
+    """
+    length = min(len(string1), len(string2))
+    for i in range(length, 0, -1):
+        for j in range(len(string1) - i + 1):
+            if string1[j:j+i] in string2:
+                return string1[j:j+i]
+    return ""
+
+def class_name(rng, n_words):
+    """
+    Build a synthetic class name of n_words words.
+    """
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words))
+
+def benchmark_lcs(n_words=(5, 20, 50), n_pairs=100, seed=17):
+    """
+    Time the reference and the suffix automaton implementations on class names of increasing length.
+
+    Parameters:
+        n_words (tuple): Number of words of the class names of each round.
+        n_pairs (int): Number of pairs of each round.
+        seed (int): Seed of the random generator.
+    """
+    rng = random.Random(seed)
+    for words in n_words:
+        pairs = [(class_name(rng, words), class_name(rng, words)) for _ in range(n_pairs)]
+        reference = timeit.timeit(lambda: [search_common_substrings_reference(a, b) for a, b in pairs], number=1)
+        automaton = timeit.timeit(lambda: search_common_substrings_batch(pairs), number=1)
+        print(f"LCS {words} words ({sum(len(a) for a, _ in pairs) // n_pairs} chars): "
+              f"reference {reference:.4f}s, suffix automaton {automaton:.4f}s, speedup {reference / automaton:.1f}x")
+
+def data_process_reference(filename):
+    """
+    Previous JSON to DataFrame loader of pattern_analysis, llm_contributions and match_analysis, kept as
+    the reference of the timings (tests/test_classnames_io.py checks both give the same frame).
+
+    Parameters:
+        filename (str): Path to the JSON file containing class data.
+
+    """
+    with open(filename, 'r') as archive:
+        dict_classes = json.load(archive)
+    df = pd.DataFrame.from_dict(dict_classes, orient='index')
+    new_row = pd.DataFrame([df.columns], columns=df.columns)
+    df_process = pd.concat([new_row, df], ignore_index=True)
+    df_process.columns = ['CLO_C','CLO_M', 'CL_C','CL_M', 'UBERON_C','UBERON_M','BTO_C','BTO_M']
+    df_process = df_process.drop(0)
+    keys=[]
+    for key in dict_classes.keys():
+        keys.append(key)
+    df_process['Label'] = keys #add label column
+    df_process.fillna("", inplace=True) #replace 'Nonetype' values
+    return df_process
+
+def scale_classnames(filename, scale, directory):
+    """
+    Write a copy of a class names file repeated scale times (with distinct labels).
+
+    Returns:
+        str: Path to the scaled copy.
+    """
+    with open(filename, 'r') as archive:
+        dict_classes = json.load(archive)
+    scaled = {f'{label} #{i}' if i else label: names for i in range(scale) for label, names in dict_classes.items()}
+    path = os.path.join(directory, f'x{scale}_' + os.path.basename(filename))
+    with open(path, 'w') as archive_json:
+        json.dump(scaled, archive_json)
+    return path
+
+def benchmark_loader(filename='../results/classnames_CL.json', scales=(1, 10, 100)):
+    """
+    Time load_classnames and the reference loader (and the Parquet cache, if pyarrow is installed) on the
+    file repeated several times.
+
+    Parameters:
+        filename (str): Class names, pattern or contribution file.
+        scales (tuple): Number of copies of the file of each round.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            path = scale_classnames(filename, scale, directory)
+            reference = timeit.timeit(lambda: data_process_reference(path), number=1)
+            loader = timeit.timeit(lambda: load_classnames(path), number=1)
+            line = f"Loader x{scale} ({os.path.getsize(path) // 1024} KB): reference {reference:.4f}s, load_classnames {loader:.4f}s"
+            if importlib.util.find_spec('pyarrow') is not None:
+                load_classnames(path, cache=True)
+                cached = timeit.timeit(lambda: load_classnames(path, cache=True), number=1)
+                line += f", cached {cached:.4f}s"
+            print(line)
+
+def _quiet(function, *args):
+    """
+    Call a function without its prints.
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return function(*args)
+
+def _in_directory(directory, function, *args):
+    """
+    Call a function from a working directory (the scripts open their files relative to it).
+    """
+    current = os.getcwd()
+    os.chdir(directory)
+    try:
+        return function(*args)
+    finally:
+        os.chdir(current)
+
+def case_process_json_results(corpus):
+    """
+    Parse the results JSON of a model.
+    """
+    return lambda: _quiet(process_json_results, corpus['results'])
+
+def case_get_df_comparison(corpus):
+    """
+    Build the comparison frame of a model against the test partition.
+    """
+    reference = pd.read_csv(corpus['mappings_test'], header=0)
+    return lambda: _quiet(get_df_comparison, corpus['results'], reference.copy())
+
+def case_load_classnames(corpus):
+    """
+    Load a class names file.
+    """
+    return lambda: load_classnames(corpus['classnames_CL'])
+
+def case_search_common_substrings(corpus):
+    """
+    Find the common substrings of the mismatched class names of the CL type.
+    """
+    df = load_classnames(corpus['classnames_CL'])
+    controls = [f'{col}_C' for col in PATTERN_COLUMNS['CL']]
+    tests = [f'{col}_M' for col in PATTERN_COLUMNS['CL']]
+    candidates = extract_candidates(df, controls, tests, df[controls].to_numpy() != df[tests].to_numpy())
+    pairs = list(zip(candidates['string1'], candidates['string2'])) #the mismatched pairs pattern_analysis checks
+    return lambda: search_common_substrings_batch(pairs)
+
+def case_calculate_metrics(corpus):
+    """
+    Compute the metrics of the CL type.
+    """
+    #match_analysis loads '../results/df_ft_4o_mini_annotation.csv' on import (through class_names) and
+    #calculate_metrics opens './results/contribution_file_*.json', so both run from inside the corpus
+    match_analysis = sys.modules.get('match_analysis') or _in_directory(os.path.join(corpus['root'], 'scripts'),
+                                                                        importlib.import_module, 'match_analysis')
+    return lambda: _quiet(_in_directory, corpus['root'], match_analysis.calculate_metrics, 'CL')
+
+#Hot functions of the workflow: name -> function preparing, from a corpus, the call to time
+CASES = {
+    'process_json_results': case_process_json_results,
+    'get_df_comparison': case_get_df_comparison,
+    'load_classnames': case_load_classnames,
+    'search_common_substrings': case_search_common_substrings,
+    'calculate_metrics': case_calculate_metrics,
+}
+
+def time_call(call, repeat=5, min_seconds=1.0):
+    """
+    Time a call: the fastest of up to `repeat` runs, stopping after the first run if it takes more than
+    min_seconds.
+
+    Returns:
+        float: Seconds.
+    """
+    best = timeit.timeit(call, number=1)
+    for _ in range(repeat - 1):
+        if best > min_seconds:
+            break
+        best = min(best, timeit.timeit(call, number=1))
+    return best
+
+def run_suite(scales=SCALES, names=None, max_seconds=MAX_SECONDS, seed=17):
+    """
+    Time each hot function on synthetic corpora of increasing scale (see synthetic_corpus.generate). Once a
+    function would take longer than max_seconds at a scale (extrapolated linearly from the previous one),
+    it is skipped at that and larger scales; corpora are only generated for scales some function needs.
+
+    Parameters:
+        scales (tuple): Sizes of the corpora, in copies of biosamples.tsv.
+        names (list): Functions to time (keys of CASES), all by default.
+        max_seconds (float): Time limit of a single call.
+        seed (int): Seed of the corpora.
+
+    Returns:
+        dict: Function -> {scale: seconds, None if skipped or failed}.
+    """
+    names = list(names or CASES)
+    unknown = set(names) - set(CASES)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    timings = {name: {} for name in names}
+    previous = {}
+    for scale in sorted(scales):
+        pending = [name for name in names if name not in previous or
+                   (previous[name] is not None and previous[name][1] * scale / previous[name][0] <= max_seconds)]
+        for name in set(names) - set(pending):
+            timings[name][scale] = None
+        if not pending:
+            continue
+        start = time.time()
+        corpus = synthetic_corpus.generate(scale, seed=seed)
+        print(f"Corpus x{scale} ready ({time.time() - start:.1f}s)")
+        for name in pending:
+            try:
+                seconds = time_call(CASES[name](corpus))
+            except Exception as error: #e.g., an optional dependency of a script is missing
+                print(f"{name} x{scale} failed: {error!r}")
+                timings[name][scale] = None
+                previous[name] = None
+                continue
+            timings[name][scale] = seconds
+            previous[name] = (scale, seconds)
+            print(f"{name:<26} x{scale:<6}{seconds:10.4f}s")
+    return timings
+
+def machine():
+    """
+    Description of the machine, stored with the baseline (timings of other machines are not comparable).
+    """
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'pandas': pd.__version__}
+
+def compare(timings, baseline, tolerance=TOLERANCE):
+    """
+    Compare timings with a baseline.
+
+    Parameters:
+        timings (dict): Output of run_suite.
+        baseline (dict): Timings of the baseline, in the same format (with string scales, as read from JSON).
+        tolerance (float): Relative slowdown flagged as a regression (0.25: 25% slower), if it is also over MIN_SLOWDOWN.
+
+    Returns:
+        list: (function, scale, baseline seconds, seconds, ratio) of each regression.
+    """
+    regressions = []
+    for name, by_scale in timings.items():
+        for scale, seconds in by_scale.items():
+            reference = baseline.get(name, {}).get(str(scale))
+            if seconds is not None and reference and seconds > max(reference * (1 + tolerance), reference + MIN_SLOWDOWN):
+                regressions.append((name, scale, reference, seconds, seconds / reference))
+    return regressions
+
+def load_baseline(path=os.path.join(BENCHMARK_DIR, 'baseline.json')):
+    """
+    Load the stored baseline, None if there is none.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def save_timings(timings, name):
+    """
+    Save timings (with the machine and the date) as cache/benchmarks/<name>.json, and append them to the
+    history of runs (history.jsonl).
+
+    Returns:
+        str: Path of the saved timings.
+    """
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    record = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'machine': machine(),
+              'timings': {name: {str(scale): seconds for scale, seconds in by_scale.items()} for name, by_scale in timings.items()}}
+    path = os.path.join(BENCHMARK_DIR, f'{name}.json')
+    with open(path, 'w') as file:
+        json.dump(record, file, indent=4)
+    with open(os.path.join(BENCHMARK_DIR, 'history.jsonl'), 'a') as file:
+        file.write(json.dumps(record) + '\n')
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot functions on synthetic corpora and flag regressions.")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(SCALES), help="corpus sizes, in copies of biosamples.tsv")
+    parser.add_argument('--only', nargs='+', choices=list(CASES), help="functions to benchmark, all by default")
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS, help="skip larger scales of a function past this time")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="slowdown over the baseline flagged as a regression")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--checks', action='store_true', help="also time the current implementations against the previous ones")
+    args = parser.parse_args()
+
+    if args.checks:
+        benchmark_lcs()
+        benchmark_loader()
+    timings = run_suite(args.scales, args.only, args.max_seconds)
+    baseline = load_baseline()
+    save_timings(timings, 'baseline' if args.save_baseline or baseline is None else 'latest')
+    if baseline is None or args.save_baseline:
+        print("Baseline saved")
+        return
+    if baseline['machine'] != machine():
+        print("Warning: the baseline was measured on another machine or environment:", baseline['machine'])
+    regressions = compare(timings, baseline['timings'], args.tolerance)
+    for name, scale, reference, seconds, ratio in regressions:
+        print(f"REGRESSION {name} x{scale}: {reference:.4f}s -> {seconds:.4f}s ({ratio:.2f}x)")
+    if regressions:
+        sys.exit(1)
+    print("No regressions over the baseline (tolerance", f"{args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import threading #share the session and the rate limit between workers
+import time #rate limiting
+from concurrent.futures import ThreadPoolExecutor #bounded pool of workers
+import requests #send HTTP requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import dotenv_values
+import instrumentation #spans and profiles of the run
+
+BIOPORTAL_URL = 'http://data.bioontology.org'
+MAX_WORKERS = 8 #concurrent requests
+REQUESTS_PER_SECOND = 15 #BioPortal limit for an API key
+BATCH_SIZE = 500 #classes per request of the /batch endpoint
+OBO_PURL = 'http://purl.obolibrary.org/obo/' #namespace of the classes of the ontologies under study
+OWL_CLASS = 'http://www.w3.org/2002/07/owl#Class'
+
+settings = {
+    'dotenv_path': '.env',
+    'base_url': None, #taken from BIOPORTAL_URL in the .env file if present, so a local server can stand in
+    'max_workers': MAX_WORKERS,
+    'requests_per_second': REQUESTS_PER_SECOND,
+    'batch': True, #resolve several classes per request through the /batch endpoint
+    'batch_size': BATCH_SIZE,
+}
+_session = None
+_session_lock = threading.Lock()
+_rate_lock = threading.Lock()
+_next_slot = 0.0
+
+def configure(**options):
+    """
+    Change the client settings. The shared session is rebuilt on the next request.
+
+    Parameters:
+        options: Any of 'dotenv_path', 'base_url', 'max_workers', 'requests_per_second', 'batch' and 'batch_size'.
+    """
+    global _session
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown BioPortal settings: {sorted(unknown)}")
+    with _session_lock:
+        settings.update(options)
+        _session = None
+
+def get_session():
+    """
+    Get the shared session, created once with the API key read from the .env file, keep-alive connections
+    for every worker and retries with backoff on connection errors, 429 and 5xx responses.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            config = dotenv_values(dotenv_path=settings['dotenv_path'])
+            if settings['base_url'] is None:
+                settings['base_url'] = config.get('BIOPORTAL_URL') or BIOPORTAL_URL
+            retries = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                            allowed_methods=['GET', 'POST'], respect_retry_after_header=True)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings['max_workers'], max_retries=retries)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'Authorization': f"apikey token={config.get('BIOPORTAL_API_KEY')}",
+                'Accept': 'application/json'
+            })
+            _session = session
+        return _session
+
+def _wait_for_slot():
+    """
+    Block until the next request is allowed by the rate limit, shared by all the workers.
+    """
+    global _next_slot
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        _next_slot = slot + 1.0 / settings['requests_per_second']
+    time.sleep(max(0.0, slot - now))
+
+def get_class_name(ontology_acronym, class_id):
+    """
+    Retrieve the class name from BioPortal API for a given class identifier.
+
+    Parameters:
+        ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
+        class_id (str): The identifier for the class within the ontology.
+
+    Returns:
+        str: The name of the class if found, or None if the request fails.
+    """
+    session = get_session()
+    url = f"{settings['base_url']}/ontologies/{ontology_acronym}/classes/{class_id}"
+    _wait_for_slot()
+    try:
+        response = session.get(url)
+    except requests.RequestException as error:
+        print("Failed to retrieve data:", error, class_id)
+        return None
+    if response.status_code == 200:
+        class_name = response.json().get('prefLabel')
+        print("Class Name:", class_name)
+        return class_name
+    print("Failed to retrieve data:", response.status_code, class_id)
+    return None
+
+def _post_batch(batch):
+    """
+    Resolve a batch of classes of one ontology with a single request to the /batch endpoint.
+
+    Parameters:
+        batch (list): (ontology_acronym, class_id) tuples, all of the same ontology.
+
+    Returns:
+        dict: prefLabel for each class_id in the response, or None if the request failed.
+    """
+    session = get_session()
+    ontology = f"{BIOPORTAL_URL}/ontologies/{batch[0][0]}"
+    iris = {OBO_PURL + class_id.replace(':', '_'): class_id for _, class_id in batch}
+    payload = {OWL_CLASS: {'collection': [{'class': iri, 'ontology': ontology} for iri in iris],
+                           'display': 'prefLabel'}}
+    _wait_for_slot()
+    try:
+        response = session.post(f"{settings['base_url']}/batch", json=payload)
+        if response.status_code != 200:
+            print("Failed to retrieve batch:", response.status_code, batch[0][0])
+            return None
+        classes = response.json().get(OWL_CLASS, [])
+    except (requests.RequestException, ValueError) as error:
+        print("Failed to retrieve batch:", error, batch[0][0])
+        return None
+    return {iris[item['@id']]: item.get('prefLabel') for item in classes if item.get('@id') in iris}
+
+@instrumentation.traced('bioportal batch')
+def get_class_names_batch(lookups):
+    """
+    Retrieve the class names of several identifiers through the /batch endpoint, grouped by ontology and
+    split in batches of settings['batch_size']. Classes missing from a response, or from a failed batch,
+    are looked up one by one.
+
+    Parameters:
+        lookups (list): (ontology_acronym, class_id) tuples.
+
+    Returns:
+        list: The class name of each lookup (None if it could not be retrieved), in the same order.
+    """
+    by_ontology = {}
+    for lookup in dict.fromkeys(lookups):
+        by_ontology.setdefault(lookup[0], []).append(lookup)
+    batches = [group[i:i + settings['batch_size']] for group in by_ontology.values()
+               for i in range(0, len(group), settings['batch_size'])]
+    with ThreadPoolExecutor(max_workers=settings['max_workers']) as executor:
+        responses = list(executor.map(_post_batch, batches))
+    found = {}
+    for response in responses:
+        found.update({class_id: name for class_id, name in (response or {}).items() if name is not None})
+    missing = [lookup for batch in batches for lookup in batch if lookup[1] not in found]
+    if missing:
+        print("Falling back to single lookups for", len(missing), "classes")
+        with ThreadPoolExecutor(max_workers=settings['max_workers']) as executor:
+            found.update(zip([class_id for _, class_id in missing], executor.map(lambda lookup: get_class_name(*lookup), missing)))
+    return [found.get(class_id) for _, class_id in lookups]
+
+def get_class_names(lookups):
+    """
+    Retrieve the class names of several identifiers concurrently, with a bounded pool of workers, through the
+    /batch endpoint unless settings['batch'] is False.
+
+    Parameters:
+        lookups (list): (ontology_acronym, class_id) tuples.
+
+    Returns:
+        list: The class name of each lookup (None if the request fails), in the same order.
+    """
+    if not lookups:
+        return []
+    if settings['batch'] and len(lookups) > 1:
+        return get_class_names_batch(lookups)
+    with ThreadPoolExecutor(max_workers=settings['max_workers']) as executor:
+        return list(executor.map(lambda lookup: get_class_name(*lookup), lookups))
+
+def get_ontology_version(ontology_acronym):
+    """
+    Retrieve the version of the latest submission of an ontology in BioPortal.
+
+    Parameters:
+        ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
+
+    Returns:
+        str: The version of the ontology, or None if the request fails.
+    """
+    session = get_session()
+    url = f"{settings['base_url']}/ontologies/{ontology_acronym}/latest_submission"
+    _wait_for_slot()
+    try:
+        response = session.get(url, params={'display': 'version'})
+    except requests.RequestException:
+        return None
+    if response.status_code == 200:
+        return response.json().get('version')
+    return None
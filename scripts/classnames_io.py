@@ -0,0 +1,65 @@
+import os #interact with the operating system
+import json #use json data
+import importlib.util #optional dependencies
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+from ontology_files import CACHE_DIR, file_hash
+import instrumentation #spans and profiles of the run
+
+try:
+    import orjson #faster JSON parser, optional
+except ImportError:
+    orjson = None
+
+CLASSNAME_COLUMNS = ['CLO_C', 'CLO_M', 'CL_C', 'CL_M', 'UBERON_C', 'UBERON_M', 'BTO_C', 'BTO_M']
+PARQUET_DIR = os.path.join(CACHE_DIR, 'classnames')
+
+def read_json(filename):
+    """
+    Parse a JSON file, with orjson if it is installed.
+
+    Parameters:
+        filename (str): Path to the JSON file.
+    """
+    with open(filename, 'rb') as archive:
+        content = archive.read()
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+@instrumentation.traced('load classnames')
+def load_classnames(filename, cache=False):
+    """
+    Load a class names, pattern or contribution file (label -> eight class names) into a DataFrame with the
+    columns CLO_C, CLO_M, CL_C, CL_M, UBERON_C, UBERON_M, BTO_C, BTO_M and Label. The columns are built
+    directly from the parsed lists, missing values are replaced with "" and the index starts at 1.
+
+    Parameters:
+        filename (str): Path to the JSON file containing class data.
+        cache (bool): Keep the DataFrame as Parquet (if pyarrow is installed), keyed by the hash of the file.
+
+    """
+    cache_file = None
+    if cache and importlib.util.find_spec('pyarrow') is not None:
+        cache_file = os.path.join(PARQUET_DIR, f'{file_hash(filename)}.parquet')
+        if os.path.exists(cache_file):
+            return pd.read_parquet(cache_file)
+
+    dict_classes = read_json(filename)
+    width = len(CLASSNAME_COLUMNS)
+    rows = list(dict_classes.values())
+    if set(map(len, rows)) <= {width}:
+        values = np.empty((len(rows), width), dtype=object)
+        values[:] = rows
+    else: #rows with missing class names are padded
+        values = np.full((len(rows), width), None, dtype=object)
+        for i, names in enumerate(rows):
+            values[i, :min(len(names), width)] = names[:width]
+    values[np.equal(values, None)] = "" #replace 'Nonetype' values
+    df_process = pd.DataFrame(values, columns=CLASSNAME_COLUMNS, index=pd.RangeIndex(1, len(rows) + 1),
+                              dtype=object) #kept as object, like the frames built by the other scripts
+    df_process['Label'] = pd.Series(list(dict_classes.keys()), index=df_process.index, dtype=object) #add label column
+
+    if cache_file is not None:
+        os.makedirs(PARQUET_DIR, exist_ok=True)
+        df_process.to_parquet(cache_file)
+    return df_process
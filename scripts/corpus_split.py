@@ -0,0 +1,226 @@
+import os #interact with the operating system
+import io
+import json #use json data
+import hashlib #row hashes
+import importlib.util #optional dependencies
+from contextlib import contextmanager
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+COLUMNS = ['Label', 'CLO', 'CL', 'UBERON', 'BTO', 'Type'] #columns of biosamples.tsv, which has no header
+PARTITIONS = ['train', 'validation', 'test']
+SPLIT_DIR = 'split' #folder of the partitions, relative to the working directory
+
+settings = {
+    'salt': 'biosamples-17', #changing it draws a different split
+    'test_size': 0.30, #share of the rows in the test partition, as in the legacy split
+    'validation_size': 0.175, #share of the rows in the validation partition (25% of the rest, as in the legacy split)
+    'block_size': 64 * 2**20, #bytes of whole lines per chunk
+    'engine': 'auto', #'auto' (pyarrow if installed), 'pyarrow' or 'pandas'
+}
+
+def configure(**options):
+    """
+    Change the split settings.
+
+    Parameters:
+        options: Any of 'salt', 'test_size', 'validation_size', 'block_size' and 'engine'.
+    """
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown split settings: {sorted(unknown)}")
+    settings.update(options)
+
+def _engine():
+    """
+    Reader used for the chunks.
+    """
+    if settings['engine'] == 'auto':
+        return 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'pandas'
+    return settings['engine']
+
+def read_chunks(file):
+    """
+    Read a biosamples TSV (Label, CLO, CL, UBERON, BTO, Type; no header) in chunks of whole lines, with every
+    column as strings, so the whole file never has to fit in memory. Missing values are parsed as in
+    pd.read_csv. A last line without its newline is left for the next read, as it may still be being written.
+
+    Parameters:
+        file (file object): TSV opened in binary mode, read from its current position.
+
+    Returns:
+        generator: (DataFrame with the COLUMNS, bytes read) of each chunk.
+    """
+    engine = _engine()
+    if engine == 'pyarrow':
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        read_options = pacsv.ReadOptions(column_names=COLUMNS)
+        parse_options = pacsv.ParseOptions(delimiter='\t')
+        convert_options = pacsv.ConvertOptions(column_types={column: pa.string() for column in COLUMNS}, strings_can_be_null=True)
+    while True:
+        lines = file.readlines(settings['block_size'])
+        if lines and not lines[-1].endswith(b'\n'):
+            lines.pop()
+        if not lines:
+            return
+        data = b''.join(lines)
+        if engine == 'pyarrow':
+            chunk = pacsv.read_csv(pa.py_buffer(data), read_options=read_options, parse_options=parse_options,
+                                   convert_options=convert_options).to_pandas().astype(object)
+        else:
+            chunk = pd.read_csv(io.BytesIO(data), sep='\t', header=None, names=COLUMNS, dtype=str)
+        yield chunk, len(data)
+
+def row_fractions(labels, salt=None):
+    """
+    Map each row to a number in [0, 1) by hashing its label with the salt (BLAKE2). Rows with the same label
+    always fall in the same partition, and a row keeps its partition whatever else is in the file.
+
+    Parameters:
+        labels (iterable): Labels of the rows (the stable key of a row).
+        salt (str): Salt of the hash, settings['salt'] by default.
+    """
+    salt = (settings['salt'] if salt is None else salt).encode('utf-8') + b'\0'
+    hashes = np.array([int.from_bytes(hashlib.blake2b(salt + label.encode('utf-8'), digest_size=8).digest(), 'little')
+                       for label in pd.Series(labels, dtype=object).fillna('').astype(str)], dtype=np.uint64)
+    return hashes / 2.0**64
+
+def assign_partitions(labels, salt=None):
+    """
+    Assign each row to 'test', 'validation' or 'train' from the hash of its label.
+
+    Returns:
+        np.ndarray: Partition of each row.
+    """
+    fractions = row_fractions(labels, salt)
+    test, validation = settings['test_size'], settings['test_size'] + settings['validation_size']
+    return np.where(fractions < test, 'test', np.where(fractions < validation, 'validation', 'train'))
+
+def _tail_hash(path, offset, size=65536):
+    """
+    Hash of the bytes of a file before an offset, used to check that the file was only appended to.
+    """
+    with open(path, 'rb') as file:
+        file.seek(max(0, offset - size))
+        return hashlib.sha256(file.read(offset - max(0, offset - size))).hexdigest()
+
+@contextmanager
+def _locked(output_dir):
+    """
+    Hold an exclusive lock on the split folder (fcntl.flock on <output_dir>/split.lock), so processes splitting
+    at the same time wait for each other instead of writing the partitions together. Without fcntl (Windows)
+    the split is not locked.
+    """
+    if importlib.util.find_spec('fcntl') is None:
+        yield
+        return
+    import fcntl
+    with open(os.path.join(output_dir, 'split.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def split_file(path, output_dir=SPLIT_DIR):
+    """
+    Split a biosamples TSV into train, validation and test partitions chunk by chunk, appending each chunk to
+    <output_dir>/<partition>.csv (columns 'row', the row number in the TSV, and 0-5 as in mappings_test.csv).
+    If the TSV was only appended to since the last split with the same settings, only the new rows are read.
+    Concurrent splits into the same folder run one after the other (the later ones find nothing new to read).
+
+    Parameters:
+        path (str): Path to the TSV (e.g., biosamples.tsv).
+        output_dir (str): Folder of the partitions.
+
+    Returns:
+        dict: Number of rows of each partition.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with _locked(output_dir):
+        return _split_file(path, output_dir)
+
+def _split_file(path, output_dir):
+    """
+    Split a TSV into the partitions (see split_file), with the lock of the folder held.
+    """
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    params = {'source': os.path.abspath(path), 'salt': settings['salt'], 'test_size': settings['test_size'],
+              'validation_size': settings['validation_size']}
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+        appended = (manifest['params'] == params and os.path.getsize(path) >= manifest['offset'] and
+                    all(os.path.exists(os.path.join(output_dir, f'{name}.csv')) for name in PARTITIONS) and
+                    _tail_hash(path, manifest['offset']) == manifest['tail_hash'])
+        if not appended:
+            manifest = None
+    if manifest is None: #first split, or the file or the settings changed: start over
+        manifest = {'params': params, 'offset': 0, 'rows': 0, 'counts': {name: 0 for name in PARTITIONS}, 'tail_hash': None}
+        for name in PARTITIONS:
+            pd.DataFrame(columns=['row'] + [str(i) for i in range(len(COLUMNS))]).to_csv(os.path.join(output_dir, f'{name}.csv'), index=False)
+    for name, size in manifest.get('sizes', {}).items(): #drop rows written by an interrupted split
+        with open(os.path.join(output_dir, f'{name}.csv'), 'r+b') as file:
+            file.truncate(size)
+
+    with open(path, 'rb') as file:
+        file.seek(manifest['offset'])
+        offset, rows = manifest['offset'], manifest['rows']
+        for chunk, size in read_chunks(file):
+            partitions = assign_partitions(chunk['Label'])
+            chunk.index = pd.RangeIndex(rows, rows + len(chunk), name='row')
+            for name in PARTITIONS:
+                part = chunk[partitions == name]
+                if len(part):
+                    part.to_csv(os.path.join(output_dir, f'{name}.csv'), mode='a', header=False)
+                    manifest['counts'][name] += len(part)
+            offset, rows = offset + size, rows + len(chunk)
+    manifest['sizes'] = {name: os.path.getsize(os.path.join(output_dir, f'{name}.csv')) for name in PARTITIONS}
+    manifest.update({'rows': rows, 'offset': offset, 'tail_hash': _tail_hash(path, offset)})
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(manifest_path + '.tmp', manifest_path) #a crash never leaves half a manifest
+    return manifest['counts']
+
+def _partition_frame(df):
+    """
+    Give a partition read from its CSV the layout of the legacy split: columns 0-5, indexed by row number.
+    """
+    df.columns = range(len(COLUMNS))
+    df.index.name = None
+    return df
+
+def load_partition(name, output_dir=SPLIT_DIR):
+    """
+    Load a partition written by split_file, indexed by the row number of each row in the TSV (as the legacy
+    split, so reference_lookup.build_index can check that the partitions do not share rows).
+
+    Parameters:
+        name (str): 'train', 'validation' or 'test'.
+        output_dir (str): Folder of the partitions.
+
+    Returns:
+        pd.DataFrame: Columns 0-5 (Label, CLO, CL, UBERON, BTO, Type).
+    """
+    df = pd.read_csv(os.path.join(output_dir, f'{name}.csv'), header=0, index_col='row',
+                     dtype={str(i): str for i in range(len(COLUMNS))})
+    return _partition_frame(df)
+
+def iter_partition(name, output_dir=SPLIT_DIR, chunk_rows=100000):
+    """
+    Read a partition written by split_file in chunks, as load_partition does but without loading it whole.
+
+    Parameters:
+        name (str): 'train', 'validation' or 'test'.
+        output_dir (str): Folder of the partitions.
+        chunk_rows (int): Rows per chunk.
+
+    Returns:
+        generator: DataFrames with columns 0-5.
+    """
+    chunks = pd.read_csv(os.path.join(output_dir, f'{name}.csv'), header=0, index_col='row',
+                         dtype={str(i): str for i in range(len(COLUMNS))}, chunksize=chunk_rows)
+    for df in chunks:
+        yield _partition_frame(df)
@@ -4,11 +4,46 @@ from openai import OpenAI #ChatGPT API
 from dotenv import dotenv_values #environment control
 import os #interact with the operating system
 import json #use json data
+import instrumentation #spans and profiles of the run
+import corpus_split #streaming hash split
+
+#'legacy' reproduces the split of the published results; 'hash' streams the TSV and assigns each row from the
+#salted hash of its label, so the split does not depend on the row order and rows added later keep the rest
+SPLIT_METHOD = os.environ.get('SPLIT_METHOD', 'legacy')
+
+if SPLIT_METHOD == 'hash':
+    corpus_split.split_file("biosamples.tsv") #partitions in split/, only new rows are read again
+    mappings_test = corpus_split.load_partition('test') #the training partitions are read in chunks (see main)
+else:
+    mappings = pd.read_csv("biosamples.tsv", sep="\t", header=None) #data loading
+    mappings_ft, mappings_test = train_test_split(mappings, test_size=0.30, random_state=17) #first data division
+    mappings_train, mappings_validation = train_test_split(mappings_ft, test_size=0.25, random_state=17) #second data
+
+def __getattr__(name):
+    """
+    Load the training partitions of the hash split on first access (e.g., creation_ft.mappings_ft for the
+    reference lookup), so importing this module only keeps the test partition in memory.
+
+    Parameters:
+        name (str): 'mappings_train', 'mappings_validation' or 'mappings_ft'.
+    """
+    if SPLIT_METHOD != 'hash' or name not in ('mappings_train', 'mappings_validation', 'mappings_ft'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name == 'mappings_ft':
+        globals()[name] = pd.concat([__getattr__('mappings_train'), __getattr__('mappings_validation')])
+    else:
+        globals()[name] = corpus_split.load_partition(name.split('_')[1])
+    return globals()[name]
+
+def save_test_split(path='mappings_test.csv'):
+    """
+    Save the test partition, the reference mappings of the evaluation (the 'split' stage of pipeline.py).
+    Importing this module only builds the partitions, so the scripts importing them do not rewrite the file.
 
-mappings = pd.read_csv("biosamples.tsv", sep="\t", header=None) #data loading
-mappings_ft, mappings_test = train_test_split(mappings, test_size=0.30, random_state=17) #first data division
-mappings_train, mappings_validation = train_test_split(mappings_ft, test_size=0.25, random_state=17) #second data
-mappings_test.to_csv('mappings_test.csv',index=False)
+    Parameters:
+        path (str): Path of the CSV file.
+    """
+    mappings_test.to_csv(path,index=False)
 
 def get_formatted_data(data):
     """
@@ -30,16 +65,17 @@ def get_formatted_data(data):
         })
     return formatted_data
 
-def save_to_jsonl(dataset, file_path):
+def save_to_jsonl(dataset, file_path, mode='w'):
     """
     Convert a list of messages in JSON format to JSONL.
 
     Parameters:
         file_path (str): Path to the folder where the training and validation data will be stored.
         dataset (list): List of message to be converted to JSON format.
+        mode (str): 'w' to write a new file, 'a' to append to it.
 
     """
-    with open(file_path, 'w') as file:
+    with open(file_path, mode) as file:
         for example in dataset:
             json_line = json.dumps(example)
             file.write(json_line + '\n')
@@ -49,13 +85,11 @@ def jsonl_converter(mappings_train, mappings_validation, output_folder):
     Convert a list of messages to JSONL.
 
     Parameters:
-        mappings_train (DataFrame): DataFrame to be used as training dataset.
-        mappings_validation (DataFrame): DataFrame to be used as validation dataset.
+        mappings_train (DataFrame): DataFrame to be used as training dataset, or an iterable of DataFrames
+                                    (chunks of the partition, see corpus_split.iter_partition).
+        mappings_validation (DataFrame): DataFrame to be used as validation dataset, or an iterable of DataFrames.
         output_folder (str): Path to the folder where the training and validation data will be stored.
     """
-    formatted_train = get_formatted_data(mappings_train)
-    formatted_validation = get_formatted_data(mappings_validation)
-
     # Ensure the output folder exists
     os.makedirs(output_folder, exist_ok=True)
 
@@ -63,9 +97,11 @@ def jsonl_converter(mappings_train, mappings_validation, output_folder):
     training_file_path = os.path.join(output_folder, "formatted_train.jsonl")
     validation_file_path = os.path.join(output_folder, "formatted_validation.jsonl")
 
-    # Save the files
-    save_to_jsonl(formatted_train, training_file_path)
-    save_to_jsonl(formatted_validation, validation_file_path)
+    # Save the files, chunk by chunk
+    for data, file_path in [(mappings_train, training_file_path), (mappings_validation, validation_file_path)]:
+        save_to_jsonl([], file_path)
+        for chunk in ([data] if isinstance(data, pd.DataFrame) else data):
+            save_to_jsonl(get_formatted_data(chunk), file_path, mode='a')
 
 def load_environment():
     """
@@ -118,9 +154,14 @@ def create_job():
   return
 
 def main(mappings_train,mappings_validation,output_folder):
+    save_test_split()
     jsonl_converter(mappings_train, mappings_validation, output_folder)
     #create_job()
 
 if __name__ == "__main__":
     output_folder = input('Path to the folder where the training and validation data will be stored:')
-    main(mappings_train,mappings_validation,output_folder)
+    with instrumentation.stage('creation_ft'):
+        if SPLIT_METHOD == 'hash':
+            main(corpus_split.iter_partition('train'),corpus_split.iter_partition('validation'),output_folder)
+        else:
+            main(mappings_train,mappings_validation,output_folder)
@@ -1,11 +1,17 @@
 import json #use json data
+import numpy as np #array manipulation
 import pandas as pd #dataframe manipulation
 from pandas import read_csv
 
+from ontology_ids import ONTOLOGIES
+import reference_lookup #labels answered by the lookup instead of the model
+import instrumentation #spans and profiles of the run
+
+@instrumentation.traced('parse results')
 def process_json_results(file_path):
     """
     Convert the archive results.json obtained from the different models into a DataFrame. It also quantized the cases where the model
-    do not use the correct output format.
+    do not use the correct output format. Labels answered by the reference lookup (see reference_lookup.save_sources) are left out.
 
     Parameters:
         file_path (str): Path to the results to the model.
@@ -14,6 +20,10 @@ def process_json_results(file_path):
 
     with open(file_path, 'r') as archivo:
         results_model = json.load(archivo)
+    from_lookup = reference_lookup.lookup_labels(file_path)
+    if from_lookup:
+        results_model = {label: identifiers for label, identifiers in results_model.items() if label not in from_lookup}
+        print('Outputs answered by the reference lookup, left out:', len(from_lookup))
 
     l_l = []
     for label, identifiers in results_model.items():
@@ -30,6 +40,7 @@ def process_json_results(file_path):
     print('The following number of model outputs do not meet the required format:', len(model_error))
     return mappings_model
 
+@instrumentation.traced('comparison frame')
 def get_df_comparison(path, mappings_test):
     """
     Obtain a unique DataFrame for comparing reference identifiers and the model identifiers.
@@ -49,17 +60,57 @@ def get_df_comparison(path, mappings_test):
 
     for column in df_comparison:
         df_comparison[column] = df_comparison[column].fillna('unknown') #replace na values with the string 'unknown'
+    return categorical_identifiers(df_comparison)
+
+def categorical_identifiers(df_comparison):
+    """
+    Store the identifier columns (and 'Type') as categoricals. The reference and model columns of an ontology
+    share their categories, so each identifier is stored once and comparing both columns compares integer codes.
+    '-' and 'unknown' are always categories, so filling missing values with them keeps working.
+
+    Parameters:
+        df_comparison (DataFrame): Comparison DataFrame with the reference ('_C') and model ('_M') identifiers.
+    """
+    groups = [[f'{suffix}_C', f'{suffix}_M'] for suffix in ONTOLOGIES] + [['Type']]
+    for columns in groups:
+        columns = [column for column in columns if column in df_comparison.columns]
+        values = np.concatenate([df_comparison[column].to_numpy(dtype=object) for column in columns] +
+                                [np.array(['-', 'unknown'], dtype=object)])
+        codes, categories = pd.factorize(values) #one hashing pass for all the columns of the group
+        for i, column in enumerate(columns):
+            df_comparison[column] = pd.Categorical.from_codes(codes[i * len(df_comparison):(i + 1) * len(df_comparison)], categories=categories)
     return df_comparison
 
-mappings_test = read_csv('./finetuning_process/mappings_test.csv',header=0)
-df_comparison_gpt35= get_df_comparison('results/results__gpt3_5.json', mappings_test)
-df_comparison_gpt4= get_df_comparison('results/results__gpt4.json', mappings_test)
-df_comparison_gpt4o= get_df_comparison('results/results__gpt4_o.json', mappings_test)
-df_comparison_ft_gpt35= get_df_comparison('results/results_ft_35.json', mappings_test)
-df_comparison_ft_gpt4o= get_df_comparison('results/results_ft_4o.json', mappings_test)
-df_comparison_ft_gpt4o_mini= get_df_comparison('results/results_ft_4o_mini.json', mappings_test)
-df_comparison_ft_gpt4o_mini.to_csv('./results/df_ft_4o_mini_annotation.csv',index=False)
-df_comparison_ft_gpt4o_mini_descriptions= read_csv("./results/df_ft_4o_mini_descriptions.csv",header=0)
+REFERENCE_PATH = './finetuning_process/mappings_test.csv'
+RESULT_FILES = {
+    'df_comparison_gpt35': 'results/results__gpt3_5.json',
+    'df_comparison_gpt4': 'results/results__gpt4.json',
+    'df_comparison_gpt4o': 'results/results__gpt4_o.json',
+    'df_comparison_ft_gpt35': 'results/results_ft_35.json',
+    'df_comparison_ft_gpt4o': 'results/results_ft_4o.json',
+    'df_comparison_ft_gpt4o_mini': 'results/results_ft_4o_mini.json',
+}
+_frames = {}
 
+def __getattr__(name):
+    """
+    Build the module-level frames (mappings_test and the df_comparison_* frames) on first access instead of at
+    import, so importing a function of this module does not parse every results file.
 
+    Parameters:
+        name (str): Name of the attribute.
+    """
+    if name not in _frames:
+        if name == 'mappings_test':
+            _frames[name] = read_csv(REFERENCE_PATH,header=0)
+        elif name in RESULT_FILES:
+            _frames[name] = get_df_comparison(RESULT_FILES[name], __getattr__('mappings_test'))
+        elif name == 'df_comparison_ft_gpt4o_mini_descriptions':
+            _frames[name] = read_csv("./results/df_ft_4o_mini_descriptions.csv",header=0)
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _frames[name]
 
+if __name__ == "__main__":
+    with instrumentation.stage('df_comparison'):
+        __getattr__('df_comparison_ft_gpt4o_mini').to_csv('./results/df_ft_4o_mini_annotation.csv',index=False) #input of class_names.py and ontology_hierarchy.py
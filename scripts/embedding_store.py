@@ -0,0 +1,191 @@
+import os #interact with the operating system
+import re #regular expressions
+import json #use json data
+import hashlib #text keys
+from contextlib import contextmanager
+import numpy as np #array manipulation
+
+from ontology_files import CACHE_DIR
+
+try:
+    import fcntl #file locks (POSIX)
+except ImportError:
+    fcntl = None
+    import msvcrt #file locks (Windows)
+
+STORE_DIR = os.path.join(CACHE_DIR, 'embeddings')
+
+settings = {
+    'directory': STORE_DIR,
+    'dtype': 'float16', #'float16' halves the store, 'float32' keeps the embeddings exact
+}
+stats = {'hits': 0, 'misses': 0}
+_stores = {}
+
+def configure(**options):
+    """
+    Change the store settings.
+
+    Parameters:
+        options: Any of 'directory' and 'dtype'.
+    """
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown embedding store settings: {sorted(unknown)}")
+    settings.update(options)
+    _stores.clear()
+
+def text_keys(texts):
+    """
+    Key of each text in the store: the first 8 bytes of its BLAKE2 hash, as int64.
+
+    Parameters:
+        texts (list): Texts to key.
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+                     for text in texts], dtype=np.int64)
+
+def _model_dir(model_name):
+    """
+    Folder of the embeddings of a model.
+    """
+    return os.path.join(settings['directory'], re.sub(r'[^0-9A-Za-z_.-]+', '_', model_name))
+
+@contextmanager
+def _locked(path):
+    """
+    Hold an exclusive lock on a file while appending to the store. Readers never take it.
+    """
+    with open(path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _refresh(model_name):
+    """
+    Load the rows of a model appended since the last call (by this or another process). The vectors are
+    written before their keys, so a key is only visible once its vector is complete.
+
+    Returns:
+        dict: 'meta' (dimension and dtype), 'vectors' (memory-mapped matrix), 'keys' (key of each row) and
+              'order' (rows sorted by key), or None if nothing has been stored for the model.
+    """
+    directory = _model_dir(model_name)
+    meta_path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    store = _stores.get(model_name)
+    if store is None:
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+        store = {'meta': meta, 'keys': np.empty(0, dtype=np.int64), 'vectors': None, 'order': np.empty(0, dtype=np.int64)}
+        _stores[model_name] = store
+    keys_path = os.path.join(directory, 'keys.bin')
+    keys = np.empty(0, dtype=np.int64)
+    if os.path.exists(keys_path):
+        with open(keys_path, 'rb') as file:
+            content = file.read()
+        keys = np.frombuffer(content[:len(content) - len(content) % 8], dtype=np.int64) #complete keys only
+    if len(keys) != len(store['keys']):
+        store['keys'] = keys
+        store['order'] = np.argsort(keys, kind='stable')
+        store['vectors'] = np.memmap(os.path.join(directory, 'vectors.bin'), dtype=store['meta']['dtype'], mode='r',
+                                     shape=(len(keys), store['meta']['dimension']))
+    return store
+
+def find_rows(model_name, keys):
+    """
+    Find the rows of several text keys.
+
+    Parameters:
+        model_name (str): Name of the embedding model.
+        keys (np.ndarray): Keys returned by text_keys.
+
+    Returns:
+        np.ndarray: Row of each key, -1 if it is not stored.
+    """
+    store = _refresh(model_name)
+    rows = np.full(len(keys), -1, dtype=np.int64)
+    if store is None or not len(store['keys']):
+        return rows
+    sorted_keys = store['keys'][store['order']]
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    found = sorted_keys[positions] == keys
+    rows[found] = store['order'][positions[found]]
+    return rows
+
+def append(model_name, texts, embeddings):
+    """
+    Append the embeddings of new texts to the store of a model. Texts already stored (e.g., by another
+    process in the meantime) are skipped.
+
+    Parameters:
+        model_name (str): Name of the embedding model.
+        texts (list): Texts of the embeddings.
+        embeddings (np.ndarray): One embedding per text.
+    """
+    directory = _model_dir(model_name)
+    os.makedirs(directory, exist_ok=True)
+    embeddings = np.asarray(embeddings)
+    with _locked(os.path.join(directory, 'lock')):
+        meta_path = os.path.join(directory, 'meta.json')
+        if not os.path.exists(meta_path):
+            with open(meta_path, 'w') as file:
+                json.dump({'model': model_name, 'dimension': int(embeddings.shape[1]), 'dtype': settings['dtype']}, file)
+        keys = text_keys(texts)
+        new = np.zeros(len(keys), dtype=bool)
+        new[np.unique(keys, return_index=True)[1]] = True #first copy of repeated texts
+        new &= find_rows(model_name, keys) == -1
+        if not new.any():
+            return
+        store = _refresh(model_name)
+        dtype = store['meta']['dtype']
+        vectors_path = os.path.join(directory, 'vectors.bin')
+        with open(vectors_path, 'a+b') as file:
+            file.truncate(len(store['keys']) * store['meta']['dimension'] * np.dtype(dtype).itemsize) #drop rows of an interrupted append
+            file.write(np.ascontiguousarray(embeddings[new], dtype=dtype).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        with open(os.path.join(directory, 'keys.bin'), 'ab') as file:
+            file.write(keys[new].tobytes())
+
+def get_embeddings(model_name, texts, encode):
+    """
+    Get the embeddings of several texts, encoding (once, in one call) only the texts not stored yet.
+
+    Parameters:
+        model_name (str): Name of the embedding model.
+        texts (list): Texts to embed.
+        encode (callable): Function encoding a list of texts into a matrix with one embedding per row.
+
+    Returns:
+        np.ndarray: float32 matrix with the embedding of each text, in the same order.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    keys = text_keys(texts)
+    rows = find_rows(model_name, keys)
+    missing = list(dict.fromkeys(text for text, row in zip(texts, rows) if row == -1))
+    stats['hits'] += len(texts) - int((rows == -1).sum())
+    stats['misses'] += len(missing)
+    if missing:
+        append(model_name, missing, encode(missing))
+        rows = find_rows(model_name, keys)
+    return np.asarray(_stores[model_name]['vectors'][rows], dtype=np.float32)
+
+def report():
+    """
+    Print the store statistics of this run.
+    """
+    print("Embeddings from the store:", stats['hits'], " encoded:", stats['misses'])
@@ -0,0 +1,99 @@
+import os #interact with the operating system
+import sys
+import glob
+import json #use json data
+import time
+import argparse #command line
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd #dataframe manipulation
+
+from df_comparison import REFERENCE_PATH, get_df_comparison
+from models_comparison import get_accuracy
+from id_validation import hallucination_rates
+from ontology_ids import ONTOLOGIES
+import reference_lookup #labels answered by the lookup instead of the model
+import instrumentation #spans and profiles of the run
+
+_reference = None #reference split of the worker, loaded once by its initializer
+
+def _load_reference(reference_path):
+    """
+    Load the reference split once in each worker process.
+
+    Parameters:
+        reference_path (str): Path to the reference mappings (e.g., mappings_test.csv).
+    """
+    global _reference
+    _reference = pd.read_csv(reference_path, header=0)
+
+@instrumentation.traced('evaluate file')
+def evaluate_file(path):
+    """
+    Parse a results file of a model and score it against the reference split of the worker.
+
+    Parameters:
+        path (str): Path to the results of a model (label -> "['CLO_...', 'CL_...', 'UBERON_...', 'BTO_...']").
+
+    Returns:
+        dict: Number of labels answered by the model, labels answered by the reference lookup (left out of every
+              metric), outputs in the wrong format, labels found in the reference, and the precision and the
+              hallucination rate of each ontology.
+    """
+    with open(path, 'r') as file:
+        results = json.load(file)
+    from_lookup = reference_lookup.lookup_labels(path)
+    results = {label: identifiers for label, identifiers in results.items() if label not in from_lookup}
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull): #process_json_results prints its counts
+        df = get_df_comparison(path, _reference.copy()) #get_df_comparison renames the columns of the reference
+    metrics = {'labels': len(results), 'lookup': len(from_lookup),
+               'format_errors': sum(len(identifiers.strip('][').split(', ')) != 4 for identifiers in results.values()),
+               'compared': len(df)}
+    for ontology, precision in get_accuracy(df).items():
+        metrics[f'precision_{ontology}'] = precision
+    for ontology, rate in hallucination_rates(df, ONTOLOGIES).items():
+        metrics[f'hallucination_{ontology}'] = rate
+    return metrics
+
+def evaluate(paths, reference_path=REFERENCE_PATH, max_workers=None):
+    """
+    Score several results files, one file per worker process. Each worker loads the reference split once.
+
+    Parameters:
+        paths (list): Paths to the results files.
+        reference_path (str): Path to the reference mappings.
+        max_workers (int): Number of processes, the number of CPUs by default.
+
+    Returns:
+        DataFrame: One row of metrics per file, indexed by the file name without extension.
+    """
+    paths = sorted(paths)
+    if not paths:
+        return pd.DataFrame()
+    max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_load_reference, initargs=(reference_path,)) as executor:
+        metrics = list(executor.map(evaluate_file, paths))
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    return pd.DataFrame(metrics, index=pd.Index(names, name='results'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate results files of the models against the reference split.")
+    parser.add_argument('patterns', nargs='*', default=['results/results_*.json'],
+                        help="Glob patterns of the results files (default: results/results_*.json).")
+    parser.add_argument('--reference', default=REFERENCE_PATH, help="Reference mappings (default: %(default)s).")
+    parser.add_argument('--jobs', type=int, default=None, help="Number of worker processes (default: all CPUs).")
+    parser.add_argument('--output', default='results/evaluation.csv', help="Combined metrics table (default: %(default)s).")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.patterns for path in glob.glob(pattern)})
+    if not paths:
+        sys.exit(f"No results files match {args.patterns}")
+    start = time.time()
+    table = evaluate(paths, args.reference, args.jobs)
+    print(table.round(3).to_string())
+    print(f"Evaluated {len(paths)} files in {time.time() - start:.2f} seconds")
+    table.to_csv(args.output)
+
+if __name__ == "__main__":
+    with instrumentation.stage('evaluate'):
+        main()
@@ -1,9 +1,10 @@
 from openai import OpenAI #ChatGPT API
-from dotenv import dotenv_values #environment control
+from dotenv import dotenv_values, find_dotenv #environment control
 import json #use json data
 import time
 
-from creation_ft import mappings_test #get test data from previous script
+import reference_lookup #curated labels answered without the model
+import instrumentation #spans and profiles of the run
 
 def load_environment(var):
     """
@@ -12,7 +13,7 @@ def load_environment(var):
     Parameters:
         var (str): Variable to be exported.
     """
-    config = dotenv_values(dotenv_path="../.env")
+    config = dotenv_values(dotenv_path=find_dotenv(usecwd=True)) #.env of the working directory or any parent
     if var == 'key':
         return config['OPENAI_API_KEY']
     if var == 'ft_model_4o':
@@ -35,13 +36,14 @@ def get_openai_response(df,model):
     dicc = {}
     for index, row in df.iterrows():
         label = row['Label']
-        completion = client.chat.completions.create(
-            model=model, #fine-tuning model
-            messages=[
-                {"role": "system", "content": "You are going to assist me in a search of the identifiers of ontologies for a determined label."},
-                {"role": "user", "content": f"For the label {label}, I need you to search the identifiers that better suit the label in the ontologies CLO, CL, UBERON, and BTO."}
-            ]
-        )
+        with instrumentation.span('openai request'):
+            completion = client.chat.completions.create(
+                model=model, #fine-tuning model
+                messages=[
+                    {"role": "system", "content": "You are going to assist me in a search of the identifiers of ontologies for a determined label."},
+                    {"role": "user", "content": f"For the label {label}, I need you to search the identifiers that better suit the label in the ontologies CLO, CL, UBERON, and BTO."}
+                ]
+            )
         out = completion.choices[0].message.content
     
         dicc[label] = out
@@ -59,11 +61,20 @@ def save_results(results,name):
         json.dump(results, json_file, indent=4)
 
 def main():
-    results_4o = get_openai_response(mappings_test,model=load_environment('ft_model_4o_mini'))
+    import creation_ft #training and test data from previous script, split here so work_queue.py imports get_openai_response without it
+    mappings_test = creation_ft.mappings_test
+    index = None
+    if reference_lookup.settings['enabled']: #creation_ft.mappings_ft is only loaded for the lookup
+        index = reference_lookup.build_index(creation_ft.mappings_ft, test=mappings_test) #training labels only
+    model = load_environment('ft_model_4o_mini')
+    results_4o = reference_lookup.get_responses(mappings_test, model, get_openai_response, index)
     save_results(results_4o,'results_ft_4o_mini.json')
+    reference_lookup.save_sources('results_ft_4o_mini.json', model) #labels answered by the lookup, if it is on
+    reference_lookup.report()
 
 if __name__ == "__main__":
     start_time = time.time()  # Start the timer
-    main()  # Execute the main function
+    with instrumentation.stage('get_response_ft'):
+        main()  # Execute the main function
     end_time = time.time()  # Stop the timer
     print(f"Execution time: {end_time - start_time} seconds")
\ No newline at end of file
@@ -2,7 +2,8 @@ from openai import OpenAI #ChatGPT API
 import json #use json data
 from dotenv import dotenv_values #environment control
 
-from creation_ft import mappings_test #get test data from previous script
+import reference_lookup #curated labels answered without the model
+import instrumentation #spans and profiles of the run
 
 def load_environment():
     """
@@ -46,13 +47,14 @@ def get_openai_response(df,model):
         label= row[0]
         prompt = read_prompt_file('prompt_search_id.txt')
         f_prompt = format_prompt(prompt,label)
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are going to assist me in a search of the identifiers of ontologies for a determined label."},
-                {"role": "user", "content": f_prompt }
-            ]
-        )
+        with instrumentation.span('openai request'):
+            completion = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are going to assist me in a search of the identifiers of ontologies for a determined label."},
+                    {"role": "user", "content": f_prompt }
+                ]
+            )
         out=completion.choices[0].message.content
         if label in dicc.keys():
             dicc[label].append(out)
@@ -72,13 +74,23 @@ def save_results(results,name):
         json.dump(results, archivo_json, indent=4)
 
 def main():
-    results_3_5 = get_openai_response(mappings_test,"gpt-3.5-turbo-0125")
-    results_4 = get_openai_response(mappings_test,"gpt-4-turbo")
-    results_4o = get_openai_response(mappings_test,"gpt-4o")
+    import creation_ft #training and test data from previous script, split here so work_queue.py imports get_openai_response without it
+    mappings_test = creation_ft.mappings_test
+    index = None
+    if reference_lookup.settings['enabled']: #creation_ft.mappings_ft is only loaded for the lookup
+        index = reference_lookup.build_index(creation_ft.mappings_ft, test=mappings_test) #training labels only
+    results_3_5 = reference_lookup.get_responses(mappings_test,"gpt-3.5-turbo-0125",get_openai_response,index)
+    results_4 = reference_lookup.get_responses(mappings_test,"gpt-4-turbo",get_openai_response,index)
+    results_4o = reference_lookup.get_responses(mappings_test,"gpt-4o",get_openai_response,index)
     save_results(results_3_5,'results__gpt3_5.json')
     save_results(results_4,'results__gpt4.json')
     save_results(results_4o,'results__gpt4_o.json')
+    reference_lookup.save_sources('results__gpt3_5.json', "gpt-3.5-turbo-0125") #labels answered by the lookup, if it is on
+    reference_lookup.save_sources('results__gpt4.json', "gpt-4-turbo")
+    reference_lookup.save_sources('results__gpt4_o.json', "gpt-4o")
+    reference_lookup.report()
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.stage('get_response_modelsOpenAI'):
+        main()
 
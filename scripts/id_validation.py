@@ -0,0 +1,102 @@
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+import label_index #offline index built from the ontology dumps
+from ontology_ids import ONTOLOGIES, ONTOLOGY_CODES, ACCESSION_MASK, DASH, UNKNOWN, MAX_DIGITS, encode_ids, decode_ids, id_ontology
+import instrumentation #spans and profiles of the run
+
+ID_REGEX = r'^\s*(?:.*/)?(CLO|CL|UBERON|BTO)[_:](\d+)\s*$'
+EMPTY_VALUES = ['-', 'unknown', ''] #no identifier proposed
+
+_valid_keys = {}
+
+def valid_keys(acronym):
+    """
+    Get the sorted accession keys of the classes of an ontology, taken from its label index.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+
+    Returns:
+        np.ndarray: Sorted keys (see ontology_ids.accession_key), or None if the index has not been built.
+    """
+    if acronym not in _valid_keys:
+        index = label_index.load_index(acronym)
+        if index is None:
+            return None
+        keys = np.asarray(index['keys'])
+        _valid_keys[acronym] = np.sort(keys[keys != label_index.EMPTY])
+    return _valid_keys[acronym]
+
+def validate_ids(values, ontology=None):
+    """
+    Tag identifiers in one vectorized pass. Identifiers are encoded as integers (see ontology_ids.encode_ids),
+    so the accession keys of 'CL_0000034'-style identifiers come from their codes and only the distinct
+    values in other forms ('CL:0000034', OBO PURLs, free text) go through the regular expression.
+
+    Parameters:
+        values (iterable): Identifiers as they appear in the frames ('CL_0000034', '-', 'unknown'...).
+        ontology (str): If given, identifiers of any other ontology are tagged as malformed.
+
+    Returns:
+        pd.Series: 'valid', 'unknown' (well formed but not a class of the ontology), 'malformed', 'empty'
+                   ('-' or missing) or 'unchecked' (the label index of the ontology has not been built).
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    uniques, inverse = np.unique(encode_ids(values), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    acronym_codes = id_ontology(uniques)
+    keys = uniques & ACCESSION_MASK
+    status = np.full(len(uniques), 'malformed', dtype=object)
+    status[(uniques == DASH) | (uniques == UNKNOWN)] = 'empty'
+    others = np.flatnonzero(uniques < UNKNOWN)
+    if len(others):
+        text = pd.Series(decode_ids(uniques[others]), dtype=object).astype(str)
+        status[others[text.str.strip().isin(EMPTY_VALUES).to_numpy()]] = 'empty'
+        parts = text.str.extract(ID_REGEX)
+        parsed = parts[0].notna().to_numpy()
+        acronym_codes[others[parsed]] = parts[0][parsed].map(ONTOLOGY_CODES).to_numpy()
+        digits = parts[1][parsed]
+        lengths = digits.str.len().to_numpy()
+        fits = lengths <= MAX_DIGITS #longer accessions would overflow the key, and no class has one
+        keys[others[parsed][fits]] = (digits[fits].astype(np.int64).to_numpy() << 4) | lengths[fits]
+        keys[others[parsed][~fits]] = -1 #never a valid key: tagged as unknown
+    for acronym in ONTOLOGIES:
+        in_ontology = acronym_codes == ONTOLOGY_CODES[acronym]
+        if not in_ontology.any():
+            continue
+        if ontology is not None and acronym != ontology:
+            continue
+        valid = valid_keys(acronym)
+        if valid is None:
+            status[in_ontology] = 'unchecked'
+            continue
+        query = keys[in_ontology]
+        positions = np.minimum(np.searchsorted(valid, query), len(valid) - 1)
+        found = (valid[positions] == query) if len(valid) else np.zeros(len(query), dtype=bool)
+        status[in_ontology] = np.where(found, 'valid', 'unknown')
+    return pd.Series(status[inverse], dtype=object)
+
+@instrumentation.traced('hallucination rates')
+def hallucination_rates(df, suffixes=ONTOLOGIES):
+    """
+    Calculate, for each ontology, the share of identifiers proposed by the model that are not classes of
+    the ontology (unknown or malformed), which the precision counts as ordinary false positives.
+
+    Parameters:
+        df (pd.DataFrame): Comparison DataFrame with the model ('_M') identifiers.
+        suffixes (iterable): Ontologies to evaluate.
+
+    Returns:
+        dict: Hallucination rate for each ontology (None if nothing was proposed or it could not be checked).
+    """
+    rates = {}
+    for suffix in suffixes:
+        pred_col = f'{suffix}_M'
+        if pred_col not in df.columns:
+            rates[suffix] = None
+            continue
+        status = validate_ids(df[pred_col], ontology=suffix)
+        checked = status.isin(['valid', 'unknown', 'malformed'])
+        rates[suffix] = float(status[checked].isin(['unknown', 'malformed']).mean()) if checked.any() else None
+    return rates
@@ -0,0 +1,243 @@
+import os #interact with the operating system
+import sys
+import json #use json data
+import time
+import atexit #trace and summary at the end of the run
+import cProfile #deterministic profiler
+import functools
+import threading
+import tracemalloc #peak memory of each span
+import importlib.util #optional dependencies
+from contextlib import contextmanager, nullcontext
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #traces are written to the same place from any working directory
+TRACE_DIR = os.path.join(ROOT, 'cache', 'traces')
+
+#Instrumentation is off unless INSTRUMENT is set (e.g., INSTRUMENT=1 python scripts/evaluate.py); when it is
+#off, spans are a dictionary lookup. INSTRUMENT_PROFILE=cprofile or pyinstrument also profiles each stage.
+settings = {
+    'enabled': os.environ.get('INSTRUMENT', '') not in ('', '0'),
+    'memory': os.environ.get('INSTRUMENT_MEMORY', '1') != '0', #tracemalloc slows Python code down, it can be left out
+    'profile': os.environ.get('INSTRUMENT_PROFILE', ''), #'', 'cprofile' or 'pyinstrument'
+    'directory': os.environ.get('INSTRUMENT_DIR', TRACE_DIR), #folder of the traces and profiles
+    'max_events': 100000, #spans kept one by one in the trace, the rest are only aggregated
+}
+stats = {} #span name -> calls, wall, cpu, peak_memory, read_bytes, written_bytes
+events = []
+_local = threading.local()
+_lock = threading.Lock()
+_started = {'wall': time.perf_counter(), 'time': time.time()}
+_registered = False
+
+def configure(**options):
+    """
+    Change the instrumentation settings.
+
+    Parameters:
+        options: Any of 'enabled', 'memory', 'profile', 'directory' and 'max_events'.
+    """
+    global _registered
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown instrumentation settings: {sorted(unknown)}")
+    settings.update(options)
+    if settings['profile'] not in ('', 'cprofile', 'pyinstrument'):
+        raise ValueError(f"Unknown profiler: {settings['profile']}")
+    if settings['enabled']:
+        if settings['memory'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if not _registered:
+            atexit.register(finish)
+            _registered = True
+
+def io_counters():
+    """
+    Bytes read and written by this process so far (any file, pipe or socket), or (0, 0) if the platform
+    does not report them.
+    """
+    try:
+        with open('/proc/self/io', 'rb') as file:
+            counters = dict(line.split(b': ') for line in file.read().splitlines())
+        return int(counters[b'rchar']), int(counters[b'wchar'])
+    except (OSError, KeyError, ValueError):
+        if importlib.util.find_spec('psutil') is None:
+            return 0, 0
+        import psutil
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+
+def _stack():
+    """
+    Open spans of the current thread.
+    """
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+@contextmanager
+def _span(name):
+    """
+    Measure a block of code and add it to the statistics and the trace.
+    """
+    stack = _stack()
+    memory = tracemalloc.is_tracing()
+    current = 0
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak) #peak of the parent up to here
+        tracemalloc.reset_peak()
+    frame = {'name': name, 'peak': current}
+    stack.append(frame)
+    read_start, written_start = io_counters()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        read_end, written_end = io_counters()
+        stack.pop()
+        peak = 0
+        if memory:
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            peak = frame['peak'] - current
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        with _lock:
+            total = stats.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0,
+                                            'read_bytes': 0, 'written_bytes': 0})
+            total['calls'] += 1
+            total['wall'] += wall
+            total['cpu'] += cpu
+            total['peak_memory'] = max(total['peak_memory'], peak)
+            total['read_bytes'] += read_end - read_start
+            total['written_bytes'] += written_end - written_start
+            if len(events) < settings['max_events']:
+                events.append({'name': name, 'parent': stack[-1]['name'] if stack else None,
+                               'thread': threading.get_ident(), 'start': start - _started['wall'], 'wall': wall,
+                               'cpu': cpu, 'peak_memory': peak, 'read_bytes': read_end - read_start,
+                               'written_bytes': written_end - written_start})
+
+def span(name):
+    """
+    Context manager measuring a block of code: wall and CPU time, peak traced memory above the start of the
+    block, and bytes read and written by the process. Spans can be nested; CPU time and bytes are those of
+    the whole process, so spans running in parallel threads also count each other's work.
+
+    Parameters:
+        name (str): Name of the span in the summary (e.g., 'openai request', 'parse results').
+    """
+    if not settings['enabled']:
+        return nullcontext()
+    return _span(name)
+
+def traced(name=None):
+    """
+    Decorator measuring every call of a function as a span.
+
+    Parameters:
+        name (str): Name of the span, the module and name of the function by default.
+    """
+    def decorator(function):
+        span_name = name or f'{function.__module__}.{function.__qualname__}'
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not settings['enabled']:
+                return function(*args, **kwargs)
+            with _span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _profiler(name):
+    """
+    Start a profiler for a stage, pyinstrument if requested and installed, cProfile otherwise.
+
+    Returns:
+        function: Stops the profiler and writes its profile, or None if profiling is off.
+    """
+    if not settings['profile']:
+        return None
+    os.makedirs(settings['directory'], exist_ok=True)
+    path = os.path.join(settings['directory'], name)
+    if settings['profile'] == 'pyinstrument' and importlib.util.find_spec('pyinstrument') is not None:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        def stop():
+            profiler.stop()
+            with open(path + '.html', 'w') as file:
+                file.write(profiler.output_html())
+        return stop
+    profiler = cProfile.Profile()
+    profiler.enable()
+    def stop():
+        profiler.disable()
+        profiler.dump_stats(path + '.prof')
+    return stop
+
+@contextmanager
+def stage(name):
+    """
+    Span of a whole stage (usually the main function of a script), profiled when settings['profile'] is set.
+    Profiles are written to the instrumentation folder as <name>.prof (cProfile, read with pstats or
+    snakeviz) or <name>.html (pyinstrument).
+
+    Parameters:
+        name (str): Name of the stage.
+    """
+    if not settings['enabled']:
+        yield
+        return
+    with _span(name):
+        stop = _profiler(name)
+        try:
+            yield
+        finally:
+            if stop is not None:
+                stop()
+
+def summary():
+    """
+    Summary table of the spans of this run, by decreasing total wall time.
+    """
+    lines = [f"{'span':<40}{'calls':>9}{'wall s':>11}{'mean ms':>11}{'cpu s':>10}{'peak MB':>10}{'read MB':>10}{'write MB':>10}"]
+    for name, total in sorted(stats.items(), key=lambda item: -item[1]['wall']):
+        lines.append(f"{name[:39]:<40}{total['calls']:>9}{total['wall']:>11.3f}{1000 * total['wall'] / total['calls']:>11.3f}"
+                     f"{total['cpu']:>10.3f}{total['peak_memory'] / 2**20:>10.1f}{total['read_bytes'] / 2**20:>10.1f}"
+                     f"{total['written_bytes'] / 2**20:>10.1f}")
+    return '\n'.join(lines)
+
+def write_trace(path=None):
+    """
+    Write the spans of this run as JSON: the run (script, arguments, process, start), the totals of each
+    span and the spans one by one (up to settings['max_events']).
+
+    Parameters:
+        path (str): Path of the trace, <directory>/<script>_<pid>.json by default.
+
+    Returns:
+        str: Path of the trace.
+    """
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0].lstrip('-') or 'python' #'-c' runs are named 'c'
+    path = path or os.path.join(settings['directory'], f'{script}_{os.getpid()}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _lock:
+        trace = {'run': {'script': sys.argv[0], 'args': sys.argv[1:], 'pid': os.getpid(), 'started': _started['time'],
+                         'wall': time.perf_counter() - _started['wall'], 'memory': tracemalloc.is_tracing(),
+                         'dropped_events': sum(total['calls'] for total in stats.values()) - len(events)},
+                 'spans': stats, 'events': events}
+        with open(path, 'w') as file:
+            json.dump(trace, file, indent=1)
+    return path
+
+def finish():
+    """
+    Write the trace and print the summary table, at the end of an instrumented run.
+    """
+    if not settings['enabled'] or not stats:
+        return
+    print(summary())
+    print("Trace written to", write_trace())
+
+configure()
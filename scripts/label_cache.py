@@ -0,0 +1,196 @@
+import os #interact with the operating system
+import sqlite3 #persistent cache
+import time
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+import bioportal #pooled BioPortal client
+import label_index #offline labels from the ontology dumps
+import id_validation #identifiers that do not exist in the ontology dumps
+from ontology_files import CACHE_DIR
+from ontology_ids import normalize_id
+
+CACHE_PATH = os.path.join(CACHE_DIR, 'labels.sqlite')
+TTL = 30 * 24 * 3600 #seconds a cached class name is trusted
+
+settings = {
+    'path': CACHE_PATH,
+    'ttl': TTL,
+    'check_versions': True, #entries fetched from another version of the ontology are refreshed
+    'provider': 'auto', #'auto': offline index when built, then cache and BioPortal; 'offline' or 'bioportal' only
+}
+stats = {'offline': 0, 'hits': 0, 'misses': 0}
+_connection = None
+_versions = {}
+
+def configure(**options):
+    """
+    Change the cache settings.
+
+    Parameters:
+        options: Any of 'path', 'ttl', 'check_versions' and 'provider'.
+    """
+    global _connection
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown cache settings: {sorted(unknown)}")
+    settings.update(options)
+    _connection = None
+
+def get_connection():
+    """
+    Open (once) the SQLite cache, creating it if needed. WAL mode lets several runs read it at the same time.
+    """
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(settings['path']) or '.', exist_ok=True)
+        _connection = sqlite3.connect(settings['path'], timeout=30)
+        _connection.execute('PRAGMA journal_mode=WAL')
+        _connection.execute('''CREATE TABLE IF NOT EXISTS labels (
+            class_id TEXT PRIMARY KEY,
+            ontology TEXT NOT NULL,
+            label TEXT NOT NULL,
+            version TEXT,
+            fetched_at REAL NOT NULL)''')
+        _connection.commit()
+    return _connection
+
+def current_version(ontology_acronym):
+    """
+    Get the current version of an ontology, asked to BioPortal once per run.
+
+    Parameters:
+        ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
+    """
+    if not settings['check_versions']:
+        return None
+    if ontology_acronym not in _versions:
+        _versions[ontology_acronym] = bioportal.get_ontology_version(ontology_acronym)
+    return _versions[ontology_acronym]
+
+def lookup(lookups):
+    """
+    Get the cached class names that are still fresh.
+
+    Parameters:
+        lookups (list): (ontology_acronym, class_id) tuples.
+
+    Returns:
+        dict: Class name for each class_id found in the cache.
+    """
+    class_ids = list({class_id for _, class_id in lookups})
+    connection = get_connection()
+    rows = []
+    for i in range(0, len(class_ids), 500): #SQLite limit of variables per query
+        chunk = class_ids[i:i + 500]
+        rows.extend(connection.execute(
+            f"SELECT class_id, ontology, label, version, fetched_at FROM labels WHERE class_id IN ({','.join('?' * len(chunk))})",
+            chunk).fetchall())
+    oldest = time.time() - settings['ttl']
+    found = {}
+    for class_id, ontology, label, version, fetched_at in rows:
+        latest = current_version(ontology)
+        if fetched_at >= oldest and (latest is None or version == latest):
+            found[class_id] = label
+    return found
+
+def store(entries):
+    """
+    Save class names in the cache, stamped with the current time and ontology version.
+
+    Parameters:
+        entries (list): (ontology_acronym, class_id, class_name) tuples. Failed lookups (None) are not saved.
+    """
+    now = time.time()
+    connection = get_connection()
+    connection.executemany(
+        'INSERT OR REPLACE INTO labels (class_id, ontology, label, version, fetched_at) VALUES (?, ?, ?, ?, ?)',
+        [(class_id, ontology, label, current_version(ontology), now) for ontology, class_id, label in entries
+         if label is not None])
+    connection.commit()
+
+def get_class_names(lookups):
+    """
+    Retrieve class names from the offline label index, then from the cache, asking BioPortal (concurrently)
+    only for those missing or stale.
+
+    Parameters:
+        lookups (list): (ontology_acronym, class_id) tuples.
+
+    Returns:
+        list: The class name of each lookup (None if it could not be retrieved), in the same order.
+    """
+    names = [None] * len(lookups)
+    if settings['provider'] != 'bioportal':
+        names = label_index.get_class_names(lookups)
+        stats['offline'] += len({lookup_ for lookup_, name in zip(lookups, names) if name is not None})
+        if settings['provider'] == 'offline':
+            return names
+    remaining = list(dict.fromkeys(lookup_ for lookup_, name in zip(lookups, names) if name is None)) #each identifier counted once
+    if not remaining:
+        return names
+
+    found = lookup(remaining)
+    missing = [lookup_ for lookup_ in remaining if lookup_[1] not in found]
+    stats['hits'] += len(remaining) - len(missing)
+    stats['misses'] += len(missing)
+    fetched = bioportal.get_class_names(missing)
+    store([(ontology, class_id, label) for (ontology, class_id), label in zip(missing, fetched)])
+    found.update({class_id: label for (_, class_id), label in zip(missing, fetched)})
+    return [name if name is not None else found.get(class_id) for name, (_, class_id) in zip(names, lookups)]
+
+def resolve_identifiers(values):
+    """
+    Retrieve the class names of a collection of identifiers (e.g., every cell of a comparison frame),
+    resolving each unique normalized identifier only once and filling the rest with a vectorized map.
+    Identifiers that are not classes of their ontology (according to the local dumps) are not looked up.
+
+    Parameters:
+        values (iterable): Identifiers as they appear in the frames ('CL_0000034', '-', 'unknown'...).
+
+    Returns:
+        np.ndarray: The class name of each value, '-' for values that are not identifiers of the ontologies
+                    under study and None for unknown identifiers or identifiers that could not be retrieved.
+    """
+    codes, uniques = pd.factorize(pd.Series(list(values), dtype=object), use_na_sentinel=False)
+    normalized = [normalize_id(value) for value in uniques]
+    class_ids = list(dict.fromkeys(class_id for class_id in normalized if class_id is not None))
+    status = id_validation.validate_ids(class_ids).tolist()
+    names = {class_id: None for class_id, tag in zip(class_ids, status) if tag == 'unknown'}
+    lookups = [(class_id.split(':')[0], class_id) for class_id in class_ids if class_id not in names]
+    names.update(zip([class_id for _, class_id in lookups], get_class_names(lookups)))
+    resolved = np.array([names[class_id] if class_id is not None else '-' for class_id in normalized], dtype=object)
+    occurrences = int(np.isin(codes, [i for i, class_id in enumerate(normalized) if class_id is not None]).sum())
+    print("Identifier occurrences:", occurrences, " unique identifiers resolved:", len(lookups),
+          " unknown identifiers skipped:", len(class_ids) - len(lookups),
+          " lookups avoided:", occurrences - len(lookups))
+    return resolved[codes]
+
+def warm(lookups):
+    """
+    Fill the cache in bulk, so later runs resolve these identifiers locally.
+
+    Parameters:
+        lookups (list): (ontology_acronym, class_id) tuples.
+
+    Returns:
+        int: Number of identifiers that had to be fetched.
+    """
+    misses = stats['misses']
+    get_class_names(lookups)
+    return stats['misses'] - misses
+
+def hit_rate():
+    """
+    Get the share of lookups answered locally (offline index or cache) in this run.
+    """
+    total = stats['offline'] + stats['hits'] + stats['misses']
+    return (stats['offline'] + stats['hits']) / total if total > 0 else None
+
+def report():
+    """
+    Print the cache statistics of this run.
+    """
+    rate = hit_rate()
+    print("Class names from the offline index:", stats['offline'], " cache hits:", stats['hits'], " misses:", stats['misses'],
+          " hit rate:", f'{rate:.3f}' if rate is not None else '-')
@@ -0,0 +1,235 @@
+import os #interact with the operating system
+import json #use json data
+import numpy as np #array manipulation
+
+from ontology_files import ONTOLOGY_DIR, CACHE_DIR, ONTOLOGY_FILES, ontology_path, file_hash, iter_terms
+from ontology_ids import split_id, accession_key, accession_from_key, MAX_DIGITS
+
+INDEX_DIR = os.path.join(CACHE_DIR, 'label_index')
+EMPTY = -1 #free slot of the hash table
+GOLDEN = np.uint64(0x9E3779B97F4A7C15) #multiplicative hashing constant
+
+_indexes = {}
+
+def _slots(keys, mask):
+    """
+    Home slot of each key in a table of mask + 1 slots.
+    """
+    keys = np.asarray(keys, dtype=np.int64).astype(np.uint64)
+    return ((keys * GOLDEN) >> np.uint64(32)).astype(np.int64) & mask
+
+def _pack_strings(strings):
+    """
+    Concatenate strings as UTF-8 into one byte array, with the offsets of each string.
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def build_index(acronym, ontology_dir=ONTOLOGY_DIR, index_dir=INDEX_DIR):
+    """
+    Build the label index of an ontology from its local dump: an open addressing hash table from the
+    accession key to a row, and the preferred labels and synonyms of each row as UTF-8 blobs.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+        ontology_dir (str): Folder containing the dumps.
+        index_dir (str): Folder where the indexes are stored.
+
+    Returns:
+        int: Number of classes in the index.
+    """
+    keys, labels, synonyms = [], [], []
+    for term in iter_terms(ontology_path(acronym, ontology_dir)):
+        parts = split_id(term['id'])
+        if parts is None or parts[0] != acronym or term['name'] is None or len(parts[1]) > MAX_DIGITS:
+            continue
+        keys.append(accession_key(parts[1]))
+        labels.append(term['name'])
+        synonyms.append('\n'.join(term['synonyms']))
+
+    size = 1 << max(4, (2 * len(keys) - 1).bit_length()) #load factor below 0.5
+    mask = size - 1
+    table = np.full(size, EMPTY, dtype=np.int64)
+    rows = np.full(size, EMPTY, dtype=np.int32)
+    for row, (key, slot) in enumerate(zip(keys, _slots(keys, mask).tolist())):
+        while table[slot] != EMPTY and table[slot] != key:
+            slot = (slot + 1) & mask
+        table[slot] = key #a repeated class keeps its last stanza
+        rows[slot] = row
+
+    os.makedirs(index_dir, exist_ok=True)
+    label_blob, label_offsets = _pack_strings(labels)
+    synonym_blob, synonym_offsets = _pack_strings(synonyms)
+    arrays = {'keys': table, 'rows': rows, 'labels': label_blob, 'label_offsets': label_offsets,
+              'synonyms': synonym_blob, 'synonym_offsets': synonym_offsets}
+    for name, array in arrays.items():
+        np.save(os.path.join(index_dir, f'{acronym}.{name}.npy'), array)
+    _indexes.pop(acronym, None)
+    return len(keys)
+
+def update_indexes(ontology_dir=ONTOLOGY_DIR, index_dir=INDEX_DIR):
+    """
+    Build the label indexes of the ontologies whose dump changed (by file hash) since the last build.
+
+    Parameters:
+        ontology_dir (str): Folder containing the dumps.
+        index_dir (str): Folder where the indexes are stored.
+
+    Returns:
+        list: Acronyms of the rebuilt indexes.
+    """
+    manifest_path = os.path.join(index_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    rebuilt = []
+    for acronym in ONTOLOGY_FILES:
+        path = ontology_path(acronym, ontology_dir)
+        if not os.path.exists(path):
+            continue
+        source_hash = file_hash(path)
+        if manifest.get(acronym, {}).get('source_hash') == source_hash:
+            continue
+        manifest[acronym] = {'source_hash': source_hash, 'classes': build_index(acronym, ontology_dir, index_dir)}
+        rebuilt.append(acronym)
+        with open(manifest_path, 'w') as file: #saved after each ontology, so an interrupted build resumes
+            json.dump(manifest, file, indent=4)
+    return rebuilt
+
+def load_index(acronym, index_dir=INDEX_DIR):
+    """
+    Load (once) the prebuilt label index of an ontology as memory-mapped arrays.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+        index_dir (str): Folder where the indexes are stored.
+
+    Returns:
+        dict: The arrays of the index, or None if it has not been built.
+    """
+    if acronym not in _indexes:
+        if not os.path.exists(os.path.join(index_dir, f'{acronym}.keys.npy')):
+            return None
+        _indexes[acronym] = {name: np.load(os.path.join(index_dir, f'{acronym}.{name}.npy'), mmap_mode='r')
+                             for name in ['keys', 'rows', 'labels', 'label_offsets', 'synonyms', 'synonym_offsets']}
+    return _indexes[acronym]
+
+def find_rows(index, keys):
+    """
+    Find the rows of several accession keys at once, probing the hash table in vectorized rounds.
+
+    Parameters:
+        index (dict): Index returned by load_index.
+        keys (np.ndarray): Accession keys, as returned by ontology_ids.accession_key.
+
+    Returns:
+        np.ndarray: Row of each key, -1 if the class is not in the ontology.
+    """
+    table = index['keys']
+    mask = len(table) - 1
+    keys = np.asarray(keys, dtype=np.int64)
+    result = np.full(len(keys), EMPTY, dtype=np.int64)
+    slots = _slots(keys, mask)
+    pending = np.arange(len(keys))
+    while len(pending):
+        found = table[slots] == keys[pending]
+        result[pending[found]] = index['rows'][slots[found]]
+        probing = ~found & (table[slots] != EMPTY)
+        pending = pending[probing]
+        slots = (slots[probing] + 1) & mask
+    return result
+
+def _text(blob, offsets, row):
+    """
+    Decode the string of a row from a UTF-8 blob.
+    """
+    return bytes(blob[offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+def get_class_name(ontology_acronym, class_id):
+    """
+    Retrieve the class name of an identifier from the local label index.
+
+    Parameters:
+        ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
+        class_id (str): The identifier for the class within the ontology.
+
+    Returns:
+        str: The name of the class, or None if it is not in the index.
+    """
+    return get_class_names([(ontology_acronym, class_id)])[0]
+
+def get_class_names(lookups):
+    """
+    Retrieve the class names of several identifiers from the local label indexes.
+
+    Parameters:
+        lookups (list): (ontology_acronym, class_id) tuples.
+
+    Returns:
+        list: The class name of each lookup (None if it is not in the index), in the same order.
+    """
+    names = [None] * len(lookups)
+    by_ontology = {}
+    for position, (acronym, class_id) in enumerate(lookups):
+        parts = split_id(class_id)
+        if parts is not None and parts[0] == acronym and len(parts[1]) <= MAX_DIGITS: #longer accessions are not in the index
+            by_ontology.setdefault(acronym, []).append((position, accession_key(parts[1])))
+    for acronym, entries in by_ontology.items():
+        index = load_index(acronym)
+        if index is None:
+            continue
+        rows = find_rows(index, [key for _, key in entries])
+        for (position, _), row in zip(entries, rows.tolist()):
+            if row != EMPTY:
+                names[position] = _text(index['labels'], index['label_offsets'], row)
+    return names
+
+def classes(ontology_acronym):
+    """
+    Iterate over the classes of an ontology in its label index.
+
+    Parameters:
+        ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
+
+    Returns:
+        generator: (class_id, label, synonyms) tuples, with identifiers as 'CL_0000034'.
+    """
+    index = load_index(ontology_acronym)
+    if index is None:
+        return
+    used = np.flatnonzero(np.asarray(index['keys']) != EMPTY)
+    for key, row in zip(np.asarray(index['keys'])[used].tolist(), np.asarray(index['rows'])[used].tolist()):
+        synonyms = _text(index['synonyms'], index['synonym_offsets'], row)
+        yield (f'{ontology_acronym}_{accession_from_key(key)}', _text(index['labels'], index['label_offsets'], row),
+               synonyms.split('\n') if synonyms else [])
+
+def get_synonyms(ontology_acronym, class_id):
+    """
+    Retrieve the synonyms of an identifier from the local label index.
+
+    Parameters:
+        ontology_acronym (str): Acronym for the ontology (e.g., 'CL', 'CLO').
+        class_id (str): The identifier for the class within the ontology.
+
+    Returns:
+        list: The synonyms of the class, or None if it is not in the index.
+    """
+    parts = split_id(class_id)
+    index = load_index(ontology_acronym)
+    if parts is None or index is None or len(parts[1]) > MAX_DIGITS:
+        return None
+    row = int(find_rows(index, [accession_key(parts[1])])[0])
+    if row == EMPTY:
+        return None
+    synonyms = _text(index['synonyms'], index['synonym_offsets'], row)
+    return synonyms.split('\n') if synonyms else []
+
+def main():
+    rebuilt = update_indexes()
+    print("Rebuilt label indexes:", rebuilt if rebuilt else "none, all up to date")
+
+if __name__ == "__main__":
+    main()
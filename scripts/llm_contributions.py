@@ -1,92 +1,84 @@
 import json #use json data
+import numpy as np #array manipulation
 import pandas as pd #dataframe manipulation
 
-from pattern_analysis import df_to_dicc 
+from classnames_io import load_classnames
+from pattern_analysis import df_to_dicc, extract_candidates
+import pattern_review #automatic validation of the contributions
+import instrumentation #spans and profiles of the run
 
-count_valid_identifiers=0 #get the count of related identifiers
-count_invalid_identifiers=0
+CONTRIBUTION_SUFFIXES = {'CL': ['CLO', 'CL', 'UBERON', 'BTO'], 'CT': ['CL', 'UBERON', 'BTO'], 'A': ['UBERON', 'BTO']}
 
-def data_process(filename):
+@instrumentation.traced('contributions')
+def contribution_all(types, max_workers=None):
     """
-    Load data from a JSON file and convert it to a structured DataFrame.
+    Process potential contributions by a language model (LLM) to fill missing ontology data
+    for each identifier. Each contribution (label against the proposed class name) is decided by
+    pattern_review, and the uncertain ones are queued for a later human review. The contributions of
+    every type and ontology are extracted with one mask per type and decided together in parallel processes.
 
     Parameters:
-        filename (str): Path to the JSON file containing ontology class data.
+        types (list): The ontology types ('CL', 'CT', or 'A') to process.
+        max_workers (int): Number of processes, the number of CPUs by default.
 
     Returns:
-        pd.DataFrame: A processed DataFrame with columns for different ontology classes and labels.
+        dict: (valid, invalid) number of contributions for each type.
     """
-
-    with open(filename, 'r') as archivo:
-        dict_classes = json.load(archivo)
-    df = pd.DataFrame.from_dict(dict_classes, orient='index')
-    new_row = pd.DataFrame([df.columns], columns=df.columns)
-    df_process = pd.concat([new_row, df], ignore_index=True)
-    df_process.columns = ['CLO_C','CLO_M', 'CL_C','CL_M', 'UBERON_C','UBERON_M','BTO_C','BTO_M']
-    df_process = df_process.drop(0)
-
-    keys=[]
-    for key in dict_classes.keys():
-        keys.append(key)
-    df_process['Label'] = keys #add label column
-    
-    df_process.fillna("", inplace=True) #replace 'Nonetype' values
-
-    return df_process
-
+    data = {}
+    candidates = []
+    for type in types:
+        if type not in CONTRIBUTION_SUFFIXES:
+            raise ValueError("Type not recognized")
+        df = load_classnames(f'pattern_file_{type}.json')
+        true_cols = [f'{suffix}_C' for suffix in CONTRIBUTION_SUFFIXES[type]]
+        pred_cols = [f'{suffix}_M' for suffix in CONTRIBUTION_SUFFIXES[type]]
+        mask = (df[true_cols].to_numpy() == '-') & (df[pred_cols].to_numpy() != '-')
+        type_candidates = extract_candidates(df, true_cols, pred_cols, mask)
+        type_candidates['label'] = df.loc[type_candidates['index'], 'Label'].to_numpy()
+        type_candidates['type'] = type
+        data[type] = df
+        candidates.append(type_candidates)
+    candidates = pd.concat(candidates, ignore_index=True)
+    checks = np.array(pattern_review.decide_many(
+        'contribution',
+        [{'string1': label, 'string2': pred, 'context': {'type': type, 'ontology': control[:-2]}}
+         for label, pred, type, control in zip(candidates['label'], candidates['string2'], candidates['type'], candidates['control'])],
+        max_workers=max_workers), dtype=object)
+
+    counts = {}
+    for type, df in data.items():
+        in_type = (candidates['type'] == type).to_numpy()
+        accepted = candidates[in_type & (checks == 'Y')]
+        for control, group in accepted.groupby('control'):
+            df.loc[group['index'], control] = group['string2'].to_numpy() #the contribution becomes the reference
+        counts[type] = (len(accepted), int((in_type & (checks == 'N')).sum()))
+        dicc = df_to_dicc(df)
+        file_name = f'contribution_file_{type}.json'
+        with open(file_name, 'w') as archive_json:
+            json.dump(dicc, archive_json, indent=4)
+    return counts
 
 def contribution(type):
     """
     Process potential contributions by a language model (LLM) to fill missing ontology data
-    for each identifier.
+    for each identifier (see contribution_all).
 
     Parameters:
         type (str): The ontology type ('CL', 'CT', or 'A') to specify which data to process.
 
+    Returns:
+        tuple: Number of valid and invalid contributions.
     """
-    global count_valid_identifiers,count_invalid_identifiers
-
-    if type == 'CL':
-        df = data_process('pattern_file_CL.json')
-        suffixes = ['CLO', 'CL', 'UBERON', 'BTO']
-    elif type == 'CT':
-        df = data_process('pattern_file_CT.json')
-        suffixes = ['CL', 'UBERON', 'BTO']
-    elif type == 'A':
-        df = data_process('pattern_file_A.json')
-        suffixes = ['UBERON', 'BTO']
-    else:
-        raise ValueError("Type not recognized")
-
-    for suffix in suffixes:
-        true_col = f'{suffix}_C'
-        pred_col = f'{suffix}_M'
-        for index,row in df.iterrows():
-            ref=row[true_col]
-            pred = row[pred_col]
-            if ref == '-' and pred != '-':
-                print(index,suffix,row) 
-                check = input('Is the contribution valid? Y/N \n')
-                if check == 'Y':
-                    df.at[index, true_col] = pred
-                    count_valid_identifiers=count_valid_identifiers+1
-                else:
-                    count_invalid_identifiers=count_invalid_identifiers+1
-    dicc = df_to_dicc(df)
-    file_name = f'contribution_file_{type}.json'
-    with open(file_name, 'w') as archive_json:
-        json.dump(dicc, archive_json, indent=4)
-    return 
+    return contribution_all([type])[type]
 
 def main():
-    #contribution('A')
-    #contribution('CT')
-    contribution('CL')
-    print("Number of valid contributions:", count_valid_identifiers)
+    counts = contribution_all(['A', 'CT', 'CL'])
+    pattern_review.save()
+    pattern_review.report()
+    print("Number of valid contributions:", sum(valid for valid, _ in counts.values()))
     print("\n")
-    print("Number of invalid contribution:",count_invalid_identifiers)
+    print("Number of invalid contribution:", sum(invalid for _, invalid in counts.values()))
 
 if __name__ == "__main__":
-    main()
-
-
+    with instrumentation.stage('llm_contributions'):
+        main()
@@ -1,33 +1,10 @@
-import json  # use json data
+import numpy as np  # array manipulation
 import pandas as pd  # dataframe manipulation
 import matplotlib.pyplot as plt  # data visualization
 
 from class_names import df_dash
-
-def data_process(filename):
-    """
-    Load data from a JSON file and convert it to a structured DataFrame.
-
-    Parameters:
-        filename (str): Path to the JSON file containing ontology class data.
-
-    """
-    with open(filename, 'r') as archivo:
-        dict_classes = json.load(archivo)
-    df = pd.DataFrame.from_dict(dict_classes, orient='index')
-    new_row = pd.DataFrame([df.columns], columns=df.columns)
-    df_process = pd.concat([new_row, df], ignore_index=True)
-    df_process.columns = ['CLO_C', 'CLO_M', 'CL_C', 'CL_M', 'UBERON_C', 'UBERON_M', 'BTO_C', 'BTO_M']
-    df_process = df_process.drop(0)
-
-    keys = []
-    for key in dict_classes.keys():
-        keys.append(key)
-    df_process['Label'] = keys  # add label column
-
-    df_process.fillna("", inplace=True)  # replace 'Nonetype' values
-
-    return df_process
+from classnames_io import load_classnames
+import instrumentation #spans and profiles of the run
 
 
 def match_calculation(type):
@@ -39,15 +16,15 @@ def match_calculation(type):
 
     """
     if type == 'CL':
-        df = data_process('./results/contribution_file_CL.json')
+        df = load_classnames('./results/contribution_file_CL.json')
         col_1 = 'CLO'
         col_2 = 'BTO'
     elif type == 'CT':
-        df = data_process('./results/contribution_file_CT.json')
+        df = load_classnames('./results/contribution_file_CT.json')
         col_1 = 'CL'
         col_2 = 'BTO'
     elif type == 'A':
-        df = data_process('./results/contribution_file_A.json')
+        df = load_classnames('./results/contribution_file_A.json')
         col_1 = 'UBERON'
         col_2 = 'BTO'
     elif type == 'dash':
@@ -78,6 +55,7 @@ def match_calculation(type):
     return index_pm
 
 
+@instrumentation.traced('metrics')
 def calculate_metrics(ontology_type):
     """
     Calculate precision, recall (exhaustiveness), and F1-score for each ontology type.
@@ -90,13 +68,13 @@ def calculate_metrics(ontology_type):
                and F1-score for each ontology.
     """
     if ontology_type == 'CL':
-        df = data_process('./results/contribution_file_CL.json')
+        df = load_classnames('./results/contribution_file_CL.json')
         suffixes = ['CLO', 'CL', 'UBERON', 'BTO']
     elif ontology_type == 'CT':
-        df = data_process('./results/contribution_file_CT.json')
+        df = load_classnames('./results/contribution_file_CT.json')
         suffixes = ['CL', 'UBERON', 'BTO']
     elif ontology_type == 'A':
-        df = data_process('./results/contribution_file_A.json')
+        df = load_classnames('./results/contribution_file_A.json')
         suffixes = ['UBERON', 'BTO']
     elif ontology_type == 'dash':
         df = df_dash
@@ -118,22 +96,22 @@ def calculate_metrics(ontology_type):
         fn = 0
 
         if true_col in df.columns and pred_col in df.columns:
-            for i in range(len(df)):
-                true_val = df.iloc[i][true_col]
-                pred_val = df.iloc[i][pred_col]
-                # Skip rows where both true and predicted values are "-"
-                if true_val == "-" and pred_val == "-":
-                    #print(true_val, pred_val)
-                    tn += 1
-                elif true_val != "-" and pred_val == "-":
-                    #print(true_val, pred_val)
-                    fn += 1
-                elif true_val == pred_val:
-                    #print(true_val, pred_val)
-                    tp += 1
-                elif true_val != pred_val:
-                    print(true_val,"|||",pred_val)
-                    fp += 1
+            # Both columns share integer codes, so every comparison is an integer comparison
+            true_values = df[true_col].to_numpy(dtype=object)
+            pred_values = df[pred_col].to_numpy(dtype=object)
+            codes, uniques = pd.factorize(np.concatenate([true_values, pred_values]))
+            true_codes, pred_codes = codes[:len(df)], codes[len(df):]
+            dash = np.append(np.flatnonzero(uniques == "-"), -2)[0] #-2 if no value is '-'
+            true_dash = true_codes == dash
+            pred_dash = pred_codes == dash
+            equal = (true_codes == pred_codes) & (true_codes >= 0) #missing values are never equal
+            tn = int((true_dash & pred_dash).sum())
+            fn = int((~true_dash & pred_dash).sum())
+            tp = int((~pred_dash & equal).sum())
+            false_pos = np.flatnonzero(~pred_dash & ~equal)
+            fp = len(false_pos)
+            for i in false_pos:
+                print(true_values[i],"|||",pred_values[i])
             print(ontology_type, suffix, "TP:", tp, " FP:", fp, " FN:", fn, " TN:", tn)
             # Calculate metrics if not in 'dash' mode
             if ontology_type != 'dash':
@@ -160,6 +138,7 @@ def calculate_metrics(ontology_type):
     return precisions, recall, f1 , accuracies
 
 
+@instrumentation.traced('plot')
 def plot_combined_metrics():
     """
     Plot the calculated metrics for precision, exhaustiveness, and F1-score for all ontology types (CL, CT, A).
@@ -258,4 +237,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.stage('match_analysis'):
+        main()
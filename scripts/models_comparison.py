@@ -2,8 +2,12 @@ from operator import index
 import pandas as pd #dataframe manipulation
 import matplotlib.pyplot as plt #data visualization
 
-from df_comparison import df_comparison_gpt35, df_comparison_gpt4, df_comparison_gpt4o, df_comparison_ft_gpt35, df_comparison_ft_gpt4o,df_comparison_ft_gpt4o_mini,df_comparison_ft_gpt4o_mini_descriptions
+import df_comparison #comparison frames, built on first access
+from id_validation import hallucination_rates
+from ontology_ids import encode_ids, DASH
+import instrumentation #spans and profiles of the run
 
+@instrumentation.traced('precision')
 def get_accuracy(df):
     """
     Calculate the accuracy for each ontology in the given dataframe.
@@ -24,21 +28,12 @@ def get_accuracy(df):
     for suffix in suffixes: #for each ontology the accuracy is calculated
         true_col = f'{suffix}_C'
         pred_col = f'{suffix}_M'
-        true_pos=0
-        false_pos = 0
         if true_col in df.columns and pred_col in df.columns:
-            for i in range(len(df)):
-                true_val = df.iloc[i][true_col]
-                pred_val = df.iloc[i][pred_col]
-                if true_val == "-" and pred_val == "-":
-                    continue
-                if true_val == pred_val:
-                    true_pos += 1
-                else:
-                    false_pos += 1
-            # Evitar división por cero
-            if (true_pos + false_pos) > 0:
-                accuracy = true_pos / (true_pos + false_pos)
+            true_val = encode_ids(df[true_col]) #integer codes, compared without string comparisons
+            pred_val = encode_ids(df[pred_col])
+            counted = ~((true_val == DASH) & (pred_val == DASH)) #rows where both are '-' are not counted
+            if counted.any():
+                accuracy = float((true_val[counted] == pred_val[counted]).mean())
             else:
                 accuracy = None
             accuracies[suffix] = accuracy
@@ -46,6 +41,19 @@ def get_accuracy(df):
             accuracies[suffix] = None
     return accuracies
 
+def get_hallucination_rates(models_data, model_names):
+    """
+    Get the share of identifiers proposed by each model that do not exist in the ontology, reported
+    apart from the precision, where they count as ordinary false positives.
+
+    Parameters:
+        models_data (list of DataFrame): List of comparison dataframes, one for each model.
+        model_names (list of str): List of model names corresponding to each dataframe in models_data.
+
+    """
+    return pd.DataFrame([hallucination_rates(df) for df in models_data], index=model_names)
+
+@instrumentation.traced('plot')
 def plot_accuracies(models_data, model_names):
     """
     Plot the accuracies of different models for each ontology.
@@ -97,8 +105,14 @@ def main():
     # model_names = ['GPT-3.5', 'GPT-4', 'GPT-4o', 'Ft GPT-3.5', 'Ft GPT-4o','Ft GPT-4o-mini']
     #models_data = [df_comparison_ft_gpt4o_mini,df_comparison_ft_gpt4o_mini_descriptions]
     #model_names = ['Ft GPT-4o-mini','Ft GPT-4o-mini + Descriptions']
-    df_comparison_gpt4o.to_csv("./results/df_4o.csv",index=0)
+    df_comparison.df_comparison_gpt4o.to_csv("./results/df_4o.csv",index=0)
+    models_data = [getattr(df_comparison, name) for name in ['df_comparison_gpt35', 'df_comparison_gpt4', 'df_comparison_gpt4o',
+                   'df_comparison_ft_gpt35', 'df_comparison_ft_gpt4o', 'df_comparison_ft_gpt4o_mini']]
+    model_names = ['GPT-3.5', 'GPT-4', 'GPT-4o', 'Ft GPT-3.5', 'Ft GPT-4o','Ft GPT-4o-mini']
+    print("Hallucinated identifiers by model:")
+    print(get_hallucination_rates(models_data, model_names))
     #plot_accuracies(models_data, model_names)
 
 if __name__ == "__main__":
-    main()
+    with instrumentation.stage('models_comparison'):
+        main()
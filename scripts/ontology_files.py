@@ -0,0 +1,125 @@
+import os #interact with the operating system
+import hashlib #file fingerprints
+import xml.etree.ElementTree as ET #parse OWL (RDF/XML) files
+
+from ontology_ids import normalize_id
+
+ONTOLOGY_DIR = '../ontologies' #local dumps of the ontologies under study
+ONTOLOGY_FILES = {
+    'CLO': 'clo.owl', #CLO is only released as OWL
+    'CL': 'cl.obo',
+    'UBERON': 'uberon.obo',
+    'BTO': 'bto.obo',
+}
+CACHE_DIR = '../cache' #indexes built from the dumps
+
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+RDFS = '{http://www.w3.org/2000/01/rdf-schema#}'
+OWL = '{http://www.w3.org/2002/07/owl#}'
+OBO_IN_OWL = '{http://www.geneontology.org/formats/oboInOwl#}'
+SYNONYM_TAGS = [f'{OBO_IN_OWL}hasExactSynonym', f'{OBO_IN_OWL}hasRelatedSynonym',
+                f'{OBO_IN_OWL}hasBroadSynonym', f'{OBO_IN_OWL}hasNarrowSynonym']
+
+def ontology_path(acronym, ontology_dir=ONTOLOGY_DIR):
+    """
+    Get the path of the local dump of an ontology.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+        ontology_dir (str): Folder containing the dumps.
+    """
+    return os.path.join(ontology_dir, ONTOLOGY_FILES[acronym])
+
+def file_hash(path):
+    """
+    Compute the SHA-256 of a file, used to know whether an index built from it is stale.
+
+    Parameters:
+        path (str): Path to the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _normalize(identifier):
+    """
+    Normalize identifiers of the ontologies under study and keep any other identifier as it is.
+    """
+    normalized = normalize_id(identifier)
+    return normalized if normalized is not None else identifier
+
+def _iter_obo_terms(path):
+    """
+    Yield the [Term] stanzas of an OBO file.
+    """
+    term = None
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('['):
+                if term is not None and term['id']:
+                    yield term
+                term = {'id': None, 'name': None, 'synonyms': [], 'is_a': [], 'obsolete': False} if line == '[Term]' else None
+                continue
+            if term is None or not line or line.startswith('!'):
+                continue
+            tag, _, value = line.partition(':')
+            value = value.strip()
+            if tag == 'id':
+                term['id'] = _normalize(value)
+            elif tag == 'name':
+                term['name'] = value
+            elif tag == 'synonym':
+                term['synonyms'].append(value.split('"')[1] if value.count('"') >= 2 else value)
+            elif tag == 'is_a':
+                term['is_a'].append(_normalize(value.split('!')[0].split('{')[0].strip()))
+            elif tag == 'is_obsolete':
+                term['obsolete'] = value == 'true'
+    if term is not None and term['id']:
+        yield term
+
+def _iter_owl_terms(path):
+    """
+    Yield the named classes of an OWL file in RDF/XML syntax. Only direct subclass axioms
+    (rdfs:subClassOf with an rdf:resource) are kept as is_a relations.
+    """
+    depth = 0
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1 or element.tag != f'{OWL}Class': #only top level classes
+            if depth == 1:
+                element.clear()
+            continue
+        about = element.get(f'{RDF}about')
+        if about:
+            label = element.find(f'{RDFS}label')
+            deprecated = element.find(f'{OWL}deprecated')
+            yield {
+                'id': _normalize(about),
+                'name': label.text if label is not None else None,
+                'synonyms': [synonym.text for tag in SYNONYM_TAGS for synonym in element.findall(tag) if synonym.text],
+                'is_a': [_normalize(parent.get(f'{RDF}resource')) for parent in element.findall(f'{RDFS}subClassOf')
+                         if parent.get(f'{RDF}resource')],
+                'obsolete': deprecated is not None and deprecated.text == 'true',
+            }
+        element.clear()
+
+def iter_terms(path):
+    """
+    Yield the terms of a local ontology dump in OBO or OWL (RDF/XML) format.
+
+    Parameters:
+        path (str): Path to the .obo or .owl file.
+
+    Returns:
+        generator: Dictionaries with the keys 'id', 'name', 'synonyms', 'is_a' and 'obsolete'. Identifiers of
+                   the ontologies under study are normalized to the 'ACRONYM:accession' form.
+    """
+    if path.endswith('.obo'):
+        return _iter_obo_terms(path)
+    return _iter_owl_terms(path)
@@ -0,0 +1,218 @@
+import os #interact with the operating system
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+from ontology_files import ONTOLOGY_DIR, CACHE_DIR, ontology_path, file_hash, iter_terms
+from ontology_ids import normalize_id
+import instrumentation #spans and profiles of the run
+
+CLOSURE_VERSION = 2 #bumped when build_closure changes, so cached closures are rebuilt (2: diamonds keep all their ancestors)
+
+def build_closure(terms):
+    """
+    Build the transitive is_a closure of an ontology as a CSR structure over integer-encoded identifiers.
+
+    Parameters:
+        terms (iterable): Terms as returned by ontology_files.iter_terms.
+
+    Returns:
+        dict: 'ids' (sorted identifiers, the position is the integer code), 'indptr', 'indices' and 'dists'.
+              The ancestors of node i (itself included) are indices[indptr[i]:indptr[i+1]], sorted, and
+              dists holds the length of the shortest is_a path to each of them.
+    """
+    parents = {}
+    for term in terms:
+        if term['obsolete']:
+            continue
+        parents.setdefault(term['id'], set()).update(term['is_a'])
+        for parent in term['is_a']:
+            parents.setdefault(parent, set())
+    ids = sorted(parents)
+    code = {identifier: i for i, identifier in enumerate(ids)}
+    parent_codes = [[code[parent] for parent in parents[identifier] if parent != identifier] for identifier in ids]
+
+    # Ancestors are resolved parents first (iterative post-order DFS) so each node is visited once: a node
+    # is closed when it comes back to the top of the stack, after all the parents pushed above it
+    unseen, visiting, done = 0, 1, 2
+    state = [unseen] * len(ids)
+    ancestors = [None] * len(ids)
+    for start in range(len(ids)):
+        stack = [start]
+        while stack:
+            node = stack[-1]
+            if state[node] == done:
+                stack.pop()
+                continue
+            if state[node] == unseen:
+                state[node] = visiting
+                pending = [parent for parent in parent_codes[node] if state[parent] == unseen]
+                if pending:
+                    stack.extend(pending)
+                    continue
+            stack.pop()
+            state[node] = done
+            closure = {node: 0}
+            for parent in parent_codes[node]:
+                for ancestor, dist in (ancestors[parent] or {}).items(): #a parent still visiting is on the current path (a cycle): cut, not followed
+                    if dist + 1 < closure.get(ancestor, len(ids)):
+                        closure[ancestor] = dist + 1
+            ancestors[node] = closure
+
+    lengths = np.fromiter((len(closure) for closure in ancestors), dtype=np.int64, count=len(ids))
+    indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    dists = np.empty(indptr[-1], dtype=np.int16)
+    for node, closure in enumerate(ancestors):
+        order = sorted(closure)
+        indices[indptr[node]:indptr[node + 1]] = order
+        dists[indptr[node]:indptr[node + 1]] = [closure[ancestor] for ancestor in order]
+    return {'ids': np.array(ids), 'indptr': indptr, 'indices': indices, 'dists': dists}
+
+def load_closure(acronym, ontology_dir=ONTOLOGY_DIR, cache_dir=CACHE_DIR):
+    """
+    Load the is_a closure of an ontology, building it from the local dump only if the cached index is
+    missing or was built from a different version of the file or of build_closure.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+        ontology_dir (str): Folder containing the dumps.
+        cache_dir (str): Folder where the closure indexes are stored.
+    """
+    path = ontology_path(acronym, ontology_dir)
+    source_hash = file_hash(path)
+    cache_file = os.path.join(cache_dir, f'hierarchy_{acronym}.npz')
+    if os.path.exists(cache_file):
+        with np.load(cache_file, allow_pickle=False) as cached:
+            if str(cached['source_hash']) == source_hash and 'version' in cached.files and int(cached['version']) == CLOSURE_VERSION:
+                return {key: cached[key] for key in ['ids', 'indptr', 'indices', 'dists']}
+    closure = build_closure(iter_terms(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_file, source_hash=np.array(source_hash), version=np.array(CLOSURE_VERSION), **closure)
+    return closure
+
+def encode(closure, identifiers):
+    """
+    Map identifiers to the integer codes of the closure.
+
+    Parameters:
+        closure (dict): Closure returned by load_closure.
+        identifiers (iterable): Identifiers in any of the usual forms.
+
+    Returns:
+        np.ndarray: The code of each identifier, -1 for '-' or 'unknown' (no class proposed) and -2 for
+                    identifiers that are not classes of the ontology.
+    """
+    values = pd.Categorical(pd.Series(identifiers, dtype=object))
+    normalized = np.array([normalize_id(value) or '' for value in values.categories], dtype=str)
+    positions = np.minimum(np.searchsorted(closure['ids'], normalized), len(closure['ids']) - 1)
+    found = closure['ids'][positions] == normalized
+    empty = np.isin(np.asarray(values.categories, dtype=str), ['-', 'unknown', ''])
+    category_codes = np.where(found, positions, np.where(empty, -1, -2))
+    codes = np.full(len(values), -1, dtype=np.int64) #missing values count as no class
+    present = values.codes >= 0
+    codes[present] = category_codes[values.codes[present]]
+    return codes
+
+def _expand(closure, nodes):
+    """
+    Expand nodes into (owner, ancestor, distance) arrays, one entry per ancestor of each node.
+    """
+    indptr = closure['indptr']
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    owner = np.repeat(np.arange(len(nodes)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.repeat(starts, lengths) + offsets
+    return owner, closure['indices'][positions], closure['dists'][positions]
+
+def score_pairs(closure, true_codes, pred_codes):
+    """
+    Compute the hierarchical overlap and distance between reference and predicted classes.
+
+    Parameters:
+        closure (dict): Closure returned by load_closure.
+        true_codes (np.ndarray): Codes of the reference classes, as returned by encode.
+        pred_codes (np.ndarray): Codes of the predicted classes, as returned by encode.
+
+    Returns:
+        tuple: Arrays with, for each pair, the number of common ancestors, the number of ancestors of the
+               reference and of the prediction, and the is_a distance through the closest common ancestor
+               (NaN if either class is not in the ontology or they share no ancestor). A class outside the
+               ontology counts as a single node with no ancestors, no class counts as an empty set.
+    """
+    true_codes = np.asarray(true_codes, dtype=np.int64)
+    pred_codes = np.asarray(pred_codes, dtype=np.int64)
+    n_nodes = len(closure['ids'])
+    # Pairs repeat a lot, so the closure is only expanded for the distinct ones
+    pair_keys, inverse = np.unique((true_codes + 2) * (n_nodes + 2) + (pred_codes + 2), return_inverse=True)
+    unique_true = pair_keys // (n_nodes + 2) - 2
+    unique_pred = pair_keys % (n_nodes + 2) - 2
+    sizes = np.diff(closure['indptr'])
+    true_size = np.where(unique_true >= 0, sizes[np.maximum(unique_true, 0)], (unique_true == -2).astype(np.int64))
+    pred_size = np.where(unique_pred >= 0, sizes[np.maximum(unique_pred, 0)], (unique_pred == -2).astype(np.int64))
+
+    common = np.zeros(len(pair_keys), dtype=np.int64)
+    distance = np.full(len(pair_keys), np.nan)
+    both = np.flatnonzero((unique_true >= 0) & (unique_pred >= 0))
+    if len(both):
+        owner_t, ancestor_t, dist_t = _expand(closure, unique_true[both])
+        owner_p, ancestor_p, dist_p = _expand(closure, unique_pred[both])
+        _, index_t, index_p = np.intersect1d(owner_t * n_nodes + ancestor_t, owner_p * n_nodes + ancestor_p,
+                                             assume_unique=True, return_indices=True)
+        owners = owner_t[index_t]
+        common[both] = np.bincount(owners, minlength=len(both))
+        shortest = np.full(len(both), np.inf)
+        np.minimum.at(shortest, owners, dist_t[index_t].astype(np.float64) + dist_p[index_p])
+        distance[both] = np.where(np.isinf(shortest), np.nan, shortest)
+    return common[inverse], true_size[inverse], pred_size[inverse], distance[inverse]
+
+@instrumentation.traced('hierarchical metrics')
+def hierarchical_metrics(df, closures, suffixes=('CLO', 'CL', 'UBERON', 'BTO')):
+    """
+    Calculate hierarchical precision, recall and F1-score and the mean is_a distance for each ontology, so
+    that predicting a parent or a sibling of the reference class gets partial credit.
+
+    Parameters:
+        df (pd.DataFrame): Comparison DataFrame with the reference ('_C') and model ('_M') identifiers.
+        closures (dict): Closure for each ontology acronym, as returned by load_closure.
+        suffixes (iterable): Ontologies to evaluate.
+
+    Returns:
+        dict: Metrics for each ontology.
+    """
+    metrics = {}
+    for suffix in suffixes:
+        true_col = f'{suffix}_C'
+        pred_col = f'{suffix}_M'
+        if true_col not in df.columns or pred_col not in df.columns:
+            metrics[suffix] = None
+            continue
+        closure = closures[suffix]
+        common, true_size, pred_size, distance = score_pairs(closure, encode(closure, df[true_col]),
+                                                             encode(closure, df[pred_col]))
+
+        h_precision = common.sum() / pred_size.sum() if pred_size.sum() > 0 else 0
+        h_recall = common.sum() / true_size.sum() if true_size.sum() > 0 else 0
+        h_f1 = 2 * h_precision * h_recall / (h_precision + h_recall) if (h_precision + h_recall) > 0 else 0
+        metrics[suffix] = {
+            'h_precision': float(h_precision),
+            'h_recall': float(h_recall),
+            'h_f1': float(h_f1),
+            'mean_distance': float(np.nanmean(distance)) if np.isfinite(distance).any() else None,
+            'exact': int((distance == 0).sum()),
+            'parent_or_child': int((distance == 1).sum()),
+        }
+    return metrics
+
+def main():
+    closures = {acronym: load_closure(acronym) for acronym in ['CLO', 'CL', 'UBERON', 'BTO']}
+    df = pd.read_csv('../results/df_ft_4o_mini_annotation.csv', sep=",", header=0)
+    suffixes_by_type = {'CL': ['CLO', 'CL', 'UBERON', 'BTO'], 'CT': ['CL', 'UBERON', 'BTO'], 'A': ['UBERON', 'BTO']}
+    for type, suffixes in suffixes_by_type.items():
+        for suffix, values in hierarchical_metrics(df[df['Type'] == type], closures, suffixes).items():
+            print(type, suffix, values)
+
+if __name__ == "__main__":
+    with instrumentation.stage('ontology_hierarchy'):
+        main()
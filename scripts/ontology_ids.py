@@ -0,0 +1,147 @@
+import re #regular expressions
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+ONTOLOGIES = ['CLO', 'CL', 'UBERON', 'BTO'] #ontologies under study, in the column order of the results
+
+ID_PATTERN = re.compile(r'^(?:.*/)?(CLO|CL|UBERON|BTO)[_:](\d+)$') #accepts CL_0000034, CL:0000034 and OBO PURLs
+
+#Integer codes of the identifiers (see encode_id): the ontology in the bits from ONTOLOGY_SHIFT up and the
+#accession key (see accession_key) below them; '-' and 'unknown' are reserved codes
+ONTOLOGY_CODES = {acronym: code for code, acronym in enumerate(ONTOLOGIES, start=1)}
+ONTOLOGY_SHIFT = 56
+ACCESSION_MASK = (1 << ONTOLOGY_SHIFT) - 1
+DASH = 0 #'-', no identifier proposed
+UNKNOWN = -1 #'unknown' or missing
+MAX_DIGITS = 15 #longest accession an accession key can hold (4 bits of length, the digits below ONTOLOGY_SHIFT)
+CODE_PATTERN = re.compile(rf'^(CLO|CL|UBERON|BTO)_(\d{{1,{MAX_DIGITS}}})$') #only this exact form is packed, so decoding gives back the same string
+
+_other_codes = {} #any other string -> its code (-2, -3...), shared by all the frames of the process
+_other_values = []
+
+def split_id(identifier):
+    """
+    Split an ontology identifier into its ontology acronym and its accession.
+
+    Parameters:
+        identifier (str): Identifier in any of the usual forms (e.g., 'CL_0000034', 'CL:0000034').
+
+    Returns:
+        tuple: (acronym, accession) as strings, or None if the identifier is not a valid identifier
+               of one of the ontologies under study.
+    """
+    if not isinstance(identifier, str):
+        return None
+    match = ID_PATTERN.match(identifier.strip())
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+def normalize_id(identifier):
+    """
+    Normalize an ontology identifier to the 'ACRONYM:accession' form used by BioPortal and the OBO files.
+
+    Parameters:
+        identifier (str): Identifier in any of the usual forms.
+
+    Returns:
+        str: The normalized identifier, or None if the identifier is not valid.
+    """
+    parts = split_id(identifier)
+    if parts is None:
+        return None
+    return f'{parts[0]}:{parts[1]}'
+
+def accession_key(accession):
+    """
+    Encode the accession of an identifier as an integer. The number of digits is kept in the 4 lowest bits,
+    so 'BTO_000298' and 'BTO_0000298' are different keys. Accessions longer than MAX_DIGITS have no key
+    (no class of the ontologies has one) and must be left out before.
+
+    Parameters:
+        accession (str): Digits of the identifier (e.g., '0000034').
+    """
+    return int(accession) << 4 | len(accession)
+
+def accession_from_key(key):
+    """
+    Decode an accession key (see accession_key) back into the digits of the identifier.
+
+    Parameters:
+        key (int): Accession key.
+    """
+    return str(int(key) >> 4).zfill(int(key) & 15)
+
+
+def encode_id(identifier):
+    """
+    Encode an identifier as an int64: 'CL_0000034' is packed as its ontology code and accession key, '-' is
+    DASH and 'unknown' (or a missing value) is UNKNOWN. Any other string (other forms, free text of the model)
+    gets a negative code of its own, so equal strings always get equal codes and decode_id gives them back.
+
+    Parameters:
+        identifier (str): Value of an identifier column.
+    """
+    if identifier == '-':
+        return DASH
+    if identifier == 'unknown' or identifier is None or (isinstance(identifier, float) and np.isnan(identifier)):
+        return UNKNOWN
+    match = CODE_PATTERN.match(identifier) if isinstance(identifier, str) else None
+    if match is not None:
+        return ONTOLOGY_CODES[match.group(1)] << ONTOLOGY_SHIFT | accession_key(match.group(2))
+    if identifier not in _other_codes:
+        _other_values.append(identifier)
+        _other_codes[identifier] = -1 - len(_other_values)
+    return _other_codes[identifier]
+
+def decode_id(code):
+    """
+    Decode a code (see encode_id) back into the identifier.
+
+    Parameters:
+        code (int): Code of the identifier.
+    """
+    code = int(code)
+    if code == DASH:
+        return '-'
+    if code == UNKNOWN:
+        return 'unknown'
+    if code < UNKNOWN:
+        return _other_values[-2 - code]
+    return f'{ONTOLOGIES[(code >> ONTOLOGY_SHIFT) - 1]}_{accession_from_key(code & ACCESSION_MASK)}'
+
+def encode_ids(values):
+    """
+    Encode a column of identifiers, parsing each distinct value once.
+
+    Parameters:
+        values (iterable): Identifiers (a categorical column only has its categories parsed).
+
+    Returns:
+        np.ndarray: int64 code of each identifier.
+    """
+    values = values if isinstance(values, (pd.Series, pd.Categorical)) else pd.Series(list(values), dtype=object)
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        categorical = pd.Categorical(values)
+        codes, uniques = categorical.codes, categorical.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    unique_codes = np.append(np.array([encode_id(value) for value in uniques], dtype=np.int64), UNKNOWN)
+    return unique_codes[codes] #missing values (code -1) take the last one, UNKNOWN
+
+def decode_ids(codes):
+    """
+    Decode an array of codes (see encode_ids) back into identifiers.
+
+    Returns:
+        np.ndarray: Identifiers, as an object array.
+    """
+    uniques, inverse = np.unique(np.asarray(codes, dtype=np.int64), return_inverse=True)
+    return np.array([decode_id(code) for code in uniques], dtype=object)[inverse.reshape(-1)]
+
+def id_ontology(codes):
+    """
+    Get the ontology acronym code (see ONTOLOGY_CODES) of each code, 0 for '-', 'unknown' and other strings.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    return np.where(codes > DASH, codes >> ONTOLOGY_SHIFT, 0)
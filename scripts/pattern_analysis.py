@@ -1,71 +1,134 @@
 import json #use json data
+import numpy as np #array manipulation
 import pandas as pd #dataframe manipulation 
 
-count=0 #get the count of related identifiers
+import pattern_review #automatic validation of the patterns
+from classnames_io import load_classnames
+import instrumentation #spans and profiles of the run
 
-def data_process(filename):
+PATTERN_COLUMNS = {'CL': ('CLO', 'BTO'), 'CT': ('CL', 'BTO'), 'A': ('UBERON', 'BTO')} #ontologies compared for each type
+
+def build_suffix_automaton(string):
     """
-    Load data from a JSON file and convert it to a structured DataFrame.
+    Build the suffix automaton of a string, which recognizes all its substrings in linear time and space.
 
     Parameters:
-        filename (str): Path to the JSON file containing class data.
-
-    """
-    with open(filename, 'r') as archive:
-        dict_classes = json.load(archive)
-    df = pd.DataFrame.from_dict(dict_classes, orient='index')
-    new_row = pd.DataFrame([df.columns], columns=df.columns)
-    df_process = pd.concat([new_row, df], ignore_index=True)
-    df_process.columns = ['CLO_C','CLO_M', 'CL_C','CL_M', 'UBERON_C','UBERON_M','BTO_C','BTO_M']
-    df_process = df_process.drop(0)
-    
-    keys=[]
-    for key in dict_classes.keys():
-        keys.append(key)
-    df_process['Label'] = keys #add label column
-    
-    df_process.fillna("", inplace=True) #replace 'Nonetype' values
-
-    return df_process
+        string (str): String to index.
+
+    Returns:
+        tuple: (transitions, links, lengths) of the states, the initial state being 0.
+    """
+    transitions = [{}]
+    links = [-1]
+    lengths = [0]
+    last = 0
+    for char in string:
+        current = len(lengths)
+        transitions.append({})
+        links.append(0)
+        lengths.append(lengths[last] + 1)
+        state = last
+        while state != -1 and char not in transitions[state]:
+            transitions[state][char] = current
+            state = links[state]
+        if state != -1:
+            following = transitions[state][char]
+            if lengths[state] + 1 == lengths[following]:
+                links[current] = following
+            else:
+                clone = len(lengths)
+                transitions.append(dict(transitions[following]))
+                links.append(links[following])
+                lengths.append(lengths[state] + 1)
+                while state != -1 and transitions[state].get(char) == following:
+                    transitions[state][char] = clone
+                    state = links[state]
+                links[following] = clone
+                links[current] = clone
+        last = current
+    return transitions, links, lengths
+
+def longest_common_substring(automaton, string1):
+    """
+    Find the longest substring of string1 recognized by the suffix automaton of another string.
+    Ties are broken by the earliest position in string1.
+
+    Parameters:
+        automaton (tuple): Suffix automaton returned by build_suffix_automaton.
+        string1 (str): String to walk through the automaton.
+
+    """
+    transitions, links, lengths = automaton
+    state = 0
+    length = 0
+    best_length = 0
+    best_end = 0
+    for position, char in enumerate(string1):
+        while state and char not in transitions[state]:
+            state = links[state]
+            length = lengths[state]
+        if char in transitions[state]:
+            state = transitions[state][char]
+            length += 1
+        if length > best_length:
+            best_length = length
+            best_end = position + 1
+    return string1[best_end - best_length:best_end]
 
 def search_common_substrings(string1, string2):
     """
-    Find the longest common substring between two strings.
+    Find the longest common substring between two strings, with a suffix automaton of string2
+    (linear time). Among several of the same length, the first one in string1 is returned.
 
     Parameters:
         string1 (str): First string to compare.
         string2 (str): Second string to compare.
 
     """
-    length = min(len(string1), len(string2))
-    for i in range(length, 0, -1):
-        for j in range(len(string1) - i + 1):
-            if string1[j:j+i] in string2:
-                return string1[j:j+i]
-    return ""
+    return longest_common_substring(build_suffix_automaton(string2), string1)
 
-def check_pattern(df, index, column, pattern, string1, string2):
+@instrumentation.traced('common substrings')
+def search_common_substrings_batch(pairs):
     """
-    Check if a common pattern (substring) between two strings meets criteria and update the DataFrame if valid.
+    Find the longest common substring of every pair, building the suffix automaton of each distinct
+    second string only once.
 
     Parameters:
-        df (pd.DataFrame): The DataFrame to update.
-        index (int): Row index in the DataFrame.
-        column (str): Column name to update if the pattern is valid.
-        pattern (str): The common pattern found between the two strings.
-        string1 (str): First string for comparison.
-        string2 (str): Second string for comparison.
-
-    """
-    global count 
-    print(column)
-    if len(pattern) > 4 and pattern != ' cell' and pattern != ' of ':
-        print(index,'The similarity between', string1,'-', string2,':', pattern, len(pattern))
-        check = input('Is the pattern valid? Y/N \n')
-        if check == 'Y':
-            df.at[index, column] = string1
-            count +=1
-    return df
+        pairs (list): (string1, string2) tuples.
+
+    Returns:
+        list: The longest common substring of each pair, in the same order.
+    """
+    automata = {}
+    patterns = []
+    for string1, string2 in pairs:
+        if string2 not in automata:
+            automata[string2] = build_suffix_automaton(string2)
+        patterns.append(longest_common_substring(automata[string2], string1))
+    return patterns
+
+def extract_candidates(df, controls, tests, mask):
+    """
+    Extract the candidates of several column pairs at once from a boolean mask.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame to search.
+        controls (list): Reference columns.
+        tests (list): Model columns, paired with controls.
+        mask (np.ndarray): Boolean array (rows x pairs) marking the candidates.
+
+    Returns:
+        pd.DataFrame: One row per candidate with its 'index', the 'control' and 'test' columns and both strings
+                      ('string1' from the control column, 'string2' from the test column), pair by pair.
+    """
+    pairs, rows = np.nonzero(np.asarray(mask).T)
+    return pd.DataFrame({
+        'index': df.index[rows],
+        'control': np.array(controls, dtype=object)[pairs],
+        'test': np.array(tests, dtype=object)[pairs],
+        'string1': df[controls].to_numpy()[rows, pairs],
+        'string2': df[tests].to_numpy()[rows, pairs],
+    })
 
 def df_to_dicc(df):
     """
@@ -75,68 +138,79 @@ def df_to_dicc(df):
         df (pd.DataFrame): Input DataFrame to convert.
 
     """
-    dicc={}
-    for index,row in df.iterrows():
-        label = row['Label']
-        identifiers = row[:8].tolist()
-        dicc[label]=identifiers
-    return dicc
+    return dict(zip(df['Label'], df.iloc[:, :8].values.tolist()))
 
-def pattern_process(type):
+def load_pattern_data(type):
     """
-    For columns that share a pattern, it is checked if the pattern is valid and save the results to JSON.
+    Load the class names of a type and get the columns whose patterns are checked.
 
     Parameters:
         type (str): The ontology type ('CL', 'CT', or 'A') to specify which data to process.
 
     """
-    # Load specific file and set columns of interest based on type
-    if type == 'CL':
-        df = data_process('classnames_CL.json')
-        col_1 = 'CLO'
-        col_2 = 'BTO'
-    elif type == 'CT':
-        df = data_process('classnames_CT.json')
-        col_1 = 'CL'
-        col_2 = 'BTO'
-    elif type == 'A':
-        df = data_process('classnames_A.json')
-        col_1 = 'UBERON'
-        col_2 = 'BTO'
-    else:
+    if type not in PATTERN_COLUMNS:
         raise ValueError("Tipo no reconocido")
+    df = load_classnames(f'classnames_{type}.json')
+    controls = [f'{col}_C' for col in PATTERN_COLUMNS[type]]
+    tests = [f'{col}_M' for col in PATTERN_COLUMNS[type]]
+    return df, controls, tests
 
-    # Define control and target columns based on type
-    control_1= f'{col_1}_C'
-    control_2= f'{col_2}_C'
-    test_1= f'{col_1}_M'
-    test_2= f'{col_2}_M'
-
-    for index, row in df.iterrows():
-        string1a = row[control_1]
-        string2a = row[test_1]
-        if string1a != string2a:
-            pattern = search_common_substrings(string1a, string2a)
-            pattern_df = check_pattern(df, index, test_1, pattern, string1a, string2a)
-    
-    for index, row in pattern_df.iterrows():
-        string1b = row[control_2]
-        string2b = row[test_2]
-        if string1b != string2b:
-            pattern = search_common_substrings(string1b, string2b)
-            pattern2_df =check_pattern(pattern_df, index, test_2, pattern, string1b, string2b)
-    dicc = df_to_dicc(pattern2_df)
-    file_name = f'pattern_file_{type}.json'
-    with open(file_name, 'w') as archive_json:
-        json.dump(dicc, archive_json, indent=4)
+def pattern_process_all(types, max_workers=None):
+    """
+    For columns that share a pattern, it is checked if the pattern is valid and save the results to JSON.
+    The mismatched pairs of every type and column are extracted with one mask per type and decided together
+    in parallel processes (see pattern_review.decide_many).
 
-def main():
-    pattern_process('A')
-    pattern_process('CL')
-    pattern_process('CT')
-    print("The pattern was valid", count, "times.")
+    Parameters:
+        types (list): The ontology types ('CL', 'CT', or 'A') to process.
+        max_workers (int): Number of processes, the number of CPUs by default.
 
-if __name__ == "__main__":
-    main()
+    Returns:
+        dict: Number of valid patterns for each type.
+    """
+    data = {type: load_pattern_data(type) for type in types}
+    candidates = []
+    for type, (df, controls, tests) in data.items():
+        type_candidates = extract_candidates(df, controls, tests, df[controls].to_numpy() != df[tests].to_numpy())
+        type_candidates['type'] = type
+        candidates.append(type_candidates)
+    candidates = pd.concat(candidates, ignore_index=True)
+    contexts = [{'type': type, 'column': test} for type, test in zip(candidates['type'], candidates['test'])]
+    checks = pattern_review.decide_many('pattern', [{'string1': string1, 'string2': string2, 'context': context}
+                                                    for string1, string2, context in zip(candidates['string1'], candidates['string2'], contexts)],
+                                        max_workers=max_workers)
+    accepted = candidates[np.array(checks, dtype=object) == 'Y']
+
+    counts = {}
+    for type, (df, controls, tests) in data.items():
+        type_accepted = accepted[accepted['type'] == type]
+        for test, group in type_accepted.groupby('test'):
+            df.loc[group['index'], test] = group['string1'].to_numpy() #a valid pattern counts as a match
+        counts[type] = len(type_accepted)
+        dicc = df_to_dicc(df)
+        file_name = f'pattern_file_{type}.json'
+        with open(file_name, 'w') as archive_json:
+            json.dump(dicc, archive_json, indent=4)
+    return counts
+
+def pattern_process(type):
+    """
+    For columns that share a pattern, it is checked if the pattern is valid and save the results to JSON.
+
+    Parameters:
+        type (str): The ontology type ('CL', 'CT', or 'A') to specify which data to process.
 
+    Returns:
+        int: Number of valid patterns.
+    """
+    return pattern_process_all([type])[type]
+
+def main():
+    counts = pattern_process_all(['A', 'CL', 'CT'])
+    pattern_review.save()
+    pattern_review.report()
+    print("The pattern was valid", sum(counts.values()), "times.", counts)
 
+if __name__ == "__main__":
+    with instrumentation.stage('pattern_analysis'):
+        main()
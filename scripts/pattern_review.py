@@ -0,0 +1,267 @@
+import os #interact with the operating system
+import re #regular expressions
+import json #use json data
+from concurrent.futures import ProcessPoolExecutor #decide candidates in parallel
+
+DECISIONS_FILE = 'review_decisions.json' #human Y/N decisions, reused in later runs
+QUEUE_FILE = 'review_queue.json' #uncertain candidates waiting for a human decision
+CHUNK_SIZE = 1000 #candidates sent to a worker at once
+STOPWORDS = {'a', 'an', 'and', 'the', 'of', 'in', 'on', 'to', 'from', 'with', 'by', 'for', 'or',
+             'cell', 'cells', 'line', 'lines', 'type', 'tissue', 'derived', 'primary', 'human'}
+
+settings = {
+    'accept': {'pattern': 0.75, 'contribution': 0.75}, #candidates scoring at least this are accepted
+    'reject': {'pattern': 0.35, 'contribution': None}, #candidates scoring at most this are rejected (None: never,
+                                                       #a label rarely shares words with a valid class name)
+    'embedding_similarity': None, #optional function (text1, text2) -> cosine similarity
+    'decisions_file': DECISIONS_FILE,
+    'queue_file': QUEUE_FILE,
+}
+stats = {'accepted': 0, 'rejected': 0, 'reused': 0, 'queued': 0}
+_decisions = None
+_queue = None
+
+def configure(**options):
+    """
+    Change the classifier settings.
+
+    Parameters:
+        options: Any of 'accept', 'reject', 'embedding_similarity', 'decisions_file' and 'queue_file'.
+    """
+    global _decisions, _queue
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown review settings: {sorted(unknown)}")
+    settings.update(options)
+    _decisions = None
+    _queue = None
+
+def _load(path):
+    """
+    Load a JSON dictionary, empty if the file does not exist yet.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as archive:
+        return json.load(archive)
+
+def _save(data, path):
+    """
+    Save a JSON dictionary through a temporary file, so an interrupted run never leaves it half written.
+    """
+    with open(path + '.tmp', 'w') as archive_json:
+        json.dump(data, archive_json, indent=4)
+    os.replace(path + '.tmp', path)
+
+def get_decisions():
+    """
+    Get (loading them once) the stored human decisions.
+    """
+    global _decisions
+    if _decisions is None:
+        _decisions = _load(settings['decisions_file'])
+    return _decisions
+
+def get_queue():
+    """
+    Get (loading it once) the queue of candidates waiting for review.
+    """
+    global _queue
+    if _queue is None:
+        _queue = _load(settings['queue_file'])
+    return _queue
+
+def tokens(text):
+    """
+    Split a text into lowercase content words, without stopwords.
+
+    Parameters:
+        text (str): Class name or label.
+    """
+    return {token for token in re.split(r'[^0-9a-z]+', str(text).lower()) if token and token not in STOPWORDS}
+
+def features(string1, string2, pattern=None):
+    """
+    Compute the features used to score a candidate.
+
+    Parameters:
+        string1 (str): Reference string (reference class name, or the label for contributions).
+        string2 (str): Model class name.
+        pattern (str): Longest common substring of both strings, searched if not given.
+
+    Returns:
+        dict: 'lcs_ratio' (pattern length over the longest string), 'token_overlap' (Jaccard index of the
+              content words), 'pattern_content' (whether the pattern contains a content word) and, if an
+              embedding function is configured, 'embedding_similarity'.
+    """
+    if pattern is None:
+        from pattern_analysis import search_common_substrings #imported here, pattern_analysis uses this module
+        pattern = search_common_substrings(string1, string2)
+    longest = max(len(string1), len(string2))
+    tokens1, tokens2 = tokens(string1), tokens(string2)
+    union = tokens1 | tokens2
+    values = {
+        'lcs_ratio': len(pattern.strip()) / longest if longest else 0.0,
+        'token_overlap': len(tokens1 & tokens2) / len(union) if union else 0.0,
+        'pattern_content': bool(tokens(pattern) & tokens1 & tokens2),
+    }
+    if settings['embedding_similarity'] is not None:
+        values['embedding_similarity'] = float(settings['embedding_similarity'](string1, string2))
+    return values
+
+def score(values):
+    """
+    Combine the features of a candidate into a score between 0 and 1.
+
+    Parameters:
+        values (dict): Features returned by features.
+    """
+    if not values['pattern_content']: #the strings only share stopwords, such as ' cell' or ' of '
+        return 0.0
+    combined = 0.4 * values['lcs_ratio'] + 0.6 * values['token_overlap']
+    if 'embedding_similarity' in values:
+        combined = (combined + values['embedding_similarity']) / 2
+    return combined
+
+def _key(kind, string1, string2):
+    """
+    Key of a candidate in the decisions and the queue.
+    """
+    return f'{kind}\t{string1}\t{string2}'
+
+def decide(kind, string1, string2, pattern=None, context=None):
+    """
+    Decide whether a candidate is valid without asking: a stored human decision is reused, confident
+    candidates are accepted or rejected by their score and the rest are added to the review queue.
+
+    Parameters:
+        kind (str): 'pattern' or 'contribution'.
+        string1 (str): Reference string (reference class name, or the label for contributions).
+        string2 (str): Model class name.
+        pattern (str): Longest common substring of both strings, searched if not given.
+        context (dict): Extra information shown to the reviewer (e.g., the type and column).
+
+    Returns:
+        str: 'Y' or 'N', or None if the candidate is waiting for review.
+    """
+    key = _key(kind, string1, string2)
+    decisions = get_decisions()
+    if key in decisions:
+        stats['reused'] += 1
+        return decisions[key]['decision']
+    values = features(string1, string2, pattern)
+    candidate_score = score(values)
+    if candidate_score >= settings['accept'][kind]:
+        stats['accepted'] += 1
+        return 'Y'
+    if settings['reject'][kind] is not None and candidate_score <= settings['reject'][kind]:
+        stats['rejected'] += 1
+        return 'N'
+    stats['queued'] += 1
+    get_queue()[key] = {'kind': kind, 'string1': string1, 'string2': string2, 'score': round(candidate_score, 3),
+                        'features': values, 'context': context or {}}
+    return None
+
+def _init_worker(parent_settings, decisions):
+    """
+    Start a worker process with the settings and the decisions of the parent, which the worker would not see
+    when it is spawned instead of forked (default on macOS and Windows).
+    """
+    global _decisions
+    configure(**parent_settings)
+    _decisions = decisions
+
+def _decide_chunk(kind, candidates):
+    """
+    Decide a chunk of candidates in a worker process. For patterns, the longest common substrings are
+    searched here too, and pairs sharing 4 characters or less are rejected without scoring.
+
+    Returns:
+        tuple: The decision of each candidate, the candidates queued by this chunk and the statistics of this chunk.
+    """
+    stats_before = dict(stats)
+    queue_before = set(get_queue())
+    patterns = [None] * len(candidates)
+    if kind == 'pattern':
+        from pattern_analysis import search_common_substrings_batch #imported here, pattern_analysis uses this module
+        patterns = search_common_substrings_batch([(candidate['string1'], candidate['string2']) for candidate in candidates])
+    checks = []
+    for candidate, pattern in zip(candidates, patterns):
+        if pattern is not None and len(pattern) <= 4:
+            checks.append('N')
+        else:
+            checks.append(decide(kind, candidate['string1'], candidate['string2'], pattern, candidate.get('context')))
+    queued = {key: item for key, item in get_queue().items() if key not in queue_before}
+    return checks, queued, {key: stats[key] - stats_before[key] for key in stats}
+
+def decide_many(kind, candidates, max_workers=None):
+    """
+    Decide many candidates (see decide) in parallel processes, merging back the queued candidates and the
+    statistics of every worker. The workers get the settings (an embedding_similarity function must be
+    importable, i.e. defined at module level) and the decisions of this process.
+
+    Parameters:
+        kind (str): 'pattern' or 'contribution'.
+        candidates (list): Dictionaries with 'string1', 'string2' and optionally 'context'.
+        max_workers (int): Number of processes, the number of CPUs by default.
+
+    Returns:
+        list: The decision of each candidate ('Y', 'N' or None if it is waiting for review), in the same order.
+    """
+    chunks = [candidates[i:i + CHUNK_SIZE] for i in range(0, len(candidates), CHUNK_SIZE)]
+    if not chunks:
+        return []
+    checks = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(dict(settings), get_decisions())) as executor:
+        for chunk_checks, queued, chunk_stats in executor.map(_decide_chunk, [kind] * len(chunks), chunks):
+            checks.extend(chunk_checks)
+            get_queue().update(queued)
+            for key, value in chunk_stats.items():
+                stats[key] += value
+    return checks
+
+def save():
+    """
+    Save the review queue, to be called at the end of a run.
+    """
+    _save(get_queue(), settings['queue_file'])
+
+def report():
+    """
+    Print the statistics of the automatic decisions of this run.
+    """
+    print("Candidates accepted:", stats['accepted'], " rejected:", stats['rejected'],
+          " reused decisions:", stats['reused'], " queued for review:", stats['queued'],
+          f" (queue size {len(get_queue())})")
+
+def review():
+    """
+    Ask a human for the candidates in the review queue, most uncertain (closest to the middle) first.
+    Every answer is saved at once, so the review can be stopped and resumed at any time.
+    """
+    queue = get_queue()
+    decisions = get_decisions()
+    def uncertainty(key):
+        kind = queue[key]['kind']
+        middle = (settings['accept'][kind] + (settings['reject'][kind] or 0.0)) / 2
+        return abs(queue[key]['score'] - middle)
+    for key in sorted(queue, key=uncertainty):
+        item = queue[key]
+        print(item['kind'], item['context'], 'score:', item['score'])
+        print('  ', item['string1'], '-', item['string2'])
+        check = ''
+        while check not in ['Y', 'N', 'Q']:
+            check = input('Is it valid? Y/N (Q to stop) \n').strip().upper()
+        if check == 'Q':
+            break
+        decisions[key] = {'decision': check, 'score': item['score']}
+        del queue[key]
+        _save(decisions, settings['decisions_file'])
+        _save(queue, settings['queue_file'])
+
+def main():
+    review()
+    print("Candidates left in the queue:", len(get_queue()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import os #interact with the operating system
+import sys
+import ast #local imports of each script
+import json #use json data
+import glob
+import time
+import shutil
+import hashlib #cache keys
+import argparse #command line
+import subprocess #each stage runs in its own process
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED #independent stages in parallel
+
+from ontology_files import file_hash, ONTOLOGY_FILES
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(SCRIPTS_DIR) #paths of the stages are relative to the repository root
+CACHE_DIR = os.path.join(ROOT, 'cache', 'pipeline')
+MODEL_RESULTS = ['results__gpt3_5.json', 'results__gpt4.json', 'results__gpt4_o.json']
+TYPES = ['A', 'CL', 'CT']
+ONTOLOGY_DUMPS = [f'ontologies/{name}' for name in ONTOLOGY_FILES.values()] #read by the stages using label_index or ontology_hierarchy
+SPLIT_METHOD = os.environ.get('SPLIT_METHOD', 'legacy') #see creation_ft.py, part of the key of every stage importing it
+LOOKUP = os.environ.get('REFERENCE_LOOKUP', '') not in ('', '0') #see reference_lookup.py
+
+#Stages of the workflow. Each stage runs a script (or a Python command) in its own working directory, since
+#the scripts open their files relative to it. 'inputs' and 'outputs' are paths relative to the repository root,
+#'publish' copies outputs to where the following stages read them and 'params' are any other settings of the run.
+#A stage depends on the stages producing its inputs; the rest run in parallel.
+PIPELINE = [
+    {'name': 'split', 'command': ['-c', 'import creation_ft; creation_ft.save_test_split()'], 'cwd': '.', 'code': ['scripts/creation_ft.py'],
+     'inputs': ['biosamples.tsv'], 'outputs': ['mappings_test.csv'],
+     'publish': {'mappings_test.csv': 'finetuning_process/mappings_test.csv'},
+     'params': {'split': SPLIT_METHOD}},
+    {'name': 'query_gpt', 'script': 'scripts/get_response_modelsOpenAI.py', 'cwd': '.',
+     'inputs': ['biosamples.tsv', 'mappings_test.csv', 'prompt_search_id.txt', '.env'], 'outputs': MODEL_RESULTS + [f'lookup_{name}' for name in MODEL_RESULTS],
+     'publish': {name: f'results/{name}' for name in MODEL_RESULTS + [f'lookup_{name}' for name in MODEL_RESULTS]},
+     'params': {'models': ['gpt-3.5-turbo-0125', 'gpt-4-turbo', 'gpt-4o'], 'lookup': LOOKUP, 'split': SPLIT_METHOD}},
+    {'name': 'query_ft', 'script': 'scripts/get_response_ft.py', 'cwd': '.',
+     'inputs': ['biosamples.tsv', 'mappings_test.csv', '.env'], 'outputs': ['results_ft_4o_mini.json', 'lookup_results_ft_4o_mini.json'],
+     'publish': {'results_ft_4o_mini.json': 'results/results_ft_4o_mini.json',
+                 'lookup_results_ft_4o_mini.json': 'results/lookup_results_ft_4o_mini.json'},
+     'params': {'lookup': LOOKUP, 'split': SPLIT_METHOD}},
+    {'name': 'retrieval', 'script': 'scripts/retrieval_mapper.py', 'cwd': '.',
+     'inputs': ['mappings_test.csv'] + ONTOLOGY_DUMPS, 'outputs': ['results_retrieval.json'],
+     'publish': {'results_retrieval.json': 'results/results_retrieval.json'}},
+    {'name': 'compare', 'cwd': '.', 'code': ['scripts/df_comparison.py'],
+     'command': ['-c', "import df_comparison; df_comparison.df_comparison_ft_gpt4o_mini"
+                       ".to_csv('results/df_ft_4o_mini_annotation.csv', index=False)"],
+     'inputs': ['finetuning_process/mappings_test.csv', 'results/results_ft_4o_mini.json', 'results/lookup_results_ft_4o_mini.json'],
+     'outputs': ['results/df_ft_4o_mini_annotation.csv']},
+    {'name': 'class_names', 'script': 'scripts/class_names.py', 'cwd': 'scripts',
+     'inputs': ['results/df_ft_4o_mini_annotation.csv'] + ONTOLOGY_DUMPS,
+     'outputs': [f'scripts/classnames_{type}.json' for type in TYPES]},
+    {'name': 'pattern', 'script': 'scripts/pattern_analysis.py', 'cwd': 'scripts',
+     'inputs': [f'scripts/classnames_{type}.json' for type in TYPES] + ['scripts/review_decisions.json'],
+     'outputs': [f'scripts/pattern_file_{type}.json' for type in TYPES]},
+    {'name': 'contribution', 'script': 'scripts/llm_contributions.py', 'cwd': 'scripts',
+     'inputs': [f'scripts/pattern_file_{type}.json' for type in TYPES] + ['scripts/review_decisions.json'],
+     'outputs': [f'scripts/contribution_file_{type}.json' for type in TYPES],
+     'publish': {f'scripts/contribution_file_{type}.json': f'results/contribution_file_{type}.json' for type in TYPES}},
+    {'name': 'metrics', 'script': 'scripts/models_comparison.py', 'cwd': '.',
+     'inputs': ['finetuning_process/mappings_test.csv', 'results/results_ft_35.json', 'results/results_ft_4o.json',
+                'results/results_ft_4o_mini.json', 'results/lookup_results_ft_4o_mini.json']
+               + [f'results/{prefix}{name}' for name in MODEL_RESULTS for prefix in ['', 'lookup_']] + ONTOLOGY_DUMPS,
+     'outputs': ['results/df_4o.csv']},
+    {'name': 'evaluate', 'script': 'scripts/evaluate.py', 'cwd': '.',
+     'inputs': ['finetuning_process/mappings_test.csv', 'results/results_ft_35.json', 'results/results_ft_4o.json',
+                'results/results_ft_4o_mini.json', 'results/lookup_results_ft_4o_mini.json', 'results/results_retrieval.json']
+               + [f'results/{prefix}{name}' for name in MODEL_RESULTS for prefix in ['', 'lookup_']] + ONTOLOGY_DUMPS,
+     'outputs': ['results/evaluation.csv']},
+    {'name': 'hierarchy', 'script': 'scripts/ontology_hierarchy.py', 'cwd': 'scripts',
+     'inputs': ['results/df_ft_4o_mini_annotation.csv'] + ONTOLOGY_DUMPS, 'outputs': []},
+]
+
+def _path(relative):
+    """
+    Absolute path of a path relative to the repository root.
+    """
+    return os.path.normpath(os.path.join(ROOT, relative))
+
+def local_imports(script, seen=None):
+    """
+    Find the scripts of this folder imported (directly or not) by a script, whose code is part of the key of a stage.
+
+    Parameters:
+        script (str): Path to the script, relative to the repository root.
+
+    Returns:
+        set: Paths of the script and its local imports, relative to the repository root.
+    """
+    seen = set() if seen is None else seen
+    if script in seen or not os.path.exists(_path(script)):
+        return seen
+    seen.add(script)
+    with open(_path(script), 'rb') as file:
+        tree = ast.parse(file.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            local_imports(f'scripts/{name.split(".")[0]}.py', seen)
+    return seen
+
+def stage_key(stage):
+    """
+    Cache key of a stage: hash of its command, working directory, parameters and the content of its inputs
+    and code (the script and its local imports).
+
+    Parameters:
+        stage (dict): Stage of the pipeline.
+    """
+    code = set()
+    for script in ([stage['script']] if 'script' in stage else []) + stage.get('code', []):
+        code |= local_imports(script)
+    description = {
+        'command': stage.get('command'), 'script': stage.get('script'), 'cwd': stage['cwd'],
+        'params': stage.get('params', {}), 'publish': stage.get('publish', {}),
+        'inputs': {path: file_hash(_path(path)) if os.path.exists(_path(path)) else None for path in stage['inputs']},
+        'code': {path: file_hash(_path(path)) for path in sorted(code)},
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+def dependencies(stages):
+    """
+    Get the stages each stage depends on: those that produce (or publish) any of its inputs.
+
+    Returns:
+        dict: Stage name -> set of stage names.
+    """
+    producers = {}
+    for stage in stages:
+        for path in stage['outputs'] + list(stage.get('publish', {}).values()):
+            producers[os.path.normpath(path)] = stage['name']
+    return {stage['name']: {producers[os.path.normpath(path)] for path in stage['inputs']
+                            if os.path.normpath(path) in producers and producers[os.path.normpath(path)] != stage['name']}
+            for stage in stages}
+
+def _artifacts(stage):
+    """
+    Files kept in the cache for a stage: its outputs and the published copies.
+    """
+    return stage['outputs'] + list(stage.get('publish', {}).values())
+
+def _restore(stage, cache_dir):
+    """
+    Copy the cached artifacts of a stage back to the tree (only those that changed).
+    """
+    for path in _artifacts(stage):
+        cached = os.path.join(cache_dir, path)
+        if not os.path.exists(_path(path)) or file_hash(_path(path)) != file_hash(cached):
+            os.makedirs(os.path.dirname(_path(path)), exist_ok=True)
+            shutil.copy2(cached, _path(path))
+
+def run_stage(stage, force=False):
+    """
+    Run a stage unless an identical run (same key) is cached, in which case its outputs are restored.
+    The output of the script is saved in the cache as 'stage.log'.
+
+    Parameters:
+        stage (dict): Stage of the pipeline.
+        force (bool): Run it even if it is cached.
+
+    Returns:
+        str: 'cached' or 'ran'. Raises RuntimeError if the script fails or does not write its outputs.
+    """
+    key = stage_key(stage)
+    cache_dir = os.path.join(CACHE_DIR, stage['name'], key)
+    if not force and os.path.exists(os.path.join(cache_dir, 'stage.log')):
+        _restore(stage, cache_dir)
+        return 'cached'
+    command = [sys.executable] + (stage['command'] if 'command' in stage else [_path(stage['script'])])
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([SCRIPTS_DIR, os.environ.get('PYTHONPATH', '')]),
+                       MPLBACKEND='Agg') #plots are saved or dropped, never shown
+    completed = subprocess.run(command, cwd=_path(stage['cwd']), env=environment, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    log = completed.stdout.decode('utf-8', errors='replace')
+    if completed.returncode != 0:
+        raise RuntimeError(f"Stage {stage['name']} failed ({completed.returncode}):\n{log[-2000:]}")
+    for source, target in stage.get('publish', {}).items():
+        os.makedirs(os.path.dirname(_path(target)), exist_ok=True)
+        shutil.copy2(_path(source), _path(target))
+    missing = [path for path in _artifacts(stage) if not os.path.exists(_path(path))]
+    if missing:
+        raise RuntimeError(f"Stage {stage['name']} did not write {missing}")
+    temporary = cache_dir + '.tmp'
+    shutil.rmtree(temporary, ignore_errors=True)
+    for path in _artifacts(stage):
+        os.makedirs(os.path.dirname(os.path.join(temporary, path)), exist_ok=True)
+        shutil.copy2(_path(path), os.path.join(temporary, path))
+    with open(os.path.join(temporary, 'stage.log'), 'w') as file:
+        file.write(log)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(temporary, cache_dir)
+    return 'ran'
+
+def select(stages, names):
+    """
+    Get the named stages and every stage they depend on, in pipeline order.
+    """
+    by_name = {stage['name']: stage for stage in stages}
+    unknown = set(names) - set(by_name)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+    depends = dependencies(stages)
+    selected, pending = set(), list(names)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(depends[name])
+    return [stage for stage in stages if stage['name'] in selected]
+
+def run(stages=PIPELINE, names=None, force=(), max_workers=None):
+    """
+    Run the pipeline: every stage starts as soon as the stages it depends on finish, and only stale stages
+    run their script. Stages depending on a failed stage are skipped.
+
+    Parameters:
+        stages (list): Stages of the pipeline.
+        names (list): Stages to run (with their dependencies), all of them by default.
+        force (iterable): Stages to run even if they are cached.
+        max_workers (int): Number of stages running at the same time.
+
+    Returns:
+        dict: Stage name -> ('cached', 'ran', 'failed' or 'skipped', seconds).
+    """
+    stages = select(stages, names) if names else list(stages)
+    depends = dependencies(stages)
+    status, running, started = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(status) < len(stages):
+            for stage in stages:
+                name = stage['name']
+                if name in status or name in started:
+                    continue
+                if any(status.get(parent, ('',))[0] in ('failed', 'skipped') for parent in depends[name]):
+                    status[name] = ('skipped', 0.0)
+                    print(f"[{name}] skipped")
+                elif all(parent in status for parent in depends[name]):
+                    started[name] = time.time()
+                    running[executor.submit(run_stage, stage, name in force)] = name
+            if not running:
+                if len(status) < len(stages):
+                    raise ValueError("The stages depend on each other in a cycle")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                elapsed = time.time() - started[name]
+                try:
+                    status[name] = (future.result(), elapsed)
+                except Exception as error:
+                    status[name] = ('failed', elapsed)
+                    print(error)
+                print(f"[{name}] {status[name][0]} ({elapsed:.1f}s)")
+    return status
+
+def clean(stages=PIPELINE):
+    """
+    Remove the cached runs that are not the current key of their stage.
+
+    Returns:
+        int: Number of removed runs.
+    """
+    removed = 0
+    for stage in stages:
+        current = stage_key(stage)
+        for cache_dir in glob.glob(os.path.join(CACHE_DIR, stage['name'], '*')):
+            if os.path.basename(cache_dir) != current:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the annotation workflow, rerunning only the stale stages.')
+    parser.add_argument('stages', nargs='*', help='stages to run (with their dependencies), all by default')
+    parser.add_argument('--force', nargs='*', default=[], help='stages to run even if they are cached')
+    parser.add_argument('--jobs', type=int, default=None, help='stages running at the same time')
+    parser.add_argument('--clean', action='store_true', help='remove cached runs of old keys')
+    parser.add_argument('--instrument', action='store_true', help='trace the spans of every stage (see instrumentation.py)')
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help='also profile every stage')
+    args = parser.parse_args()
+    if args.instrument or args.profile:
+        os.environ['INSTRUMENT'] = '1' #inherited by the stages
+    if args.profile:
+        os.environ['INSTRUMENT_PROFILE'] = args.profile
+    if args.clean:
+        print("Removed cached runs:", clean())
+        return
+    status = run(names=args.stages or None, force=set(args.force), max_workers=args.jobs)
+    for name, (state, elapsed) in status.items():
+        print(f"{name:<14}{state:<9}{elapsed:8.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os #interact with the operating system
+import re #regular expressions
+import json #use json data
+import pandas as pd #dataframe manipulation
+import instrumentation #spans and profiles of the run
+
+COLUMNS = ['Label', 'CLO', 'CL', 'UBERON', 'BTO', 'Type']
+AMBIGUOUS = None #normalized label curated with different identifiers, always sent to the model
+
+#Off unless REFERENCE_LOOKUP is set (e.g., REFERENCE_LOOKUP=1 python scripts/get_response_ft.py): answers taken
+#from the curated mappings are not model outputs, so the results meant for evaluation must not contain them
+settings = {'enabled': os.environ.get('REFERENCE_LOOKUP', '') not in ('', '0')}
+stats = {'hits': 0, 'misses': 0, 'excluded': 0}
+answered = {} #model -> labels answered by the lookup in this run
+
+def configure(**options):
+    """
+    Change the lookup settings.
+
+    Parameters:
+        options: 'enabled'.
+    """
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown lookup settings: {sorted(unknown)}")
+    settings.update(options)
+
+def normalize_label(label):
+    """
+    Normalize a label for the lookup: lowercase, with any run of spaces, underscores or punctuation as one space
+    (e.g., 'Stromal_heart_2' and 'stromal heart-2' -> 'stromal heart 2').
+
+    Parameters:
+        label (str): Biosample label.
+    """
+    return ' '.join(re.split(r'[\W_]+', str(label).lower())).strip()
+
+def build_index(mappings, test=None):
+    """
+    Build the lookup index (normalized label -> curated identifiers) from curated mappings. Only the training
+    partition must be used; if the test partition is given, rows shared with it (by their index in
+    biosamples.tsv) raise an error, and training rows whose normalized label is also a test label are left
+    out, so test labels (duplicated labels included) never get their curated answer back.
+
+    Parameters:
+        mappings (DataFrame): Curated mappings (Label, CLO, CL, UBERON, BTO, Type), e.g. creation_ft.mappings_ft.
+        test (DataFrame): Test partition, e.g. creation_ft.mappings_test.
+
+    Returns:
+        dict: Normalized label -> [CLO, CL, UBERON, BTO] identifiers (None if the label is ambiguous).
+    """
+    if test is not None:
+        leaked = mappings.index.intersection(test.index)
+        if len(leaked) > 0:
+            raise ValueError(f"{len(leaked)} rows of the test partition are in the lookup mappings")
+    curated = mappings.copy()
+    curated.columns = COLUMNS
+    if test is not None:
+        test_keys = {normalize_label(label) for label in test.iloc[:, 0]}
+        shared = curated['Label'].map(normalize_label).isin(test_keys)
+        stats['excluded'] += int(shared.sum())
+        curated = curated[~shared]
+    index = {}
+    for row in curated.fillna('-').itertuples(index=False):
+        key = normalize_label(row.Label)
+        identifiers = [row.CLO, row.CL, row.UBERON, row.BTO]
+        if key in index and index[key] != identifiers:
+            index[key] = AMBIGUOUS
+        else:
+            index.setdefault(key, identifiers)
+    return index
+
+@instrumentation.traced('reference lookup')
+def lookup(index, labels):
+    """
+    Look up labels in the index.
+
+    Parameters:
+        index (dict): Index returned by build_index.
+        labels (iterable): Biosample labels.
+
+    Returns:
+        list: The curated identifiers of each label, or None if it is not in the index (or is ambiguous).
+    """
+    return [index.get(normalize_label(label)) for label in labels]
+
+def get_responses(df, model, get_openai_response, index):
+    """
+    Annotate the labels of a DataFrame, answering the labels found in the lookup index with their curated
+    identifiers and sending only the rest to the model. Without an index (the lookup is off, see settings['enabled']),
+    every label goes to the model. The labels answered by the lookup are kept in answered[model] (see save_sources).
+
+    Parameters:
+        df (DataFrame): DataFrame containing the labels to be mapped.
+        model (str): Model to which the consultation is to be made.
+        get_openai_response (function): Function (df, model) -> {label: output} that queries the model.
+        index (dict): Index returned by build_index, None if the lookup is off.
+
+    Returns:
+        dict: Label -> output, in the results format of the models ("['CLO_...', 'CL_...', ...]").
+    """
+    df = df.copy()
+    df.columns = COLUMNS
+    if index is None:
+        stats['misses'] += len(df)
+        return get_openai_response(df, model)
+    found = lookup(index, df['Label'])
+    hits = pd.Series([identifiers is not None for identifiers in found], index=df.index)
+    responses = {label: str(identifiers) for label, identifiers in zip(df['Label'], found) if identifiers is not None}
+    missing = df[~hits]
+    if len(missing) > 0:
+        responses.update(get_openai_response(missing, model))
+    stats['hits'] += int(hits.sum())
+    answered.setdefault(model, set()).update(label for label, identifiers in zip(df['Label'], found) if identifiers is not None)
+    stats['misses'] += len(missing)
+    return {label: responses[label] for label in dict.fromkeys(df['Label']) if label in responses}
+
+def sources_path(results_path):
+    """
+    Path of the file listing the labels of a results file answered by the lookup: lookup_<name> next to it
+    (e.g., results/lookup_results_ft_4o_mini.json), not matched by the results_*.json patterns.
+    """
+    directory, name = os.path.split(results_path)
+    return os.path.join(directory, f'lookup_{name}')
+
+def save_sources(results_path, model, labels=None):
+    """
+    Save the labels of a results file answered by the lookup instead of the model (an empty list when the
+    lookup is off), so the evaluation can leave them out.
+
+    Parameters:
+        results_path (str): Path of the results file.
+        model (str): Model of the results.
+        labels (iterable): Labels answered by the lookup, answered[model] by default.
+    """
+    labels = answered.get(model, set()) if labels is None else labels
+    with open(sources_path(results_path), 'w') as json_file:
+        json.dump(sorted(labels), json_file, indent=4)
+
+def lookup_labels(results_path):
+    """
+    Get the labels of a results file answered by the lookup (none if the results have no lookup file).
+
+    Returns:
+        set: Labels.
+    """
+    path = sources_path(results_path)
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as json_file:
+        return set(json.load(json_file))
+
+def report():
+    """
+    Print the lookup statistics of this run.
+    """
+    total = stats['hits'] + stats['misses']
+    print("Labels answered by the lookup:", stats['hits'], " sent to the model:", stats['misses'],
+          " training rows left out for sharing a test label:", stats['excluded'],
+          " hit rate:", f"{stats['hits'] / total:.3f}" if total else '-', " API calls saved:", stats['hits'])
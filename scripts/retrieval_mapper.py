@@ -0,0 +1,259 @@
+import os #interact with the operating system
+import json #use json data
+import time
+import importlib.util #optional dependencies
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+import label_index #class labels and synonyms from the ontology dumps
+import embedding_store #persistent embeddings
+from ontology_files import CACHE_DIR
+from ontology_ids import ONTOLOGIES
+import instrumentation #spans and profiles of the run
+
+INDEX_DIR = os.path.join(CACHE_DIR, 'retrieval')
+TEST_PATH = 'mappings_test.csv' #test partition written by creation_ft.py
+
+settings = {
+    'model_name': 'all-MiniLM-L6-v2', #sentence transformer used for the labels and the class names
+    'batch_size': 256,
+    'min_score': 0.6, #best matches below this similarity are answered with '-'
+    'exact_limit': 200000, #ontologies with more texts use the approximate (hnswlib) index, if installed
+    'candidates': 8, #texts retrieved per requested class, several texts (label, synonyms) can be of the same class
+}
+_model = None
+_indexes = {}
+
+def configure(**options):
+    """
+    Change the mapper settings.
+
+    Parameters:
+        options: Any of 'model_name', 'batch_size', 'min_score', 'exact_limit' and 'candidates'.
+    """
+    global _model
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown retrieval settings: {sorted(unknown)}")
+    settings.update(options)
+    _model = None
+    _indexes.clear()
+
+def encode(texts):
+    """
+    Encode texts as unit-length embeddings, loading the sentence transformer on first use.
+
+    Parameters:
+        texts (list): Texts to encode.
+    """
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer #imported here, torch is slow to import
+        _model = SentenceTransformer(settings['model_name'], device='cpu')
+    return _model.encode(list(texts), batch_size=settings['batch_size'], convert_to_numpy=True, normalize_embeddings=True)
+
+def embed(texts):
+    """
+    Get the embeddings of texts through the embedding store, encoding only the new ones.
+    """
+    return embedding_store.get_embeddings(settings['model_name'], texts, encode)
+
+def query_text(label):
+    """
+    Turn a biosample label into the text embedded for the search (e.g., 'Stromal_heart_2' -> 'Stromal heart 2').
+    """
+    return ' '.join(str(label).replace('_', ' ').split())
+
+def _source_hash(acronym):
+    """
+    Hash of the ontology dump the label index of an ontology was built from.
+    """
+    manifest_path = os.path.join(label_index.INDEX_DIR, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as file:
+        return json.load(file).get(acronym, {}).get('source_hash')
+
+def build_index(acronym, index_dir=INDEX_DIR):
+    """
+    Embed the labels and synonyms of all the classes of an ontology and save them as a vector index: the
+    normalized embeddings (float16), the class of each text and, for large ontologies, an hnswlib graph.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+        index_dir (str): Folder where the indexes are stored.
+
+    Returns:
+        int: Number of texts in the index.
+    """
+    class_ids, texts, owners = [], [], []
+    for class_id, label, synonyms in label_index.classes(acronym):
+        for text in dict.fromkeys([label] + synonyms):
+            texts.append(text)
+            owners.append(len(class_ids))
+        class_ids.append(class_id)
+    vectors = embed(texts).astype(np.float16) if texts else np.empty((0, 0), dtype=np.float16)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, f'{acronym}.vectors.npy'), vectors)
+    np.save(os.path.join(index_dir, f'{acronym}.owners.npy'), np.array(owners, dtype=np.int32))
+    np.save(os.path.join(index_dir, f'{acronym}.ids.npy'), np.array(class_ids, dtype=str))
+    graph_path = os.path.join(index_dir, f'{acronym}.hnsw')
+    if os.path.exists(graph_path):
+        os.remove(graph_path)
+    if len(texts) > settings['exact_limit'] and importlib.util.find_spec('hnswlib') is not None:
+        import hnswlib
+        graph = hnswlib.Index(space='ip', dim=vectors.shape[1])
+        graph.init_index(max_elements=len(texts), ef_construction=200, M=32)
+        graph.add_items(vectors.astype(np.float32), np.arange(len(texts)))
+        graph.save_index(graph_path)
+    with open(os.path.join(index_dir, f'{acronym}.json'), 'w') as file:
+        json.dump({'model_name': settings['model_name'], 'source_hash': _source_hash(acronym),
+                   'classes': len(class_ids), 'texts': len(texts)}, file, indent=4)
+    _indexes.pop(acronym, None)
+    return len(texts)
+
+def update_indexes(index_dir=INDEX_DIR):
+    """
+    Build the vector indexes whose label index or model changed since the last build.
+
+    Returns:
+        list: Acronyms of the rebuilt indexes.
+    """
+    rebuilt = []
+    for acronym in ONTOLOGIES:
+        if label_index.load_index(acronym) is None:
+            continue
+        meta_path = os.path.join(index_dir, f'{acronym}.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta['model_name'] == settings['model_name'] and meta['source_hash'] == _source_hash(acronym):
+                continue
+        build_index(acronym, index_dir)
+        rebuilt.append(acronym)
+    return rebuilt
+
+def load_index(acronym, index_dir=INDEX_DIR):
+    """
+    Load (once) the vector index of an ontology, with the embeddings memory-mapped.
+
+    Returns:
+        dict: 'vectors', 'owners', 'ids' and 'graph' (None for exact search), or None if it has not been built.
+    """
+    if acronym not in _indexes:
+        if not os.path.exists(os.path.join(index_dir, f'{acronym}.json')):
+            return None
+        index = {name: np.load(os.path.join(index_dir, f'{acronym}.{name}.npy'), mmap_mode='r')
+                 for name in ['vectors', 'owners', 'ids']}
+        index['graph'] = None
+        graph_path = os.path.join(index_dir, f'{acronym}.hnsw')
+        if os.path.exists(graph_path) and importlib.util.find_spec('hnswlib') is not None:
+            import hnswlib
+            index['graph'] = hnswlib.Index(space='ip', dim=index['vectors'].shape[1])
+            index['graph'].load_index(graph_path)
+            index['graph'].set_ef(max(64, settings['candidates'] * 8))
+        _indexes[acronym] = index
+    return _indexes[acronym]
+
+def _nearest_texts(index, queries, n):
+    """
+    Find the n most similar texts of each query: exact inner products by blocks of the memory-mapped
+    embeddings, or the hnswlib graph if the index has one.
+
+    Returns:
+        tuple: (text positions, similarities), both (queries x n) and sorted by decreasing similarity.
+    """
+    n = min(n, len(index['owners']))
+    if index['graph'] is not None:
+        positions, distances = index['graph'].knn_query(queries, k=n)
+        return positions.astype(np.int64), 1 - distances
+    best_positions = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    block = 65536
+    for start in range(0, len(index['owners']), block):
+        scores = queries @ np.asarray(index['vectors'][start:start + block], dtype=np.float32).T
+        top = np.argpartition(-scores, min(n, scores.shape[1]) - 1, axis=1)[:, :n]
+        best_positions = np.concatenate([best_positions, top + start], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        keep = np.argsort(-best_scores, axis=1, kind='stable')[:, :n]
+        best_positions = np.take_along_axis(best_positions, keep, axis=1)
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+    return best_positions, best_scores
+
+@instrumentation.traced('retrieval search')
+def search(acronym, labels, k=5):
+    """
+    Retrieve the k most similar classes of an ontology for each label.
+
+    Parameters:
+        acronym (str): Acronym of the ontology (e.g., 'CL', 'CLO').
+        labels (list): Biosample labels.
+        k (int): Number of classes per label.
+
+    Returns:
+        list: For each label, up to k (class_id, similarity) tuples by decreasing similarity.
+    """
+    index = load_index(acronym)
+    if index is None or not len(index['owners']):
+        return [[] for _ in labels]
+    queries = embed([query_text(label) for label in labels])
+    positions, scores = _nearest_texts(index, queries, k * settings['candidates'])
+    owners = np.asarray(index['owners'])[positions]
+    results = []
+    for row_owners, row_scores in zip(owners.tolist(), scores.tolist()):
+        best = {}
+        for owner, score in zip(row_owners, row_scores):
+            if owner not in best: #texts come sorted, the first one of a class is its best
+                best[owner] = score
+            if len(best) == k:
+                break
+        results.append([(str(index['ids'][owner]), float(score)) for owner, score in best.items()])
+    return results
+
+def map_labels(labels, k=5):
+    """
+    Retrieve the k most similar classes of every ontology for each label.
+
+    Parameters:
+        labels (list): Biosample labels.
+        k (int): Number of classes per ontology.
+
+    Returns:
+        dict: label -> {acronym: [(class_id, similarity), ...]}.
+    """
+    labels = list(dict.fromkeys(labels))
+    candidates = {acronym: search(acronym, labels, k) for acronym in ONTOLOGIES}
+    return {label: {acronym: candidates[acronym][i] for acronym in ONTOLOGIES} for i, label in enumerate(labels)}
+
+def to_results(mapping, min_score=None):
+    """
+    Convert retrieved candidates to the results format of the language models (see
+    df_comparison.process_json_results): label -> "['CLO_...', 'CL_...', 'UBERON_...', 'BTO_...']",
+    with '-' where the best class is not similar enough.
+
+    Parameters:
+        mapping (dict): Output of map_labels.
+        min_score (float): Minimum similarity of the best class, settings['min_score'] by default.
+    """
+    min_score = settings['min_score'] if min_score is None else min_score
+    return {label: str([candidates[acronym][0][0] if candidates[acronym] and candidates[acronym][0][1] >= min_score
+                        else '-' for acronym in ONTOLOGIES])
+            for label, candidates in mapping.items()}
+
+def main():
+    rebuilt = update_indexes()
+    print("Rebuilt vector indexes:", rebuilt if rebuilt else "none, all up to date")
+    mappings_test = pd.read_csv(TEST_PATH, header=0)
+    labels = mappings_test.iloc[:, 0].astype(str).tolist()
+    start = time.time()
+    results = to_results(map_labels(labels, k=1))
+    elapsed = time.time() - start
+    print(f"Mapped {len(results)} labels in {elapsed:.2f} seconds ({1000 * elapsed / max(len(results), 1):.2f} ms per label)")
+    with open('results_retrieval.json', 'w') as json_file:
+        json.dump(results, json_file, indent=4)
+    embedding_store.report()
+
+if __name__ == "__main__":
+    with instrumentation.stage('retrieval_mapper'):
+        main()
@@ -0,0 +1,197 @@
+import os #interact with the operating system
+import json #use json data
+import numpy as np #array manipulation
+import pandas as pd #dataframe manipulation
+
+from ontology_files import CACHE_DIR
+from ontology_ids import ONTOLOGIES
+
+CORPUS_DIR = os.path.join(CACHE_DIR, 'corpus')
+VERSION = 1 #bump when the generator changes, so cached corpora are rebuilt
+BASE_ROWS = 6264 #rows of biosamples.tsv, the 1x corpus
+TEST_SIZE = 0.30 #share of the rows in the test partition, as in creation_ft.py
+TYPES = ['A', 'CL', 'CT']
+
+#Distributions measured on biosamples.tsv
+TYPE_SHARES = {'CL': 0.492, 'CT': 0.360, 'A': 0.115, '-': 0.033}
+DASH_RATES = { #share of '-' identifiers of each ontology by type
+    'CL': {'CLO': 0.325, 'CL': 0.027, 'UBERON': 0.019, 'BTO': 0.419},
+    'CT': {'CLO': 0.981, 'CL': 0.020, 'UBERON': 0.016, 'BTO': 0.411},
+    'A': {'CLO': 1.000, 'CL': 0.189, 'UBERON': 0.000, 'BTO': 0.238},
+    '-': {'CLO': 1.000, 'CL': 0.749, 'UBERON': 0.498, 'BTO': 1.000},
+}
+ID_POOLS = {'CLO': 587, 'CL': 356, 'UBERON': 324, 'BTO': 782} #distinct identifiers of each ontology
+LABEL_LENGTHS = ([0, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1], [1, 4, 7, 15, 27, 46, 58, 87]) #quantiles of the label length
+DUPLICATE_RATE = 0.0003 #rows repeating the label of another row
+#Behaviour of the models, roughly that of the fine-tuned GPT-4o-mini (results_ft_4o_mini.json)
+AGREEMENT = {'CLO': 0.55, 'CL': 0.65, 'UBERON': 0.70, 'BTO': 0.50} #model identifiers equal to the reference
+FORMAT_ERROR_RATE = 0.023 #outputs not in the list format
+UNRESOLVED_RATE = 0.01 #class names that could not be resolved (None)
+
+WORDS = ['cell', 'epithelial', 'of', 'the', 'colon', 'stem', 'muscle', 'lymphoblast', 'derived', 'tissue',
+         'primary', 'adult', 'line', 'lower', 'lobe', 'right', 'lung', 'neural', 'progenitor', 'fibroblast',
+         'brain', 'hippocampus', 'blood', 'liver', 'carcinoma', 'kidney', 'T', 'B', 'donor', 'patient']
+SEPARATORS = [' ', '_', '-', '', ' ']
+
+def make_labels(rng, n):
+    """
+    Build n biosample labels with the length distribution of biosamples.tsv, mixing words, cell line
+    codes and numbers (e.g., 'Brain_Hippocampus 12', 'MDA-MB-361').
+
+    Parameters:
+        rng (np.random.Generator): Random generator.
+        n (int): Number of labels.
+    """
+    lengths = np.interp(rng.random(n), *LABEL_LENGTHS).round().astype(int)
+    words = np.array(WORDS)[rng.integers(len(WORDS), size=(n, 12))]
+    codes = rng.integers(1, 100000, size=(n, 2))
+    separators = rng.integers(len(SEPARATORS), size=n)
+    labels = []
+    for i in range(n):
+        separator = SEPARATORS[separators[i]]
+        label = separator.join([words[i, 0].capitalize(), f'{codes[i, 0]}', *words[i, 1:], f'{codes[i, 1]}'])
+        labels.append(label[:lengths[i]].strip() or f'{codes[i, 0]}')
+    duplicates = np.flatnonzero(rng.random(n) < DUPLICATE_RATE)
+    for i in duplicates:
+        labels[i] = labels[rng.integers(n)]
+    return labels
+
+def identifier_pools(rng, scale):
+    """
+    Draw the identifiers of each ontology. The vocabulary grows with the square root of the scale, and a
+    few identifiers are much more frequent than the rest (e.g., CL_0000034).
+
+    Returns:
+        dict: Ontology -> (identifiers, probability of each identifier).
+    """
+    pools = {}
+    for ontology in ONTOLOGIES:
+        size = int(ID_POOLS[ontology] * np.sqrt(scale))
+        accessions = rng.choice(10**7, size=size, replace=False)
+        weights = 1 / np.arange(1, size + 1) #Zipf-like popularity
+        identifiers = np.char.add(f'{ontology}_', np.char.zfill(accessions.astype(str), 7))
+        pools[ontology] = (identifiers.astype(object), weights / weights.sum())
+    return pools
+
+def make_biosamples(rng, n, pools):
+    """
+    Build the curated mappings (Label, CLO, CL, UBERON, BTO, Type) of n biosamples.
+    """
+    types = rng.choice(list(TYPE_SHARES), size=n, p=list(TYPE_SHARES.values()))
+    df = pd.DataFrame({'Label': make_labels(rng, n)})
+    for ontology in ONTOLOGIES:
+        identifiers, p = pools[ontology]
+        values = identifiers[rng.choice(len(identifiers), size=n, p=p)]
+        dash_rate = pd.Series(types).map({type: rates[ontology] for type, rates in DASH_RATES.items()}).to_numpy()
+        values[rng.random(n) < dash_rate] = '-'
+        df[ontology] = values
+    df['Type'] = types
+    return df
+
+def make_answers(rng, reference, pools):
+    """
+    Build the outputs of a model for the reference mappings: each identifier is the reference one with the
+    AGREEMENT probability of its ontology and otherwise another identifier (or '-'), and a few outputs are
+    not in the list format.
+
+    Returns:
+        pd.DataFrame: Model identifiers (Label, CLO, CL, UBERON, BTO), 'output', the string of the results JSON,
+                      and 'valid', whether the output is in the list format.
+    """
+    n = len(reference)
+    answers = pd.DataFrame({'Label': reference['Label'].to_numpy()})
+    for ontology in ONTOLOGIES:
+        identifiers, p = pools[ontology]
+        values = reference[ontology].to_numpy().copy()
+        wrong = rng.random(n) >= AGREEMENT[ontology]
+        values[wrong] = identifiers[rng.choice(len(identifiers), size=int(wrong.sum()), p=p)]
+        values[wrong & (rng.random(n) < 0.3)] = '-'
+        answers[ontology] = values
+    outputs = ("['" + answers['CLO'] + "', '" + answers['CL'] + "', '" + answers['UBERON'] + "', '" + answers['BTO'] + "']").to_numpy()
+    errors = rng.random(n) < FORMAT_ERROR_RATE
+    outputs[errors] = ("['" + answers['CLO'][errors] + "', '" + answers['CL'][errors] + "']").to_numpy() #incomplete lists
+    answers['output'] = outputs
+    answers['valid'] = ~errors
+    return answers
+
+def make_class_names(rng, pools):
+    """
+    Give each identifier a class name of one to four words ('-' keeps its name).
+
+    Returns:
+        dict: Identifier -> class name.
+    """
+    names = {'-': '-'}
+    for ontology in ONTOLOGIES:
+        identifiers = pools[ontology][0]
+        n_words = rng.integers(1, 5, size=len(identifiers))
+        words = np.array(WORDS)[rng.integers(len(WORDS), size=(len(identifiers), 4))]
+        names.update({identifier: ' '.join(words[i, :n_words[i]]) for i, identifier in enumerate(identifiers)})
+    return names
+
+def _write_json(data, path):
+    """
+    Write a JSON file with the indentation of the results files of the repository.
+    """
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=4)
+
+def generate(scale, directory=None, seed=17):
+    """
+    Generate (once) a synthetic corpus scale times the size of biosamples.tsv, with the files of the
+    workflow laid out as in the repository: biosamples.tsv, finetuning_process/mappings_test.csv,
+    results/results_model.json, results/df_ft_4o_mini_annotation.csv and results/classnames_{type}.json
+    (also written as results/contribution_file_{type}.json). An empty scripts/ folder is the working
+    directory of the scripts opening '../results/...'.
+
+    Parameters:
+        scale (int): Size of the corpus, in copies of biosamples.tsv.
+        directory (str): Folder of the corpus, cache/corpus/x<scale>_<seed> by default.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: 'root' and the path of each file ('biosamples', 'mappings_test', 'results', 'comparison',
+              'classnames_<type>' and 'contribution_<type>').
+    """
+    root = directory or os.path.join(CORPUS_DIR, f'x{scale}_{seed}')
+    paths = {'root': root, 'biosamples': os.path.join(root, 'biosamples.tsv'),
+             'mappings_test': os.path.join(root, 'finetuning_process', 'mappings_test.csv'),
+             'results': os.path.join(root, 'results', 'results_model.json'),
+             'comparison': os.path.join(root, 'results', 'df_ft_4o_mini_annotation.csv')}
+    for type in TYPES:
+        paths[f'classnames_{type}'] = os.path.join(root, 'results', f'classnames_{type}.json')
+        paths[f'contribution_{type}'] = os.path.join(root, 'results', f'contribution_file_{type}.json')
+    manifest_path = os.path.join(root, 'manifest.json')
+    manifest = {'version': VERSION, 'scale': scale, 'seed': seed}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            if json.load(file) == manifest:
+                return paths
+
+    rng = np.random.default_rng([seed, scale])
+    for folder in ['finetuning_process', 'results', 'scripts']:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    pools = identifier_pools(rng, scale)
+    biosamples = make_biosamples(rng, BASE_ROWS * scale, pools)
+    biosamples.to_csv(paths['biosamples'], sep='\t', header=False, index=False)
+    test = biosamples[rng.random(len(biosamples)) < TEST_SIZE]
+    test.to_csv(paths['mappings_test'], header=[str(i) for i in range(6)], index=False)
+
+    test = test.drop_duplicates('Label')
+    answers = make_answers(rng, test, pools)
+    _write_json(dict(zip(answers['Label'], answers['output'])), paths['results'])
+    comparison = test.merge(answers[answers['valid']], on='Label', suffixes=('_C', '_M'))
+    comparison[['Label', 'Type'] + [f'{ontology}_{side}' for ontology in ONTOLOGIES for side in 'CM']].to_csv(paths['comparison'], index=False)
+
+    names = make_class_names(rng, pools)
+    for type in TYPES:
+        rows = comparison[comparison['Type'] == type]
+        columns = [rows[f'{ontology}_{side}'].map(names).to_numpy() for ontology in ONTOLOGIES for side in 'CM']
+        values = np.stack(columns, axis=1)
+        values[rng.random(values.shape) < UNRESOLVED_RATE] = None
+        classnames = dict(zip(rows['Label'], values.tolist()))
+        _write_json(classnames, paths[f'classnames_{type}'])
+        _write_json(classnames, paths[f'contribution_{type}'])
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file)
+    return paths
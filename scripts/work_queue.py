@@ -0,0 +1,456 @@
+import os #interact with the operating system
+import json #use json data
+import hashlib #fingerprint of the rows of a job
+import time
+import socket #name of the host of each worker
+import sqlite3 #durable queue
+import argparse #command line
+import importlib #scripts answering each job
+import threading #lease renewal
+import pandas as pd #dataframe manipulation
+
+import reference_lookup #curated labels answered without the model
+import instrumentation #spans and profiles of the run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) #the queue is found from any working directory
+QUEUE_DIR = os.environ.get('WORK_QUEUE', os.path.join(ROOT, 'cache', 'queue'))
+
+#Annotation jobs: the script whose get_openai_response queries the model, the model (or the variable of the
+#.env file holding it) and the results file the merge writes, as in the main functions of the scripts
+JOBS = {
+    'ft_4o_mini': {'script': 'get_response_ft', 'model_env': 'ft_model_4o_mini', 'output': 'results_ft_4o_mini.json'},
+    'gpt3_5': {'script': 'get_response_modelsOpenAI', 'model': 'gpt-3.5-turbo-0125', 'output': 'results__gpt3_5.json'},
+    'gpt4': {'script': 'get_response_modelsOpenAI', 'model': 'gpt-4-turbo', 'output': 'results__gpt4.json'},
+    'gpt4_o': {'script': 'get_response_modelsOpenAI', 'model': 'gpt-4o', 'output': 'results__gpt4_o.json'},
+}
+
+settings = {
+    'directory': QUEUE_DIR, #folder of the queue database and the result shards, shared by every worker
+    'chunk_size': 25, #labels per chunk
+    'lease': 300, #seconds a worker holds a chunk without renewing its lease
+    'max_attempts': 3, #tries of a chunk before it is marked as failed
+    'retry_delay': 30, #seconds before a failed chunk is tried again, doubled at each attempt
+    'poll': 10, #seconds between checks for chunks to reclaim while other workers hold the rest
+    'journal_mode': 'WAL', #WAL needs every worker on the same host; use 'DELETE' on a network filesystem
+}
+stats = {'chunks': 0, 'labels': 0, 'failures': 0, 'lost_leases': 0}
+_connection = None
+_annotators = {}
+
+def configure(**options):
+    """
+    Change the queue settings.
+
+    Parameters:
+        options: Any of 'directory', 'chunk_size', 'lease', 'max_attempts', 'retry_delay', 'poll' and 'journal_mode'.
+    """
+    global _connection
+    unknown = set(options) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown queue settings: {sorted(unknown)}")
+    settings.update(options)
+    _connection = None
+
+def worker_name():
+    """
+    Name of this worker, unique across hosts (host and process ID).
+    """
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+def _columns(connection, table):
+    """
+    Names of the columns of a table.
+    """
+    return {row[1] for row in connection.execute(f'PRAGMA table_info({table})')}
+
+def _connect():
+    """
+    Open a connection to the queue, creating it if needed. Transactions are explicit, so claiming a chunk
+    (BEGIN IMMEDIATE) is atomic across processes.
+    """
+    os.makedirs(settings['directory'], exist_ok=True)
+    connection = sqlite3.connect(os.path.join(settings['directory'], 'queue.sqlite'), timeout=60, isolation_level=None)
+    connection.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+    connection.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        name TEXT PRIMARY KEY,
+        script TEXT NOT NULL,
+        model TEXT NOT NULL,
+        output TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        fingerprint TEXT,
+        lookup TEXT)''')
+    if not {'fingerprint', 'lookup'} <= _columns(connection, 'jobs'): #queue created before these columns
+        connection.execute('BEGIN IMMEDIATE') #workers starting together: only one adds them
+        try:
+            for column in sorted({'fingerprint', 'lookup'} - _columns(connection, 'jobs')):
+                connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} TEXT')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+    connection.execute('''CREATE TABLE IF NOT EXISTS chunks (
+        id INTEGER PRIMARY KEY,
+        job TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        rows TEXT NOT NULL,
+        status TEXT NOT NULL,
+        worker TEXT,
+        available_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT)''')
+    connection.execute('CREATE INDEX IF NOT EXISTS chunks_status ON chunks (status, available_at)')
+    return connection
+
+def get_connection():
+    """
+    Open (once) the queue of this process.
+    """
+    global _connection
+    if _connection is None:
+        _connection = _connect()
+    return _connection
+
+def fingerprint(chunks, index):
+    """
+    SHA-256 of the chunks of a job and of its lookup index, so a job is not queued again with other labels.
+    """
+    digest = hashlib.sha256()
+    for _, _, rows in chunks:
+        digest.update(rows.encode())
+    digest.update(json.dumps(index, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def enqueue(job, script, model, df, output, index=None):
+    """
+    Add a job to the queue, split into chunks of settings['chunk_size'] rows, with the lookup index its workers
+    use. A job already in the queue with the same rows and index is left as it is, so every worker can run the
+    same command; with other rows (e.g., the test partition changed) it raises an error.
+
+    Parameters:
+        job (str): Name of the job (e.g., 'ft_4o_mini').
+        script (str): Module whose get_openai_response(df, model) queries the model (e.g., 'get_response_ft').
+        model (str): Model to which the consultation is to be made.
+        df (DataFrame): Labels to be mapped (Label, CLO, CL, UBERON, BTO, Type), e.g. creation_ft.mappings_test.
+        output (str): Name of the results file written by merge.
+        index (dict): Lookup index (reference_lookup.build_index), None if the lookup is off.
+
+    Returns:
+        int: Number of chunks added.
+    """
+    rows = df.astype(object).where(df.notna(), None)
+    chunks = []
+    for position, start in enumerate(range(0, len(rows), settings['chunk_size'])):
+        part = rows.iloc[start:start + settings['chunk_size']]
+        chunks.append((job, position, json.dumps({'index': part.index.tolist(), 'rows': part.values.tolist()})))
+    digest = fingerprint(chunks, index)
+    connection = get_connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        queued = connection.execute('SELECT fingerprint FROM jobs WHERE name = ?', (job,)).fetchone()
+        if queued is None:
+            connection.execute('INSERT INTO jobs (name, script, model, output, created_at, fingerprint, lookup) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (job, script, model, output, time.time(), digest, None if index is None else json.dumps(index)))
+            connection.executemany("INSERT INTO chunks (job, position, rows, status, available_at) VALUES (?, ?, ?, 'pending', 0)",
+                                   chunks)
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    if queued is not None:
+        if queued[0] != digest:
+            raise ValueError(f"{job} is already queued with other labels or lookup index; merge it and remove "
+                             f"the queue ({settings['directory']}), or use another one")
+        return 0
+    return len(chunks)
+
+def claim(worker):
+    """
+    Lease the next available chunk: a pending chunk, or one whose lease expired because its worker crashed
+    or stopped renewing it. Expired chunks without attempts left are marked as failed.
+
+    Parameters:
+        worker (str): Name of the worker.
+
+    Returns:
+        tuple: (chunk ID, job, DataFrame of the chunk), or None if no chunk is available now.
+    """
+    connection = get_connection()
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        connection.execute("UPDATE chunks SET status = 'failed', error = COALESCE(error, 'lease expired') "
+                           "WHERE status = 'leased' AND available_at <= ? AND attempts >= ?", (now, settings['max_attempts']))
+        row = connection.execute("SELECT id, job, rows FROM chunks WHERE status IN ('pending', 'leased') AND available_at <= ? "
+                                 "ORDER BY id LIMIT 1", (now,)).fetchone()
+        if row is not None:
+            connection.execute("UPDATE chunks SET status = 'leased', worker = ?, available_at = ?, attempts = attempts + 1 "
+                               "WHERE id = ?", (worker, now + settings['lease'], row[0]))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    if row is None:
+        return None
+    chunk = json.loads(row[2])
+    return row[0], row[1], pd.DataFrame(chunk['rows'], index=chunk['index'])
+
+def renew(chunk_id, worker):
+    """
+    Extend the lease of a chunk held by a worker.
+
+    Returns:
+        bool: False if the lease was lost (it expired and another worker took the chunk).
+    """
+    connection = _connect() #own connection, as the renewal runs in another thread
+    try:
+        cursor = connection.execute("UPDATE chunks SET available_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                                    (time.time() + settings['lease'], chunk_id, worker))
+        return cursor.rowcount == 1
+    finally:
+        connection.close()
+
+def _keep_leased(chunk_id, worker, stop, lost):
+    """
+    Renew the lease of a chunk every third of the lease time until the chunk is finished.
+    """
+    while not stop.wait(settings['lease'] / 3):
+        if not renew(chunk_id, worker):
+            lost.set()
+            return
+
+def finish(chunk_id, worker, error=None):
+    """
+    Mark a leased chunk as done, or release it after an error: it is tried again after the retry delay,
+    or marked as failed once it ran out of attempts. Chunks whose lease was lost are left to their new worker.
+
+    Parameters:
+        chunk_id (int): ID of the chunk.
+        worker (str): Name of the worker.
+        error (str): Error of the attempt, None if it succeeded.
+    """
+    connection = get_connection()
+    if error is None:
+        connection.execute("UPDATE chunks SET status = 'done', error = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                           (chunk_id, worker))
+    else:
+        connection.execute("UPDATE chunks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                           "available_at = ? * (1 << (attempts - 1)) + ?, error = ? "
+                           "WHERE id = ? AND worker = ? AND status = 'leased'",
+                           (settings['max_attempts'], settings['retry_delay'], time.time(), error, chunk_id, worker))
+
+def shard_path(job, worker):
+    """
+    Path of the result shard of a worker for a job.
+    """
+    return os.path.join(settings['directory'], 'shards', job, f'{worker}.jsonl')
+
+def write_shard(job, worker, chunk_id, results, lookup=()):
+    """
+    Append the results of a chunk to the shard of the worker, as one JSON line synced to disk before the
+    chunk is marked as done. Only the worker writes to its shard.
+
+    Parameters:
+        results (dict): Label -> output of the chunk.
+        lookup (iterable): Labels of the chunk answered by the lookup instead of the model.
+    """
+    path = shard_path(job, worker)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as file:
+        file.write(json.dumps({'chunk': chunk_id, 'results': results, 'lookup': sorted(lookup)}) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+def _annotator(job):
+    """
+    Function (df) -> ({label: output}, labels answered by the lookup) answering the chunks of a job, as the
+    main function of its script does: curated training labels from the lookup index queued with the job, the
+    rest from the model. Only get_openai_response is taken from the script, which does not split the corpus
+    when imported.
+    """
+    if job not in _annotators:
+        script, model, lookup = get_connection().execute('SELECT script, model, lookup FROM jobs WHERE name = ?', (job,)).fetchone()
+        get_openai_response = importlib.import_module(script).get_openai_response
+        index = None if lookup is None else json.loads(lookup)
+        def annotate(df):
+            reference_lookup.answered.pop(model, None) #labels of this chunk only
+            results = reference_lookup.get_responses(df, model, get_openai_response, index)
+            return results, reference_lookup.answered.get(model, set())
+        _annotators[job] = annotate
+    return _annotators[job]
+
+def remaining():
+    """
+    Number of chunks not finished yet (pending or leased).
+    """
+    return get_connection().execute("SELECT COUNT(*) FROM chunks WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+def work(worker=None, max_chunks=None):
+    """
+    Annotate chunks until the queue is finished: claim a chunk, renew its lease while the model answers it,
+    write its results to the shard of the worker and mark it as done. When the other chunks are all leased,
+    wait for them, so the chunks of crashed workers are reclaimed when their leases expire.
+
+    Parameters:
+        worker (str): Name of the worker, worker_name() by default.
+        max_chunks (int): Stop after this many chunks, no limit by default.
+
+    Returns:
+        int: Number of chunks annotated by this worker.
+    """
+    worker = worker or worker_name()
+    done = 0
+    while max_chunks is None or done < max_chunks:
+        claimed = claim(worker)
+        if claimed is None:
+            if remaining() == 0:
+                break
+            time.sleep(settings['poll'])
+            continue
+        chunk_id, job, df = claimed
+        stop, lost = threading.Event(), threading.Event()
+        renewal = threading.Thread(target=_keep_leased, args=(chunk_id, worker, stop, lost), daemon=True)
+        renewal.start()
+        try:
+            with instrumentation.span('queue chunk'):
+                results, lookup = _annotator(job)(df)
+            write_shard(job, worker, chunk_id, results, lookup)
+        except Exception as error:
+            stop.set()
+            renewal.join()
+            stats['failures'] += 1
+            print(f"Chunk {chunk_id} of {job} failed: {error!r}")
+            finish(chunk_id, worker, repr(error))
+            continue
+        stop.set()
+        renewal.join()
+        if lost.is_set():
+            stats['lost_leases'] += 1
+        finish(chunk_id, worker)
+        stats['chunks'] += 1
+        stats['labels'] += len(df)
+        done += 1
+    return done
+
+def status():
+    """
+    Number of chunks of each job by status.
+
+    Returns:
+        DataFrame: One row per job, one column per status.
+    """
+    rows = get_connection().execute('SELECT job, status, COUNT(*) FROM chunks GROUP BY job, status').fetchall()
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows, columns=['job', 'status', 'chunks']).pivot(index='job', columns='status', values='chunks').fillna(0).astype(int)
+
+def retry_failed(jobs=None):
+    """
+    Give the failed chunks of some jobs (all by default) their attempts back.
+
+    Returns:
+        int: Number of chunks queued again.
+    """
+    connection = get_connection()
+    query = "UPDATE chunks SET status = 'pending', attempts = 0, available_at = 0 WHERE status = 'failed'"
+    if jobs:
+        query += f" AND job IN ({','.join('?' * len(jobs))})"
+    return connection.execute(query, list(jobs or [])).rowcount
+
+def merge(job, output_dir='.', partial=False):
+    """
+    Combine the shards of a job into the results JSON of its script, in the order of the labels, and the
+    labels answered by the lookup into its lookup_ file (reference_lookup.save_sources). A chunk answered twice
+    (its lease expired while its first worker was still running) is taken once.
+
+    Parameters:
+        job (str): Name of the job.
+        output_dir (str): Folder of the results file.
+        partial (bool): Write the results even if some chunks are not done.
+
+    Returns:
+        str: Path of the results file.
+    """
+    connection = get_connection()
+    output, model = connection.execute('SELECT output, model FROM jobs WHERE name = ?', (job,)).fetchone()
+    chunks = connection.execute('SELECT id, status FROM chunks WHERE job = ? ORDER BY position', (job,)).fetchall()
+    answered = {}
+    directory = os.path.dirname(shard_path(job, 'worker'))
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        with open(os.path.join(directory, name), 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError: #last line of a worker that crashed while writing it
+                    continue
+                answered.setdefault(record['chunk'], record)
+    missing = [chunk_id for chunk_id, _ in chunks if chunk_id not in answered]
+    if missing and not partial:
+        raise ValueError(f"{len(missing)} of {len(chunks)} chunks of {job} have no results yet (statuses: "
+                         f"{sorted({status for chunk_id, status in chunks if chunk_id in missing})})")
+    results, lookup = {}, set()
+    for chunk_id, _ in chunks:
+        record = answered.get(chunk_id, {})
+        results.update(record.get('results', {}))
+        lookup.update(record.get('lookup', []))
+    path = os.path.join(output_dir, output)
+    with open(path, 'w') as json_file:
+        json.dump(results, json_file, indent=4)
+    reference_lookup.save_sources(path, model, lookup)
+    return path
+
+def report():
+    """
+    Print the statistics of this worker.
+    """
+    print("Chunks annotated:", stats['chunks'], " labels:", stats['labels'], " failed attempts:", stats['failures'],
+          " leases lost:", stats['lost_leases'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate the labels with any number of workers sharing a durable queue.")
+    parser.add_argument('command', choices=['enqueue', 'work', 'status', 'merge', 'retry'],
+                        help="enqueue the jobs, work on the queue, show its status, merge the shards or retry failed chunks")
+    parser.add_argument('jobs', nargs='*', help=f"jobs among {', '.join(JOBS)} (default: all)")
+    parser.add_argument('--queue', default=settings['directory'], help="folder of the queue, shared by the workers (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=settings['chunk_size'], help="labels per chunk")
+    parser.add_argument('--lease', type=float, default=settings['lease'], help="seconds before the chunk of a silent worker is reclaimed")
+    parser.add_argument('--max-attempts', type=int, default=settings['max_attempts'], help="tries of a chunk")
+    parser.add_argument('--journal-mode', default=settings['journal_mode'], choices=['WAL', 'DELETE'],
+                        help="SQLite journal: WAL on one host, DELETE when the workers run on several hosts")
+    parser.add_argument('--max-chunks', type=int, default=None, help="chunks annotated by this worker before it stops")
+    parser.add_argument('--output-dir', default='.', help="folder of the merged results files")
+    parser.add_argument('--partial', action='store_true', help="merge even if some chunks are not done")
+    args = parser.parse_args()
+    unknown = set(args.jobs) - set(JOBS)
+    if unknown:
+        parser.error(f"unknown jobs: {sorted(unknown)}")
+    configure(directory=args.queue, chunk_size=args.chunk_size, lease=args.lease, max_attempts=args.max_attempts,
+              journal_mode=args.journal_mode)
+    jobs = args.jobs or list(JOBS)
+
+    if args.command == 'enqueue':
+        import creation_ft #test partition (and training partitions of the lookup) split once, here
+        index = None
+        if reference_lookup.settings['enabled']:
+            index = reference_lookup.build_index(creation_ft.mappings_ft, test=creation_ft.mappings_test) #training labels only
+        for job in jobs:
+            module = importlib.import_module(JOBS[job]['script'])
+            model = JOBS[job]['model'] if 'model' in JOBS[job] else module.load_environment(JOBS[job]['model_env'])
+            added = enqueue(job, JOBS[job]['script'], model, creation_ft.mappings_test, JOBS[job]['output'], index)
+            print(f"{job}: {added} chunks queued" if added else f"{job}: already queued")
+    elif args.command == 'work':
+        work(max_chunks=args.max_chunks)
+        report()
+        reference_lookup.report()
+    elif args.command == 'status':
+        print(status().to_string())
+    elif args.command == 'merge':
+        queued = {row[0] for row in get_connection().execute('SELECT name FROM jobs')}
+        for job in [job for job in jobs if job in queued]:
+            print("Results written to", merge(job, args.output_dir, args.partial))
+    else:
+        print("Chunks queued again:", retry_failed(args.jobs))
+
+if __name__ == "__main__":
+    with instrumentation.stage('work_queue'):
+        main()
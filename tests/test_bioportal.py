@@ -0,0 +1,108 @@
+import os #interact with the operating system
+import sys
+import json #use json data
+import time
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler #local stand-in for BioPortal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import bioportal
+
+CLASSES = {'CL:0000034': 'stem cell', 'CL:0000057': 'fibroblast', 'UBERON:0002048': 'lung'}
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answer the class requests of the client like BioPortal, recording each request and the client port
+    (one port per connection, so keep-alive reuse can be checked).
+    """
+    protocol_version = 'HTTP/1.1' #keep-alive connections
+    requests_seen = []
+    failures = {} #class_id -> statuses returned before the class is served
+    batch_answers = 1 #classes answered by each /batch request
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.requests_seen.append(('GET', self.path, self.client_address[1], time.monotonic()))
+        class_id = self.path.split('/classes/')[-1]
+        if self.failures.get(class_id):
+            self._send(self.failures[class_id].pop(0), {'error': 'try again'})
+        elif class_id in CLASSES:
+            self._send(200, {'@id': class_id, 'prefLabel': CLASSES[class_id]})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        self.requests_seen.append(('POST', self.path, self.client_address[1], time.monotonic()))
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        collection = payload[bioportal.OWL_CLASS]['collection']
+        classes = [{'@id': item['class'], 'prefLabel': CLASSES.get(item['class'][len(bioportal.OBO_PURL):].replace('_', ':'))}
+                   for item in collection[:self.batch_answers]] #partial response: only the first classes
+        self._send(200, {bioportal.OWL_CLASS: classes})
+
+    def log_message(self, format, *args):
+        pass
+
+class BioPortalClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StandInHandler.requests_seen.clear()
+        StandInHandler.failures.clear()
+        bioportal.configure(base_url=f'http://127.0.0.1:{self.server.server_port}', dotenv_path=os.devnull,
+                            max_workers=4, requests_per_second=1000, batch=False)
+
+    def test_keep_alive_reuses_the_connection(self):
+        for _ in range(5):
+            self.assertEqual(bioportal.get_class_name('CL', 'CL:0000034'), 'stem cell')
+        ports = {port for _, _, port, _ in StandInHandler.requests_seen}
+        self.assertEqual(len(StandInHandler.requests_seen), 5)
+        self.assertEqual(len(ports), 1)
+
+    def test_retries_on_429_and_5xx(self):
+        StandInHandler.failures['CL:0000057'] = [429, 503]
+        self.assertEqual(bioportal.get_class_name('CL', 'CL:0000057'), 'fibroblast')
+        self.assertEqual(len(StandInHandler.requests_seen), 3)
+
+    def test_missing_class_is_none(self):
+        self.assertIsNone(bioportal.get_class_name('CL', 'CL:9999999'))
+
+    def test_rate_limit_is_shared_by_the_workers(self):
+        bioportal.configure(requests_per_second=20)
+        lookups = [('CL', 'CL:0000034')] * 10
+        start = time.monotonic()
+        names = bioportal.get_class_names(lookups)
+        elapsed = time.monotonic() - start
+        self.assertEqual(names, ['stem cell'] * 10)
+        self.assertGreaterEqual(elapsed, 9 / 20 - 0.01) #ten requests, 1/20 s apart
+        times = sorted(moment for _, _, _, moment in StandInHandler.requests_seen)
+        self.assertGreaterEqual(times[-1] - times[0], 9 / 20 - 0.05)
+
+    def test_batch_falls_back_to_single_lookups(self):
+        bioportal.configure(batch=True)
+        lookups = [('CL', 'CL:0000034'), ('CL', 'CL:0000057'), ('UBERON', 'UBERON:0002048'), ('CL', 'CL:0000034')]
+        names = bioportal.get_class_names(lookups)
+        self.assertEqual(names, ['stem cell', 'fibroblast', 'lung', 'stem cell'])
+        posts = [path for method, path, _, _ in StandInHandler.requests_seen if method == 'POST']
+        gets = sorted(path for method, path, _, _ in StandInHandler.requests_seen if method == 'GET')
+        self.assertEqual(posts, ['/batch', '/batch']) #one request per ontology
+        self.assertEqual(gets, ['/ontologies/CL/classes/CL:0000057']) #the only class missing from the responses
+
+if __name__ == '__main__':
+    unittest.main()
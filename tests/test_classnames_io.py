@@ -0,0 +1,72 @@
+import os #interact with the operating system
+import sys
+import json #use json data
+import tempfile
+import unittest
+import importlib.util #optional dependencies
+import pandas as pd #dataframe manipulation
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+import classnames_io
+from classnames_io import load_classnames
+
+def data_process_reference(filename):
+    """
+    JSON to DataFrame loader of pattern_analysis, llm_contributions and match_analysis before load_classnames.
+    """
+    with open(filename, 'r') as archive:
+        dict_classes = json.load(archive)
+    df = pd.DataFrame.from_dict(dict_classes, orient='index')
+    new_row = pd.DataFrame([df.columns], columns=df.columns)
+    df_process = pd.concat([new_row, df], ignore_index=True)
+    df_process.columns = ['CLO_C','CLO_M', 'CL_C','CL_M', 'UBERON_C','UBERON_M','BTO_C','BTO_M']
+    df_process = df_process.drop(0)
+    keys=[]
+    for key in dict_classes.keys():
+        keys.append(key)
+    df_process['Label'] = keys #add label column
+    df_process.fillna("", inplace=True) #replace 'Nonetype' values
+    return df_process
+
+class LoadClassnamesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, dict_classes):
+        path = os.path.join(self.directory.name, 'classnames_CL.json')
+        with open(path, 'w') as archive_json:
+            json.dump(dict_classes, archive_json)
+        return path
+
+    def assert_matches_reference(self, path, cache=False):
+        pd.testing.assert_frame_equal(load_classnames(path, cache=cache), data_process_reference(path), check_dtype=False)
+
+    def test_missing_names(self):
+        path = self.write({'Loucy': ['Loucy cell', None, 'T cell', 'B cell', 'blood', 'blood', '-', '-'],
+                           'HeLa': [None] * 8,
+                           'stem cell_2': ['-', '-', 'stem cell', 'stem cell', '-', '-', '-', '-']})
+        self.assert_matches_reference(path)
+
+    def test_short_rows_are_padded(self):
+        path = self.write({'Loucy': ['Loucy cell', 'L1296 cell', 'T cell', 'B cell', 'blood', 'blood', '-', '-'],
+                           'HeLa': ['HeLa cell', '-', 'epithelial cell']})
+        self.assert_matches_reference(path)
+
+    @unittest.skipUnless(os.path.exists(os.path.join(ROOT, 'results', 'classnames_CL.json')), "no class names file")
+    def test_results_file(self):
+        self.assert_matches_reference(os.path.join(ROOT, 'results', 'classnames_CL.json'))
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, "pyarrow is not installed")
+    def test_parquet_cache(self):
+        path = self.write({'Loucy': ['Loucy cell', None, 'T cell', 'B cell', 'blood', 'blood', '-', '-']})
+        parquet_dir = classnames_io.PARQUET_DIR
+        classnames_io.PARQUET_DIR = os.path.join(self.directory.name, 'classnames')
+        self.addCleanup(setattr, classnames_io, 'PARQUET_DIR', parquet_dir)
+        self.assert_matches_reference(path, cache=True) #written
+        self.assert_matches_reference(path, cache=True) #read back
+
+if __name__ == '__main__':
+    unittest.main()
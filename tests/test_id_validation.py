@@ -0,0 +1,49 @@
+import os #interact with the operating system
+import sys
+import tempfile
+import unittest
+import pandas as pd #dataframe manipulation
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import label_index
+import id_validation
+
+BTO_OBO = '''format-version: 1.2
+
+[Term]
+id: BTO:0000298
+name: colon
+
+[Term]
+id: BTO:0000007
+name: HeLa cell
+'''
+
+class ValidateIdsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, 'bto.obo'), 'w') as file:
+            file.write(BTO_OBO)
+        index_dir = os.path.join(directory.name, 'index')
+        for cache in (label_index._indexes, id_validation._valid_keys):
+            cache.pop('BTO', None)
+            self.addCleanup(cache.pop, 'BTO', None)
+        label_index.build_index('BTO', directory.name, index_dir)
+        label_index.load_index('BTO', index_dir) #kept for valid_keys
+
+    def test_statuses(self):
+        status = id_validation.validate_ids(['BTO_0000298', 'BTO:0000007', 'BTO_0000299', 'BTO_000298', '-', 'unknown',
+                                             'colon', 'CL_0000034'], ontology='BTO')
+        self.assertEqual(status.tolist(), ['valid', 'valid', 'unknown', 'unknown', 'empty', 'empty', 'malformed', 'malformed'])
+
+    def test_accessions_longer_than_a_key(self):
+        #20 digits used to overflow the int64 key, 16 to 19 wrapped into other keys
+        status = id_validation.validate_ids(['BTO:12345678901234567890', 'BTO_1234567890123456', 'BTO_0000298'], ontology='BTO')
+        self.assertEqual(status.tolist(), ['unknown', 'unknown', 'valid'])
+        rates = id_validation.hallucination_rates(pd.DataFrame({'BTO_M': ['BTO:12345678901234567890', 'BTO_0000298']}), ['BTO'])
+        self.assertEqual(rates, {'BTO': 0.5})
+
+if __name__ == '__main__':
+    unittest.main()
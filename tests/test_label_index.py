@@ -0,0 +1,50 @@
+import os #interact with the operating system
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import label_index
+
+BTO_OBO = '''format-version: 1.2
+
+[Term]
+id: BTO:0000298
+name: colon
+synonym: "large intestine" EXACT []
+
+[Term]
+id: BTO:0000007
+name: HeLa cell
+
+[Term]
+id: BTO:12345678901234567890
+name: accession too long for a key
+'''
+
+class LabelIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, 'bto.obo'), 'w') as file:
+            file.write(BTO_OBO)
+        index_dir = os.path.join(directory.name, 'index')
+        label_index._indexes.pop('BTO', None)
+        self.addCleanup(label_index._indexes.pop, 'BTO', None)
+        label_index.build_index('BTO', directory.name, index_dir)
+        label_index.load_index('BTO', index_dir) #kept for the lookups below
+
+    def test_lookups(self):
+        self.assertEqual(label_index.get_class_names([('BTO', 'BTO:0000298'), ('BTO', 'BTO_0000007'), ('BTO', 'BTO:0000299')]),
+                         ['colon', 'HeLa cell', None])
+        self.assertEqual(label_index.get_synonyms('BTO', 'BTO_0000298'), ['large intestine'])
+
+    def test_accessions_longer_than_a_key(self):
+        for class_id in ['BTO:12345678901234567890', 'BTO_1234567890123456']: #20 and 16 digits
+            self.assertIsNone(label_index.get_class_name('BTO', class_id))
+            self.assertIsNone(label_index.get_synonyms('BTO', class_id))
+        self.assertEqual(sorted(label for _, label, _ in label_index.classes('BTO')), ['HeLa cell', 'colon'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os #interact with the operating system
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import ontology_hierarchy
+
+def terms(parents):
+    """
+    Terms as returned by ontology_files.iter_terms for a graph given as the parents of each node (CL:0000000, ...).
+    """
+    return [{'id': f'CL:{node:07d}', 'is_a': [f'CL:{parent:07d}' for parent in node_parents], 'obsolete': False}
+            for node, node_parents in enumerate(parents)]
+
+def ancestors(closure, node):
+    """
+    Ancestors of a node (itself included) and their distances, as {node: distance}.
+    """
+    start, end = closure['indptr'][node], closure['indptr'][node + 1]
+    return dict(zip(closure['indices'][start:end].tolist(), closure['dists'][start:end].tolist()))
+
+class BuildClosureTest(unittest.TestCase):
+
+    def test_diamond(self):
+        closure = ontology_hierarchy.build_closure(terms([[1, 2], [3], [1], []]))
+        self.assertEqual(ancestors(closure, 0), {0: 0, 1: 1, 2: 1, 3: 2})
+        self.assertEqual(ancestors(closure, 1), {1: 0, 3: 1})
+        self.assertEqual(ancestors(closure, 2), {2: 0, 1: 1, 3: 2})
+        self.assertEqual(ancestors(closure, 3), {3: 0})
+
+    def test_shortest_distance_through_shared_parent(self):
+        #0 -> 1 -> 2 -> 3 and 0 -> 3 -> 4, with 3 reached first through the long branch
+        closure = ontology_hierarchy.build_closure(terms([[3, 1], [2], [3], [4], []]))
+        self.assertEqual(ancestors(closure, 0), {0: 0, 1: 1, 2: 2, 3: 1, 4: 2})
+
+    def test_cycle_is_cut(self):
+        #1 and 2 are parents of each other; 3 is the root above the cycle
+        closure = ontology_hierarchy.build_closure(terms([[1], [2], [1, 3], []]))
+        for node in range(3):
+            self.assertIn(3, ancestors(closure, node))
+        self.assertEqual(ancestors(closure, 0)[1], 1)
+        self.assertEqual(ancestors(closure, 3), {3: 0})
+
+if __name__ == '__main__':
+    unittest.main()
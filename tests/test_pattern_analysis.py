@@ -0,0 +1,46 @@
+import os #interact with the operating system
+import sys
+import random #random pairs
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from pattern_analysis import search_common_substrings, search_common_substrings_batch
+
+WORDS = ['cell', 'epithelial', 'of', 'the', 'colon', 'stem', 'muscle', 'lymphoblast', 'derived', 'tissue']
+
+def search_common_substrings_reference(string1, string2):
+    """
+    Brute force longest common substring, the implementation the suffix automaton replaced.
+    """
+    length = min(len(string1), len(string2))
+    for i in range(length, 0, -1):
+        for j in range(len(string1) - i + 1):
+            if string1[j:j+i] in string2:
+                return string1[j:j+i]
+    return ""
+
+class CommonSubstringTest(unittest.TestCase):
+
+    def assert_matches_reference(self, pairs):
+        for (string1, string2), pattern in zip(pairs, search_common_substrings_batch(pairs)):
+            expected = search_common_substrings_reference(string1, string2)
+            self.assertEqual(pattern, expected, (string1, string2))
+            self.assertEqual(search_common_substrings(string1, string2), expected, (string1, string2))
+
+    def test_edge_cases(self):
+        self.assert_matches_reference([('', ''), ('', 'stem cell'), ('stem cell', ''), ('stem cell', 'stem cell'),
+                                       ('abc', 'xyz'), ('a', 'a'), ('aaaa', 'aa'), ('abab', 'baba'),
+                                       ('lung fibroblast', 'fibroblast of lung')])
+
+    def test_random_class_names(self):
+        rng = random.Random(17)
+        name = lambda: ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 8)))
+        self.assert_matches_reference([(name(), name()) for _ in range(2000)])
+
+    def test_random_strings_with_ties(self):
+        rng = random.Random(17)
+        string = lambda: ''.join(rng.choice('ab c') for _ in range(rng.randint(0, 20))) #small alphabet, many ties
+        self.assert_matches_reference([(string(), string()) for _ in range(2000)])
+
+if __name__ == '__main__':
+    unittest.main()
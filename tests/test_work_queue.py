@@ -0,0 +1,150 @@
+import os #interact with the operating system
+import sys
+import json #use json data
+import time
+import types
+import sqlite3
+import tempfile
+import threading
+import unittest
+import pandas as pd #dataframe manipulation
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import work_queue
+
+LABELS = [f'label {i}' for i in range(7)]
+
+def get_openai_response(df, model):
+    """
+    Stand-in for the get_openai_response of the scripts: answers each label with the model and the label,
+    and fails for the labels in stub.failing.
+    """
+    df.columns = ['Label', 'CLO', 'CL', 'UBERON', 'BTO', 'Type']
+    failing = set(df['Label']) & stub.failing
+    if failing:
+        raise RuntimeError(f'rate limited: {sorted(failing)}')
+    return {label: f"['{model}', '{label}']" for label in df['Label']}
+
+stub = types.ModuleType('stub_annotator') #script of the test jobs, imported by the workers
+stub.get_openai_response = get_openai_response
+stub.failing = set()
+sys.modules['stub_annotator'] = stub
+
+def expected(labels=LABELS):
+    return {label: f"['m1', '{label}']" for label in labels}
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        defaults = dict(work_queue.settings)
+        self.addCleanup(work_queue.configure, **defaults)
+        work_queue.configure(directory=os.path.join(self.directory, 'queue'), chunk_size=3, lease=0.3, max_attempts=3,
+                             retry_delay=0, poll=0.05)
+        work_queue._annotators.clear()
+        stub.failing = set()
+        self.df = pd.DataFrame([[label, '-', '-', '-', '-', 'CL'] for label in LABELS])
+        self.assertEqual(work_queue.enqueue('job', 'stub_annotator', 'm1', self.df, 'results_job.json'), 3)
+        self.addCleanup(lambda: work_queue.get_connection().close())
+
+    def chunks(self):
+        return work_queue.get_connection().execute('SELECT id, status, worker, attempts FROM chunks ORDER BY position').fetchall()
+
+    def merged(self):
+        with open(work_queue.merge('job', self.directory), 'r') as json_file:
+            return json.load(json_file)
+
+    def test_enqueue_again(self):
+        self.assertEqual(work_queue.enqueue('job', 'stub_annotator', 'm1', self.df, 'results_job.json'), 0)
+        with self.assertRaises(ValueError):
+            work_queue.enqueue('job', 'stub_annotator', 'm1', self.df.iloc[1:], 'results_job.json')
+
+    def test_expired_lease_is_reclaimed(self):
+        chunk_id, job, df = work_queue.claim('crashed') #never finished
+        self.assertEqual(df.iloc[:, 0].tolist(), LABELS[:3])
+        self.assertEqual(work_queue.work('survivor'), 3) #waits for the lease to expire, then takes the chunk
+        self.assertEqual([(status, worker) for _, status, worker, _ in self.chunks()], [('done', 'survivor')] * 3)
+        self.assertEqual(self.chunks()[0][3], 2)
+        self.assertEqual(self.merged(), expected())
+
+    def test_finish_after_lost_lease(self):
+        chunk_id, _, _ = work_queue.claim('slow')
+        time.sleep(0.35)
+        self.assertEqual(work_queue.claim('fast')[0], chunk_id)
+        self.assertFalse(work_queue.renew(chunk_id, 'slow'))
+        work_queue.finish(chunk_id, 'slow')
+        work_queue.finish(chunk_id, 'slow', 'late error')
+        self.assertEqual(self.chunks()[0][1:3], ('leased', 'fast'))
+        work_queue.finish(chunk_id, 'fast')
+        self.assertEqual(self.chunks()[0][1:3], ('done', 'fast'))
+
+    def test_failed_chunks_and_retry(self):
+        stub.failing = {LABELS[4]}
+        self.assertEqual(work_queue.work('worker'), 2)
+        self.assertEqual([(status, attempts) for _, status, _, attempts in self.chunks()], [('done', 1), ('failed', 3), ('done', 1)])
+        self.assertIn('rate limited', work_queue.get_connection().execute("SELECT error FROM chunks WHERE status = 'failed'").fetchone()[0])
+        with self.assertRaises(ValueError):
+            self.merged()
+        self.assertEqual(work_queue.retry_failed(['other']), 0)
+        self.assertEqual(work_queue.retry_failed(['job']), 1)
+        stub.failing = set()
+        self.assertEqual(work_queue.work('worker'), 1)
+        self.assertEqual(self.merged(), expected())
+
+    def test_expired_lease_without_attempts_left(self):
+        work_queue.configure(max_attempts=1)
+        chunk_id, _, _ = work_queue.claim('crashed')
+        time.sleep(0.35)
+        self.assertNotEqual(work_queue.claim('other')[0], chunk_id)
+        self.assertEqual(self.chunks()[0][1], 'failed')
+
+    def test_merge_takes_a_chunk_answered_twice_once(self):
+        self.assertEqual(work_queue.work('worker'), 3)
+        first = self.chunks()[1][0]
+        work_queue.write_shard('job', 'zz-late', first, {LABELS[3]: 'late answer', 'extra': 'late answer'})
+        with open(work_queue.shard_path('job', 'zz-late'), 'a') as file:
+            file.write('{"chunk": ') #crashed while writing
+        merged = self.merged()
+        self.assertEqual(merged, expected())
+        self.assertEqual(list(merged), LABELS)
+
+    def test_merge_partial(self):
+        work_queue.work('worker', max_chunks=1)
+        with self.assertRaises(ValueError):
+            self.merged()
+        with open(work_queue.merge('job', self.directory, partial=True), 'r') as json_file:
+            self.assertEqual(json.load(json_file), expected(LABELS[:3]))
+
+class MigrationTest(unittest.TestCase):
+
+    def test_workers_starting_together_on_an_old_queue(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        defaults = dict(work_queue.settings)
+        self.addCleanup(work_queue.configure, **defaults)
+        work_queue.configure(directory=directory.name)
+        connection = sqlite3.connect(os.path.join(directory.name, 'queue.sqlite'))
+        connection.execute('CREATE TABLE jobs (name TEXT PRIMARY KEY, script TEXT NOT NULL, model TEXT NOT NULL, '
+                           'output TEXT NOT NULL, created_at REAL NOT NULL)') #before the fingerprint and lookup columns
+        connection.commit()
+        connection.close()
+        errors = []
+        def start():
+            try:
+                work_queue._connect().close()
+            except Exception as error:
+                errors.append(error)
+        workers = [threading.Thread(target=start) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        connection = work_queue._connect()
+        self.assertLessEqual({'fingerprint', 'lookup'}, work_queue._columns(connection, 'jobs'))
+        connection.close()
+
+if __name__ == '__main__':
+    unittest.main()